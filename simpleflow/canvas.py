@@ -154,14 +154,14 @@ class GroupFuture(futures.Future):
         self.max_parallel = max_parallel
         self.bubbles_exception_on_failure = bubbles_exception_on_failure
 
+        # Counted as we go: recounting at each submission would be quadratic
+        count_pending_or_running = 0
         for a in self.activities:
-            if (
-                not self.max_parallel
-                or self._count_pending_or_running < self.max_parallel
-            ):
-                future = workflow.submit(a)
-                self.futures.append(future)
-                if self._count_pending_or_running == self.max_parallel:
+            future = workflow.submit(a)
+            self.futures.append(future)
+            if future.pending or future.running:
+                count_pending_or_running += 1
+                if count_pending_or_running == self.max_parallel:
                     break
 
         self.sync_state()
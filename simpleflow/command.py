@@ -17,7 +17,7 @@ import swf.exceptions
 import swf.models
 import swf.querysets
 from simpleflow import Workflow, __version__, format, log, logger
-from simpleflow.download import download_binaries
+from simpleflow.download import download_binaries, use_binaries
 from simpleflow.history import History
 from simpleflow.settings import print_settings
 from simpleflow.swf import helpers
@@ -412,6 +412,29 @@ def task_info(ctx, domain, workflow_id, task_id, details):
     print(with_format(ctx)(helpers.get_task)(domain, workflow_id, task_id, details))
 
 
+@click.option(
+    "--preload-workflows",
+    required=False,
+    help="Comma-separated workflow classes (e.g. child workflows) whose executors "
+    "are loaded at startup instead of in each decision.",
+)
+@click.option(
+    "--sticky-max-rss",
+    type=int,
+    required=False,
+    help="With --sticky, replace a decider process using more than this RSS (MB).",
+)
+@click.option(
+    "--sticky-max-decisions",
+    type=int,
+    required=False,
+    help="With --sticky, replace a decider process after this many decisions.",
+)
+@click.option(
+    "--sticky",
+    is_flag=True,
+    help="Take decisions in long-lived processes instead of forking for each one.",
+)
 @click.option("--nb-processes", "-N", type=int)
 @click.option("--log-level", "-l")
 @click.option("--task-list")
@@ -420,13 +443,31 @@ def task_info(ctx, domain, workflow_id, task_id, details):
 @cli.command(
     "decider.start", help="Start a decider process to manage workflow executions."
 )
-def start_decider(workflows, domain, task_list, log_level, nb_processes):
+def start_decider(
+    workflows,
+    domain,
+    task_list,
+    log_level,
+    nb_processes,
+    sticky,
+    sticky_max_decisions,
+    sticky_max_rss,
+    preload_workflows,
+):
     if log_level:
         logger.warning(
             "Deprecated: --log-level will be removed, use LOG_LEVEL environment variable instead"
         )
     decider.command.start(
-        workflows, domain, task_list, None, nb_processes,
+        workflows,
+        domain,
+        task_list,
+        None,
+        nb_processes,
+        sticky=sticky,
+        sticky_max_decisions=sticky_max_decisions,
+        sticky_max_rss=sticky_max_rss,
+        preload_workflows=preload_workflows.split(",") if preload_workflows else None,
     )
 
 
@@ -434,11 +475,29 @@ def start_decider(workflows, domain, task_list, log_level, nb_processes):
     "--poll-data",
     help="Provide a base64 encoded json dump of the SWF poll response, instead of polling SWF",
 )
+@click.option(
+    "--preload-modules",
+    required=False,
+    help="Comma-separated activity modules imported at startup instead of in "
+    "each task.",
+)
+@click.option(
+    "--prefetch",
+    is_flag=True,
+    help="Poll the next task while the current one is processed (local process mode only).",
+)
+@click.option(
+    "--nb-slots",
+    type=int,
+    help="Number of activities run concurrently by each process in the concurrent "
+    "process mode (default=number of CPUs)",
+)
 @click.option(
     "--process-mode",
     type=click.Choice(VALID_PROCESS_MODES),
     default="local",
-    help="Whether to process the task locally or in a Kubernetes job (default=local)",
+    help="Whether to process the task locally, concurrently in long-lived processes "
+    "or in a Kubernetes job (default=local)",
 )
 @click.option(
     "--one-task", is_flag=True, help="Run only one task and shut down (no supervisor)."
@@ -463,6 +522,9 @@ def start_worker(
     heartbeat,
     one_task,
     process_mode,
+    nb_slots,
+    prefetch,
+    preload_modules,
     poll_data,
 ):
     if log_level:
@@ -480,8 +542,20 @@ def start_worker(
     if not task_list and not poll_data:
         raise ValueError("Please provide a --task-list or some data via --poll-data")
 
+    if prefetch and process_mode != "local":
+        raise ValueError("--prefetch is only supported with --process-mode=local")
+
     worker.command.start(
-        domain, task_list, nb_processes, heartbeat, one_task, process_mode, poll_data,
+        domain,
+        task_list,
+        nb_processes,
+        heartbeat,
+        one_task,
+        process_mode,
+        poll_data,
+        nb_slots=nb_slots,
+        prefetch=prefetch,
+        preload=preload_modules.split(",") if preload_modules else None,
     )
 
 
@@ -740,14 +814,13 @@ def activity_rerun(domain, workflow_id, run_id, input, scheduled_id, activity_id
         "Will re-run: {}(*{}, **{}) [+meta={}]".format(task, args, kwargs, meta)
     )
 
-    # download binaries if needed
-    download_binaries(meta.get("binaries", {}))
-
-    # execute the activity task with the correct arguments
-    instance = ActivityTask(task, *args, **kwargs)
-    result = instance.execute()
-    if hasattr(instance, "post_execute"):
-        instance.post_execute()
+    # download binaries if needed, kept while the task runs
+    with use_binaries(meta.get("binaries", {})):
+        # execute the activity task with the correct arguments
+        instance = ActivityTask(task, *args, **kwargs)
+        result = instance.execute()
+        if hasattr(instance, "post_execute"):
+            instance.post_execute()
     logger.info("Result (JSON): {}".format(json_dumps(result, compact=False)))
 
 
@@ -13,10 +13,12 @@ if PY2:
     text_type = unicode  # NOQA
     binary_type = str
     string_types = (str, unicode)  # NOQA
+    integer_types = (int, long)  # NOQA
     unicode = unicode  # NOQA
     basestring = basestring  # NOQA
     imap = imap
     izip = izip
+    intern = intern  # NOQA
 else:
     from urllib import request  # NOQA
     from urllib.parse import quote as urlquote  # NOQA
@@ -24,7 +26,9 @@ else:
     text_type = str
     binary_type = bytes
     string_types = (str,)
+    integer_types = (int,)
     unicode = str
     basestring = (str, bytes)
     imap = map
     izip = zip
+    intern = sys.intern
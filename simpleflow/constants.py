@@ -23,7 +23,22 @@ MAX_LOG_FIELD = 500 * 1024  # 500kB
 
 # Jumbo fields
 JUMBO_FIELDS_PREFIX = "simpleflow+s3://"
+# Signature prefixes, by storage backend
+JUMBO_FIELDS_PREFIXES = (JUMBO_FIELDS_PREFIX, "simpleflow+file://")
 JUMBO_FIELDS_MAX_SIZE = 5 * 1024 ** 2  # 5MB
+# Maximum total length of the jumbo fields kept in memory
+JUMBO_FIELDS_MEMORY_CACHE_SIZE = int(
+    os.getenv("SIMPLEFLOW_JUMBO_FIELDS_MEMORY_CACHE_SIZE", 64 * 1024 ** 2)
+)
+
+# Jumbo fields of a history pulled concurrently before a replay: number of
+# concurrent pulls (0 to disable), and time budget in seconds
+JUMBO_FIELDS_PREFETCH_CONCURRENCY = int(
+    os.getenv("SIMPLEFLOW_JUMBO_FIELDS_PREFETCH_CONCURRENCY", 16)
+)
+JUMBO_FIELDS_PREFETCH_TIMEOUT = float(
+    os.getenv("SIMPLEFLOW_JUMBO_FIELDS_PREFETCH_TIMEOUT", 30)
+)
 
 # Cache directory
 CACHE_DIR = "/tmp/simpleflow-cache"
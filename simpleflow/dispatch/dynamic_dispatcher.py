@@ -1,10 +1,19 @@
 # -*- coding: utf-8 -*-
+import time
+from typing import TYPE_CHECKING
 
+from simpleflow import logger
 from simpleflow.activity import Activity
 from simpleflow.utils import import_object_from_module
 
 from .exceptions import DispatchError
 
+if TYPE_CHECKING:
+    from typing import Dict, Iterable  # NOQA
+
+# Time taken to import each module preloaded by this process, by module name
+MODULE_LOAD_TIMES = {}  # type: Dict[str, float]
+
 
 class Dispatcher(object):
     """
@@ -12,8 +21,11 @@ class Dispatcher(object):
     but without a hierarchy.
     """
 
-    @staticmethod
-    def dispatch_activity(name):
+    # Activities dispatched or preloaded by this process, by name
+    _activities = {}  # type: Dict[str, Activity]
+
+    @classmethod
+    def dispatch_activity(cls, name):
         """
 
         :param name:
@@ -22,6 +34,9 @@ class Dispatcher(object):
         :rtype: Activity
         :raise DispatchError: if doesn't exist or not an activity
         """
+        activity = cls._activities.get(name)
+        if activity is not None:
+            return activity
         module_name, activity_name = name.rsplit(".", 1)
         try:
             activity = import_object_from_module(module_name, activity_name)
@@ -37,4 +52,27 @@ class Dispatcher(object):
             # care if the task is decorated or not. We only need the decorated
             # function for the decider (options to schedule, retry, fail, etc.).
             activity = Activity(activity, activity_name)
+        cls._activities[name] = activity
         return activity
+
+
+def preload_modules(module_names):
+    """
+    Import modules and register the activities they define, so that the
+    processes forked afterwards neither import nor look them up again.
+
+    :param module_names:
+    :type module_names: Iterable[str]
+    """
+    for module_name in module_names:
+        start = time.time()
+        module = import_object_from_module(module_name)
+        for object_name, obj in vars(module).items():
+            if isinstance(obj, Activity):
+                name = "{}.{}".format(module_name, object_name)
+                Dispatcher._activities[name] = obj
+        load_time = time.time() - start
+        MODULE_LOAD_TIMES[module_name] = load_time
+        logger.info(
+            'preloaded activity module "{}" in {:.3f}s'.format(module_name, load_time)
+        )
@@ -1,13 +1,82 @@
+import contextlib
 import errno
+import fcntl
 import functools
 import hashlib
+import json
 import os
+import shutil
+import tempfile
+import time
 
-from lockfile import FileLock
+from lockfile import AlreadyLocked, FileLock
 
-from simpleflow import logger
-from simpleflow.settings import SIMPLEFLOW_BINARIES_DIRECTORY
-from simpleflow.storage import pull
+from simpleflow import logger, settings
+from simpleflow.storage import AtomicFile, map_parallel, pull, split_url, stat
+
+# Suffix of a remote location pinning the SHA-256 of a binary
+SHA256_FRAGMENT = "#sha256="
+
+# Size of the chunks read to checksum binaries
+CHUNK_SIZE = 1024 ** 2
+
+
+class BinaryVerificationError(Exception):
+    pass
+
+
+class BinaryLease(object):
+    """
+    Shared lock on the directory of a binary, held while the binary may be
+    used: BinaryCache.evict() skips the directories leased by any process.
+    It's released when closed or when its process exits.
+    """
+
+    def __init__(self, binary):
+        """
+        :type binary: RemoteBinary
+        """
+        self.binary = binary
+        self._fd = None
+
+    def acquire(self):
+        while True:
+            self.binary._mkdir_p(self.binary.local_directory)
+            try:
+                fd = os.open(self.binary.lease_location, os.O_RDWR | os.O_CREAT)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                # Evicted between the mkdir and the open
+                continue
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            if _same_file(fd, self.binary.lease_location):
+                self._fd = fd
+                return
+            # Evicted while waiting for the lock
+            os.close(fd)
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def _same_file(fd, filename):
+    """
+    Whether a file descriptor still refers to a file name.
+    """
+    try:
+        return os.path.samestat(os.fstat(fd), os.stat(filename))
+    except OSError:
+        return False
 
 
 class RemoteBinary(object):
@@ -16,29 +85,50 @@ class RemoteBinary(object):
     If the binary is not available, simpleflow will try to download it and
     put it in a dedicated folder so it can be used. It will also prepend this
     folder to $PATH before forking to the real activity worker.
+
+    A downloaded binary is checked against the size and MD5 of the remote
+    object, and against the SHA-256 pinned in its remote location, if any
+    ("s3://bucket/path#sha256=<hex digest>"). It's only moved to its final
+    location once checked.
     """
 
     def __init__(self, name, remote_location):
         """
         :param name: name of the binary to be downloaded
         :type  name: str
-        :param remote_location: remote location where to download the binary from (only S3 for now)
+        :param remote_location: remote location where to download the binary from
+            (s3:// or file:// URL)
         :type  remote_location: str
         """
         self.name = name
 
-        # limit ourselves to S3 for now
-        assert remote_location.startswith("s3://")
+        url, _, sha256 = remote_location.partition(SHA256_FRAGMENT)
+        # raises on unsupported storage URLs
+        split_url(url)
         self.remote_location = remote_location
+        self.url = url
+        self.sha256 = sha256.lower() or None
         self.local_directory = self._compute_local_directory()
         self.local_location = self._compute_local_location()
         self.lock_location = self._compute_lock_location()
+        self.metadata_location = self._compute_metadata_location()
+        self.lease_location = self._compute_lease_location()
 
     def download(self):
+        """
+        Download the binary if it isn't present yet.
+
+        :return: whether the binary was downloaded
+        :rtype: bool
+        """
         self._mkdir_p(self.local_directory)
         with FileLock(self.lock_location):
-            if not self._check_binary_present():
-                self._download_binary()
+            if self._check_binary_present():
+                # Last use, for the cache eviction
+                os.utime(self.metadata_location, None)
+                return False
+            self._download_binary()
+            return True
 
     def _mkdir_p(self, path):
         try:
@@ -52,7 +142,7 @@ class RemoteBinary(object):
     def _compute_local_directory(self):
         suffix = hashlib.md5(self.remote_location.encode("utf-8")).hexdigest()
         return os.path.join(
-            SIMPLEFLOW_BINARIES_DIRECTORY, "{}-{}".format(self.name, suffix)
+            settings.SIMPLEFLOW_BINARIES_DIRECTORY, "{}-{}".format(self.name, suffix)
         )
 
     def _compute_local_location(self):
@@ -61,8 +151,31 @@ class RemoteBinary(object):
     def _compute_lock_location(self):
         return os.path.join(self.local_directory, ".{}.lock".format(self.name))
 
+    def _compute_metadata_location(self):
+        return os.path.join(self.local_directory, ".{}.json".format(self.name))
+
+    def _compute_lease_location(self):
+        return os.path.join(self.local_directory, ".{}.lease".format(self.name))
+
+    def lease(self):
+        """
+        :return: acquired lease, keeping the binary out of the cache eviction
+        :rtype: BinaryLease
+        """
+        lease = BinaryLease(self)
+        lease.acquire()
+        return lease
+
     def _check_binary_present(self):
-        return os.access(self.local_location, os.X_OK)
+        if not os.access(self.local_location, os.X_OK):
+            return False
+        # Written once the binary is checked
+        try:
+            with open(self.metadata_location) as f:
+                metadata = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        return metadata.get("size") == os.path.getsize(self.local_location)
 
     def _download_binary(self):
         logger.info(
@@ -70,26 +183,229 @@ class RemoteBinary(object):
                 self.remote_location, self.local_location
             )
         )
-        bucket, path = self.remote_location.replace("s3://", "", 1).split("/", 1)
-        # with FileLock(dest):
-        pull(bucket, path, self.local_location)
-        os.chmod(self.local_location, 0o755)
+        bucket, path = split_url(self.url)
+        info = stat(bucket, path)
+        fd, tmp_location = tempfile.mkstemp(
+            dir=self.local_directory, prefix=".{}.".format(self.name)
+        )
+        os.close(fd)
+        try:
+            pull(bucket, path, tmp_location)
+            sha256 = self._verify(tmp_location, info)
+            os.chmod(tmp_location, 0o755)
+            os.rename(tmp_location, self.local_location)
+        except BaseException:
+            if os.path.exists(tmp_location):
+                os.remove(tmp_location)
+            raise
+        self._write_metadata(
+            {"url": self.url, "size": info.size, "etag": info.etag, "sha256": sha256}
+        )
+
+    def _verify(self, filename, info):
+        """
+        Check a downloaded file.
+
+        :param filename:
+        :type filename: str
+        :param info: remote object
+        :type info: simpleflow.storage.ObjectInfo
+        :return: SHA-256 of the file
+        :rtype: str
+        """
+        size = 0
+        md5 = hashlib.md5()
+        sha256 = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                size += len(chunk)
+                md5.update(chunk)
+                sha256.update(chunk)
+        if size != info.size:
+            raise BinaryVerificationError(
+                "{}: got {} bytes instead of {}".format(self.url, size, info.size)
+            )
+        if info.md5 and md5.hexdigest() != info.md5:
+            raise BinaryVerificationError(
+                "{}: MD5 {} doesn't match ETag {}".format(
+                    self.url, md5.hexdigest(), info.md5
+                )
+            )
+        if self.sha256 and sha256.hexdigest() != self.sha256:
+            raise BinaryVerificationError(
+                "{}: SHA-256 {} instead of {}".format(
+                    self.url, sha256.hexdigest(), self.sha256
+                )
+            )
+        return sha256.hexdigest()
+
+    def _write_metadata(self, metadata):
+        with AtomicFile(self.metadata_location) as f:
+            f.write(json.dumps(metadata).encode("utf-8"))
+
+
+class BinaryCache(object):
+    """
+    Directories of the downloaded binaries, evicted in least recently used
+    order when their total size exceeds a budget.
+    """
+
+    def __init__(self, directory=None, max_size=None):
+        """
+        :param directory: defaults to SIMPLEFLOW_BINARIES_DIRECTORY
+        :type directory: Optional[str]
+        :param max_size: in bytes, 0 for no limit; defaults to
+            SIMPLEFLOW_BINARIES_CACHE_SIZE
+        :type max_size: Optional[int]
+        """
+        self.directory = directory or settings.SIMPLEFLOW_BINARIES_DIRECTORY
+        if max_size is None:
+            max_size = settings.SIMPLEFLOW_BINARIES_CACHE_SIZE
+        self.max_size = max_size
+
+    def entries(self):
+        """
+        :return: path, size and last use of each binary directory
+        :rtype: List[(str, int, float)]
+        """
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(path):
+                continue
+            size = 0
+            try:
+                last_used = os.path.getmtime(path)
+                for filename in os.listdir(path):
+                    filename = os.path.join(path, filename)
+                    size += os.path.getsize(filename)
+                    last_used = max(last_used, os.path.getmtime(filename))
+            except OSError:
+                # Evicted by another process meanwhile
+                continue
+            entries.append((path, size, last_used))
+        return entries
+
+    def evict(self, keep=()):
+        """
+        Remove the least recently used binaries until the cache fits its
+        budget. Leased binaries, and those being downloaded, are skipped.
+
+        :param keep: directories not to remove
+        :type keep: Iterable[str]
+        :return: removed directories
+        :rtype: List[str]
+        """
+        if not self.max_size:
+            return []
+        keep = set(keep)
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total_size = sum(size for _, size, _ in entries)
+        removed = []
+        for path, size, _ in entries:
+            if total_size <= self.max_size:
+                break
+            if path in keep:
+                continue
+            if not self._remove(path):
+                continue
+            total_size -= size
+            removed.append(path)
+        return removed
+
+    def _remove(self, path):
+        """
+        Remove a binary directory unless it's leased or being downloaded.
+
+        :type path: str
+        :return: whether it was removed
+        :rtype: bool
+        """
+        name = os.path.basename(path).rsplit("-", 1)[0]
+        lease_location = os.path.join(path, ".{}.lease".format(name))
+        try:
+            fd = os.open(lease_location, os.O_RDWR | os.O_CREAT)
+        except OSError:
+            # Evicted by another process meanwhile
+            return False
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                return False
+            if not _same_file(fd, lease_location):
+                return False
+            lock = FileLock(os.path.join(path, ".{}.lock".format(name)), timeout=0)
+            try:
+                lock.acquire()
+            except AlreadyLocked:
+                return False
+            # Removed with the lease and the lock
+            logger.info("Evicting binary directory: {}".format(path))
+            shutil.rmtree(path, ignore_errors=True)
+            return True
+        finally:
+            os.close(fd)
+
+
+def _download(binary):
+    return binary.download()
 
 
 # convenience helpers
+@contextlib.contextmanager
+def use_binaries(binaries_map):
+    """
+    Download binaries if needed, and prepend their directories to $PATH.
+    They're leased until the block exits, so that no process evicts them
+    while they're used.
+    """
+    binaries = [
+        RemoteBinary(binary, remote_location)
+        for binary, remote_location in binaries_map.items()
+    ]
+    leases = []
+    try:
+        for binary in binaries:
+            leases.append(binary.lease())
+        start = time.time()
+        downloaded = map_parallel(
+            _download, binaries, settings.SIMPLEFLOW_BINARIES_DOWNLOAD_CONCURRENCY
+        )
+        for binary in binaries:
+            os.environ["PATH"] = binary.local_directory + ":" + os.environ["PATH"]
+        if any(downloaded):
+            logger.info(
+                "Downloaded {} binaries in {:.2f}s".format(
+                    sum(downloaded), time.time() - start
+                )
+            )
+            BinaryCache().evict(keep=[binary.local_directory for binary in binaries])
+        yield
+    finally:
+        for lease in leases:
+            lease.release()
+
+
 def download_binaries(binaries_map):
-    for binary, remote_location in binaries_map.items():
-        binary = RemoteBinary(binary, remote_location)
-        binary.download()
-        os.environ["PATH"] = binary.local_directory + ":" + os.environ["PATH"]
+    """
+    Download binaries if needed, and prepend their directories to $PATH.
+    Prefer use_binaries() to keep them from being evicted while they're used.
+    """
+    with use_binaries(binaries_map):
+        pass
 
 
 def with_binaries(binaries_map):
     def decorator(func):
         @functools.wraps(func)
         def wrapped(*args, **kwargs):
-            download_binaries(binaries_map)
-            return func(*args, **kwargs)
+            with use_binaries(binaries_map):
+                return func(*args, **kwargs)
 
         wrapped.__wrapped__ = func
         return wrapped
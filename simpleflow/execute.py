@@ -3,7 +3,10 @@ from __future__ import absolute_import, print_function
 import errno
 import json
 import os
+import select
+import struct
 import sys
+import threading
 import time
 from typing import TYPE_CHECKING
 
@@ -24,18 +27,24 @@ from builtins import map
 
 from future.utils import iteritems
 
-from simpleflow import compat, format
+from simpleflow import compat, constants, format
 from simpleflow import logger as simpleflow_logger
 from simpleflow.exceptions import ExecutionError, ExecutionTimeoutError
 from simpleflow.utils import json_dumps
 
 if TYPE_CHECKING:
     import inspect  # NOQA
-    from typing import Any, Iterable  # NOQA
+    from typing import IO, Any, Dict, Iterable, List, Optional, Tuple  # NOQA
 
 
 MAX_ARGUMENTS_JSON_LENGTH = 65536
 
+# Header of the frames exchanged with pooled interpreters: payload length
+FRAME_HEADER = struct.Struct("!I")
+
+# tmpfs mount, for files in memory when memfd_create isn't available
+SHM_DIR = "/dev/shm"
+
 
 __all__ = ["program", "python"]
 
@@ -187,7 +196,14 @@ def wait_subprocess(process, timeout=None, command_info=None):
 
 
 def python(
-    interpreter="python", logger_name=__name__, timeout=None, kill_children=False
+    interpreter="python",
+    logger_name=__name__,
+    timeout=None,
+    kill_children=False,
+    pool=False,
+    max_calls=None,
+    max_rss=None,
+    jumbo_result=False,
 ):
     """
     Execute a callable as an external Python program.
@@ -197,6 +213,16 @@ def python(
 
     Arguments of the decorated callable must be serializable in JSON.
 
+    With `pool`, calls are sent to long-lived interpreters, shared by the
+    callables of the same module, instead of starting a new one each time.
+    A pooled interpreter is replaced after `max_calls` calls, when its RSS
+    exceeds `max_rss` megabytes, or when a call times out.
+
+    With `jumbo_result`, a result too long for SWF is pushed as a jumbo field
+    straight from the file the interpreter wrote it to, if jumbo fields are
+    enabled: the callable then returns a lazy proxy to it. Pooled calls send
+    their results over a pipe, and always return them decoded.
+
     """
 
     def wrap_callable(func):
@@ -208,7 +234,19 @@ def python(
             sys.stderr.flush()
             result_str = None  # useless
             context = kwargs.pop("context", {})
-            with tempfile.TemporaryFile() as result_fd, tempfile.TemporaryFile() as error_fd:
+            if pool:
+                result_str = get_interpreter_pool(
+                    interpreter, func.__module__, max_calls, max_rss
+                ).call(
+                    get_name(func),
+                    format_arguments_json(*args, **kwargs),
+                    context,
+                    logger_name=logger_name,
+                    timeout=timeout,
+                    kill_children=kill_children,
+                )
+                return decode_result(result_str, logger)
+            with anonymous_file() as result_fd, anonymous_file() as error_fd:
                 dup_result_fd = os.dup(result_fd.fileno())  # remove FD_CLOEXEC
                 dup_error_fd = os.dup(error_fd.fileno())  # remove FD_CLOEXEC
                 arguments_json = format_arguments_json(*args, **kwargs)
@@ -229,7 +267,7 @@ def python(
                     arg_file = None
                     arg_fd = None
                 else:
-                    arg_file = tempfile.TemporaryFile()
+                    arg_file = anonymous_file()
                     arg_file.write(arguments_json.encode("utf-8"))
                     arg_file.flush()
                     arg_file.seek(0)
@@ -267,22 +305,13 @@ def python(
                     raise ExecutionError(err_output)
 
                 result_fd.seek(0)
+                if jumbo_result:
+                    signature = push_jumbo_result(result_fd)
+                    if signature:
+                        return format.decode(signature)
                 result_str = result_fd.read()
 
-            if not result_str:
-                return None
-            try:
-                if not compat.PY2:
-                    result_str = result_str.decode("utf-8", errors="replace")
-                result = format.decode(result_str)
-                return result
-            except BaseException as ex:
-                logger.exception(
-                    "Exception in python.execute: {} {}".format(
-                        ex.__class__.__name__, ex
-                    )
-                )
-                logger.warning("%r", result_str)
+            return decode_result(result_str, logger)
 
         # Not automatically assigned in python < 3.2.
         execute.__wrapped__ = func
@@ -292,6 +321,340 @@ def python(
     return wrap_callable
 
 
+def push_jumbo_result(result_fd):
+    """
+    Push a result as a jumbo field if it's too long for SWF, without loading
+    it in memory.
+
+    :param result_fd: file holding the JSON-encoded result, at its start
+    :type result_fd: IO[bytes]
+    :return: the jumbo field signature, or None if the result isn't pushed
+    :rtype: Optional[str]
+    """
+    if not format._jumbo_fields_bucket():
+        return None
+    # The encoded byte length: json_dumps escapes non-ASCII characters, so it's
+    # also the length of the message sent to SWF.
+    size = os.fstat(result_fd.fileno()).st_size
+    if size <= constants.MAX_RESULT_LENGTH:
+        return None
+    try:
+        return format.push_jumbo_field_file(result_fd, size)
+    except format.JumboTooLargeError:
+        # Fails like any other result once returned
+        result_fd.seek(0)
+        return None
+
+
+def anonymous_file():
+    """
+    Temporary file in memory: a memfd if the platform supports it, or a file
+    on a tmpfs, or else a regular temporary file.
+
+    :rtype: IO[bytes]
+    """
+    memfd_create = getattr(os, "memfd_create", None)
+    if memfd_create is not None:
+        try:
+            return os.fdopen(memfd_create("simpleflow"), "w+b")
+        except OSError:
+            pass
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        return tempfile.TemporaryFile(dir=SHM_DIR)
+    return tempfile.TemporaryFile()
+
+
+def decode_result(result_str, logger):
+    """
+    Decode the result of a callable executed in another interpreter.
+
+    :param result_str: JSON result
+    :type result_str: Optional[bytes]
+    :param logger:
+    :type logger: logging.Logger
+    """
+    if not result_str:
+        return None
+    try:
+        if not compat.PY2:
+            result_str = result_str.decode("utf-8", errors="replace")
+        result = format.decode(result_str)
+        return result
+    except BaseException as ex:
+        logger.exception(
+            "Exception in python.execute: {} {}".format(ex.__class__.__name__, ex)
+        )
+        logger.warning("%r", result_str)
+
+
+def write_frame(fd, payload):
+    """
+    Write a length-prefixed payload.
+
+    :param fd:
+    :type fd: int
+    :param payload:
+    :type payload: bytes
+    """
+    data = FRAME_HEADER.pack(len(payload)) + payload
+    while data:
+        data = data[os.write(fd, data) :]
+
+
+class FrameTimeout(Exception):
+    pass
+
+
+def _read_exactly(fd, size, deadline=None):
+    chunks = []
+    while size:
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise FrameTimeout
+        chunk = os.read(fd, size)
+        if not chunk:
+            raise EOFError
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(fd, deadline=None):
+    """
+    Read a length-prefixed payload.
+
+    :param fd:
+    :type fd: int
+    :param deadline: time.time() after which FrameTimeout is raised
+    :type deadline: Optional[float]
+    :rtype: bytes
+    :raise EOFError: if the other end is closed
+    """
+    (size,) = FRAME_HEADER.unpack(_read_exactly(fd, FRAME_HEADER.size, deadline))
+    return _read_exactly(fd, size, deadline)
+
+
+class PooledInterpreter(object):
+    """
+    Long-lived interpreter executing the calls it receives over a pipe; see
+    `serve`.
+    """
+
+    def __init__(self, interpreter, module_name):
+        """
+        :param interpreter:
+        :type interpreter: str
+        :param module_name: module imported at startup
+        :type module_name: str
+        """
+        request_read_fd, self.request_fd = os.pipe()
+        self.response_fd, response_write_fd = os.pipe()
+        self.command = [
+            interpreter,
+            "-m",
+            "simpleflow.execute",
+            "--serve",
+            "--request-fd={}".format(request_read_fd),
+            "--response-fd={}".format(response_write_fd),
+            "--preload={}".format(module_name),
+        ]
+        if is_buggy_subprocess32():
+            close_fds, pass_fds = False, []
+        else:
+            close_fds, pass_fds = True, [request_read_fd, response_write_fd]
+        self.process = subprocess.Popen(
+            self.command, close_fds=close_fds, pass_fds=pass_fds
+        )
+        os.close(request_read_fd)
+        os.close(response_write_fd)
+        self.nb_calls = 0
+
+    def call(
+        self,
+        funcname,
+        arguments_json,
+        context,
+        logger_name,
+        timeout=None,
+        kill_children=False,
+    ):
+        """
+        :return: JSON result
+        :rtype: bytes
+        :raise ExecutionError: if the callable raised
+        :raise ExecutionTimeoutError: if the call timed out
+        """
+        request = json_dumps(
+            {
+                "funcname": funcname,
+                "arguments": arguments_json,
+                "context": context,
+                "logger_name": logger_name,
+                "kill_children": kill_children,
+            }
+        )
+        if not compat.PY2:
+            request = request.encode("utf-8")
+        deadline = time.time() + timeout if timeout else None
+        self.nb_calls += 1
+        write_frame(self.request_fd, request)
+        try:
+            response = json.loads(
+                read_frame(self.response_fd, deadline).decode("utf-8")
+            )
+        except FrameTimeout:
+            raise ExecutionTimeoutError(command=self.command, timeout_value=timeout)
+        except EOFError:
+            raise ExecutionError(
+                "pooled interpreter pid={} died: exit code {}".format(
+                    self.process.pid, self.process.wait()
+                )
+            )
+        if "error" in response:
+            raise ExecutionError(response["error"])
+        result = response["result"]
+        return result.encode("utf-8") if not compat.PY2 else result
+
+    @property
+    def rss(self):
+        try:
+            return psutil.Process(self.process.pid).memory_info().rss
+        except psutil.NoSuchProcess:
+            return 0
+
+    def stop(self):
+        # The interpreter exits when it reads EOF
+        for fd in (self.request_fd, self.response_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.process.wait()
+
+    def kill(self):
+        try:
+            self.process.kill()
+        except OSError:
+            pass
+        self.stop()
+
+
+class InterpreterPool(object):
+    """
+    Pooled interpreters of an interpreter and module.
+    """
+
+    def __init__(self, interpreter, module_name, max_calls=None, max_rss=None):
+        """
+        :param interpreter:
+        :type interpreter: str
+        :param module_name:
+        :type module_name: str
+        :param max_calls: calls after which an interpreter is replaced
+        :type max_calls: Optional[int]
+        :param max_rss: RSS (MB) above which an interpreter is replaced
+        :type max_rss: Optional[int]
+        """
+        self.interpreter = interpreter
+        self.module_name = module_name
+        self.max_calls = max_calls
+        self.max_rss = max_rss
+        self._idle = []  # type: List[PooledInterpreter]
+        self._lock = threading.Lock()
+
+    def call(
+        self,
+        funcname,
+        arguments_json,
+        context,
+        logger_name=__name__,
+        timeout=None,
+        kill_children=False,
+    ):
+        """
+        Execute a call in an idle interpreter, or in a new one.
+
+        :return: JSON result
+        :rtype: bytes
+        """
+        interpreter = self._acquire()
+        try:
+            result = interpreter.call(
+                funcname,
+                arguments_json,
+                context,
+                logger_name,
+                timeout=timeout,
+                kill_children=kill_children,
+            )
+        except ExecutionTimeoutError:
+            interpreter.kill()
+            raise
+        except ExecutionError:
+            if interpreter.process.poll() is not None:
+                interpreter.stop()
+                raise
+            self._release(interpreter)
+            raise
+        except BaseException:
+            interpreter.kill()
+            raise
+        self._release(interpreter)
+        return result
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                interpreter = self._idle.pop()
+            if interpreter.process.poll() is None:
+                return interpreter
+            # Killed while idle
+            interpreter.stop()
+        return PooledInterpreter(self.interpreter, self.module_name)
+
+    def _release(self, interpreter):
+        if (self.max_calls and interpreter.nb_calls >= self.max_calls) or (
+            self.max_rss and interpreter.rss > self.max_rss * 1024 * 1024
+        ):
+            interpreter.stop()
+            return
+        with self._lock:
+            self._idle.append(interpreter)
+
+    def stop(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for interpreter in idle:
+            interpreter.stop()
+
+
+# Interpreter pools of this process, by (interpreter, module name, max calls,
+# max RSS): functions with other limits don't share their interpreters
+_INTERPRETER_POOLS = {}  # type: Dict[Tuple, InterpreterPool]
+_INTERPRETER_POOLS_PID = None
+
+
+def get_interpreter_pool(interpreter, module_name, max_calls=None, max_rss=None):
+    """
+    :rtype: InterpreterPool
+    """
+    global _INTERPRETER_POOLS_PID
+    if _INTERPRETER_POOLS_PID != os.getpid():
+        # Pools inherited from a parent process belong to it
+        _INTERPRETER_POOLS.clear()
+        _INTERPRETER_POOLS_PID = os.getpid()
+    key = (interpreter, module_name, max_calls, max_rss)
+    pool = _INTERPRETER_POOLS.get(key)
+    if pool is None:
+        pool = _INTERPRETER_POOLS[key] = InterpreterPool(
+            interpreter, module_name, max_calls, max_rss
+        )
+    return pool
+
+
 def is_buggy_subprocess32():
     """
     subprocess32 < 3.5.0:
@@ -416,6 +779,121 @@ def make_callable(funcname):
     return callable_
 
 
+def kill_child_processes():
+    process = psutil.Process(os.getpid())
+    children = process.children(recursive=True)
+
+    for child in children:
+        try:
+            child.terminate()
+        except psutil.NoSuchProcess:
+            pass
+    _, still_alive = psutil.wait_procs(children, timeout=0.3)
+    for child in still_alive:
+        try:
+            child.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+
+def call_by_name(funcname, arguments, context=None):
+    """
+    Call a callable, or execute a task class, from its name.
+
+    :param funcname: name of the callable
+    :type funcname: str
+    :param arguments: {"args": [...], "kwargs": {...}}
+    :type arguments: dict
+    :param context: activity context
+    :type context: Optional[dict]
+    :return: result
+    """
+    callable_ = make_callable(funcname)
+    if hasattr(callable_, "__wrapped__"):
+        callable_ = callable_.__wrapped__
+    args = arguments.get("args", ())
+    kwargs = arguments.get("kwargs", {})
+    if hasattr(callable_, "execute"):
+        inst = callable_(*args, **kwargs)
+        if context is not None:
+            inst.context = context
+        result = inst.execute()
+        if hasattr(inst, "post_execute"):
+            inst.post_execute()
+    else:
+        if context is not None:
+            callable_.context = context
+        result = callable_(*args, **kwargs)
+    return result
+
+
+def format_error_details():
+    """
+    JSON details of the exception being handled.
+
+    :rtype: str
+    """
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    tb = traceback.format_tb(exc_traceback)
+    return json_dumps(
+        {"error": exc_type.__name__, "message": str(exc_value), "traceback": tb,},
+        default=repr,
+    )
+
+
+def serve(request_fd, response_fd, preload=None):
+    """
+    Main loop of a pooled interpreter: execute the calls read from
+    `request_fd` and write their result or error details to `response_fd`,
+    until EOF.
+
+    :param request_fd:
+    :type request_fd: int
+    :param response_fd:
+    :type response_fd: int
+    :param preload: module to import before the first call
+    :type preload: Optional[str]
+    """
+    if preload:
+        __import__(preload, fromlist=["*"])
+    while True:
+        try:
+            request = json.loads(read_frame(request_fd).decode("utf-8"))
+        except EOFError:
+            return
+        logger = logging.getLogger(request["logger_name"])
+        try:
+            arguments = format.decode(request["arguments"])
+            result = call_by_name(request["funcname"], arguments, request["context"])
+            response = {"result": json_dumps(result)}
+        except Exception as err:
+            logger.error("Exception: {}".format(err))
+            response = {"error": format_error_details()}
+        if request["kill_children"]:
+            kill_child_processes()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        response = json_dumps(response)
+        if not compat.PY2:
+            response = response.encode("utf-8")
+        try:
+            write_frame(response_fd, response)
+        except OSError:
+            return
+
+
+def serve_main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--request-fd", type=int, required=True)
+    parser.add_argument("--response-fd", type=int, required=True)
+    parser.add_argument("--preload", help="module to import at startup")
+    cmd_arguments = parser.parse_args()
+    serve(cmd_arguments.request_fd, cmd_arguments.response_fd, cmd_arguments.preload)
+
+
 def main():
     """
     When executed as a script, this module expects the name of a callable as
@@ -487,22 +965,6 @@ def main():
     )
     cmd_arguments = parser.parse_args()
 
-    def kill_child_processes():
-        process = psutil.Process(os.getpid())
-        children = process.children(recursive=True)
-
-        for child in children:
-            try:
-                child.terminate()
-            except psutil.NoSuchProcess:
-                pass
-        _, still_alive = psutil.wait_procs(children, timeout=0.3)
-        for child in still_alive:
-            try:
-                child.kill()
-            except psutil.NoSuchProcess:
-                pass
-
     funcname = cmd_arguments.funcname
     if cmd_arguments.arguments_json_fd is None:
         content = cmd_arguments.funcargs
@@ -519,34 +981,14 @@ def main():
         logger = logging.getLogger(cmd_arguments.logger_name)
     else:
         logger = simpleflow_logger
-    callable_ = make_callable(funcname)
-    if hasattr(callable_, "__wrapped__"):
-        callable_ = callable_.__wrapped__
-    args = arguments.get("args", ())
-    kwargs = arguments.get("kwargs", {})
     context = (
         json.loads(cmd_arguments.context) if cmd_arguments.context is not None else None
     )
     try:
-        if hasattr(callable_, "execute"):
-            inst = callable_(*args, **kwargs)
-            if context is not None:
-                inst.context = context
-            result = inst.execute()
-            if hasattr(inst, "post_execute"):
-                inst.post_execute()
-        else:
-            if context is not None:
-                callable_.context = context
-            result = callable_(*args, **kwargs)
+        result = call_by_name(funcname, arguments, context)
     except Exception as err:
         logger.error("Exception: {}".format(err))
-        exc_type, exc_value, exc_traceback = sys.exc_info()
-        tb = traceback.format_tb(exc_traceback)
-        details = json_dumps(
-            {"error": exc_type.__name__, "message": str(exc_value), "traceback": tb,},
-            default=repr,
-        )
+        details = format_error_details()
         if cmd_arguments.error_fd == 2:
             sys.stderr.flush()
         if not compat.PY2:
@@ -568,4 +1010,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["--serve"]:
+        serve_main()
+    else:
+        main()
@@ -1,21 +1,137 @@
+import collections
+import hashlib
 import os
+import tempfile
+import threading
+import time
+import zlib
 from sqlite3 import OperationalError
 from uuid import uuid4
 
 import lazy_object_proxy
 from diskcache import Cache
+from future.moves import queue
 
 from simpleflow import constants, logger, storage
 from simpleflow.settings import SIMPLEFLOW_ENABLE_DISK_CACHE
 from simpleflow.utils import json_dumps, json_loads_or_raw
 
-JUMBO_FIELDS_MEMORY_CACHE = {}
-
 
 class JumboTooLargeError(ValueError):
     pass
 
 
+class SizedLRUCache(object):
+    """
+    LRU of strings, bounded by their total length.
+
+    :ivar hits: number of successful lookups
+    :ivar misses: number of failed lookups
+    :ivar evictions: number of values evicted to make room for new ones
+    """
+
+    def __init__(self, max_size):
+        """
+        :param max_size: maximum total length of the values
+        :type max_size: int
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._values = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def get(self, key):
+        """
+        :type key: str
+        :rtype: Optional[str]
+        """
+        value = self._values.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._values[key] = value
+        return value
+
+    def set(self, key, value):
+        """
+        Cache a value, unless it is larger than the cache.
+
+        :type key: str
+        :type value: str
+        """
+        self.pop(key)
+        if len(value) > self.max_size:
+            return
+        self._values[key] = value
+        self.size += len(value)
+        while self.size > self.max_size:
+            _, evicted = self._values.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def pop(self, key):
+        """
+        :type key: str
+        :rtype: Optional[str]
+        """
+        value = self._values.pop(key, None)
+        if value is not None:
+            self.size -= len(value)
+        return value
+
+    def clear(self):
+        self._values.clear()
+        self.size = 0
+
+
+JUMBO_FIELDS_MEMORY_CACHE = SizedLRUCache(constants.JUMBO_FIELDS_MEMORY_CACHE_SIZE)
+
+# Lookups in the disk cache, after missing the memory cache
+JUMBO_FIELDS_DISK_CACHE_STATS = collections.Counter()
+
+_disk_cache = None
+_disk_cache_pid = None
+
+
+def _get_disk_cache():
+    """
+    Disk cache handle of the current process. Handles don't survive forks
+    (see DiskCache docs), so a new one is opened in child processes.
+
+    :rtype: Cache
+    """
+    global _disk_cache, _disk_cache_pid
+    if _disk_cache_pid != os.getpid():
+        _disk_cache = Cache(constants.CACHE_DIR)
+        _disk_cache_pid = os.getpid()
+    return _disk_cache
+
+
+def jumbo_fields_cache_stats():
+    """
+    Counters of the jumbo fields caches, e.g. to log them.
+
+    :rtype: dict[str, int]
+    """
+    return {
+        "memory_hits": JUMBO_FIELDS_MEMORY_CACHE.hits,
+        "memory_misses": JUMBO_FIELDS_MEMORY_CACHE.misses,
+        "memory_evictions": JUMBO_FIELDS_MEMORY_CACHE.evictions,
+        "memory_size": JUMBO_FIELDS_MEMORY_CACHE.size,
+        "disk_hits": JUMBO_FIELDS_DISK_CACHE_STATS["hits"],
+        "disk_misses": JUMBO_FIELDS_DISK_CACHE_STATS["misses"],
+    }
+
+
 def _jumbo_fields_bucket():
     # wrapped into a function so easier to override for tests
     bucket = os.getenv("SIMPLEFLOW_JUMBO_FIELDS_BUCKET")
@@ -27,18 +143,77 @@ def _jumbo_fields_bucket():
     return bucket
 
 
+class JumboFieldLoader(object):
+    """
+    Load the value of a jumbo field; factory of the proxies returned by
+    `decode`.
+    """
+
+    def __init__(self, content, parse_json=True):
+        self.content = content
+        self.parse_json = parse_json
+
+    def __call__(self):
+        location, _size = self.content.split()
+        value = _pull_jumbo_field(location)
+        if self.parse_json:
+            return json_loads_or_raw(value)
+        return value
+
+
+def _jumbo_fields_codec():
+    # wrapped into a function so easier to override for tests
+    return os.getenv("SIMPLEFLOW_JUMBO_FIELDS_CODEC") or None
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("the zstd codec of jumbo fields requires zstandard")
+    return zstandard
+
+
+JumboFieldCodec = collections.namedtuple(
+    "JumboFieldCodec", ["suffix", "compressobj", "decompressobj"]
+)
+
+# Codecs of content-addressed jumbo fields; the suffix of their keys tells
+# how to decode them
+JUMBO_FIELDS_CODECS = {
+    "none": JumboFieldCodec("", None, None),
+    "gzip": JumboFieldCodec(
+        ".gz",
+        lambda: zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS),
+        lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    ),
+    "zlib": JumboFieldCodec(".zz", zlib.compressobj, zlib.decompressobj),
+    "zstd": JumboFieldCodec(
+        ".zst",
+        lambda: _zstandard().ZstdCompressor().compressobj(),
+        lambda: _zstandard().ZstdDecompressor().decompressobj(),
+    ),
+}
+
+# Size of the chunks read when pushing a jumbo field from a file
+JUMBO_FIELDS_CHUNK_SIZE = 1024 ** 2
+
+
+def _get_codec(path):
+    """
+    :return: codec of a jumbo field, if compressed
+    :rtype: Optional[JumboFieldCodec]
+    """
+    for codec in JUMBO_FIELDS_CODECS.values():
+        if codec.suffix and path.endswith(codec.suffix):
+            return codec
+
+
 def decode(content, parse_json=True, use_proxy=True):
     if content is None:
         return content
-    if content.startswith(constants.JUMBO_FIELDS_PREFIX):
-
-        def unwrap():
-            location, _size = content.split()
-            value = _pull_jumbo_field(location)
-            if parse_json:
-                return json_loads_or_raw(value)
-            return value
-
+    if content.startswith(constants.JUMBO_FIELDS_PREFIXES):
+        unwrap = JumboFieldLoader(content, parse_json)
         if use_proxy:
             return lazy_object_proxy.Proxy(unwrap)
         return unwrap()
@@ -60,7 +235,8 @@ def encode(message, max_length, allow_jumbo_fields=True):
             _log_message_too_long(message)
             raise JumboTooLargeError("Message too long ({} chars)".format(len(message)))
 
-        if len(message) > constants.JUMBO_FIELDS_MAX_SIZE:
+        if not _jumbo_fields_codec() and len(message) > constants.JUMBO_FIELDS_MAX_SIZE:
+            # Compressed fields are checked once compressed
             _log_message_too_long(message)
             raise JumboTooLargeError(
                 "Message too long even for a jumbo field ({} chars)".format(
@@ -83,27 +259,30 @@ def encode(message, max_length, allow_jumbo_fields=True):
 
 def _get_cached(path):
     # 1/ memory cache
-    if path in JUMBO_FIELDS_MEMORY_CACHE:
-        return JUMBO_FIELDS_MEMORY_CACHE[path]
+    value = JUMBO_FIELDS_MEMORY_CACHE.get(path)
+    if value is not None:
+        return value
 
     # 2/ disk cache
     if SIMPLEFLOW_ENABLE_DISK_CACHE:
         try:
             # NB: this cache may also be triggered on activity workers, where it's not that
             # useful. The performance hit should be minimal. To be improved later.
-            # NB2: cache has to be lazily instantiated here, cache objects do not survive forks,
-            # see DiskCache docs.
-            cache = Cache(constants.CACHE_DIR)
+            cache = _get_disk_cache()
             # generate a dedicated cache key because this cache may be shared with other
             # features of simpleflow at some point
             cache_key = "jumbo_fields/" + path.split("/")[-1]
-            if cache_key in cache:
+            value = cache.get(cache_key)
+            if value is not None:
                 logger.debug(
                     "diskcache: getting key={} from cache_dir={}".format(
                         cache_key, constants.CACHE_DIR
                     )
                 )
-                return cache[cache_key]
+                JUMBO_FIELDS_DISK_CACHE_STATS["hits"] += 1
+                JUMBO_FIELDS_MEMORY_CACHE.set(path, value)
+                return value
+            JUMBO_FIELDS_DISK_CACHE_STATS["misses"] += 1
         except OperationalError:
             logger.warning("diskcache: got an OperationalError, skipping cache usage")
 
@@ -113,12 +292,12 @@ def _get_cached(path):
 
 def _set_cached(path, content):
     # 1/ memory cache
-    JUMBO_FIELDS_MEMORY_CACHE[path] = content
+    JUMBO_FIELDS_MEMORY_CACHE.set(path, content)
 
     # 2/ disk cache
     if SIMPLEFLOW_ENABLE_DISK_CACHE:
         try:
-            cache = Cache(constants.CACHE_DIR)
+            cache = _get_disk_cache()
             cache_key = "jumbo_fields/" + path.split("/")[-1]
             logger.debug(
                 "diskcache: setting key={} on cache_dir={}".format(
@@ -132,36 +311,271 @@ def _set_cached(path, content):
             )
 
 
-def _push_jumbo_field(message):
-    size = len(message)
-    uuid = str(uuid4())
+def _new_jumbo_field_location(key=None):
+    if key is None:
+        key = str(uuid4())
     bucket_with_dir = _jumbo_fields_bucket()
+    if "://" in bucket_with_dir:
+        return storage.split_url("{}/{}".format(bucket_with_dir.rstrip("/"), key))
     if "/" in bucket_with_dir:
         bucket, directory = _jumbo_fields_bucket().split("/", 1)
-        path = "{}/{}".format(directory, uuid)
+        path = "{}/{}".format(directory, key)
     else:
         bucket = bucket_with_dir
-        path = uuid
+        path = key
+    return bucket, path
+
+
+def _format_jumbo_field(bucket, path, size):
+    """
+    :return: jumbo field signature, e.g. "simpleflow+s3://bucket/path 1234"
+    :rtype: str
+    """
+    return "simpleflow+{} {}".format(storage.get_url(bucket, path), size)
+
+
+def _split_jumbo_field_location(location):
+    """
+    :param location: first part of a jumbo field signature
+    :type location: str
+    :return: bucket and path
+    :rtype: (str, str)
+    """
+    return storage.split_url(location.split("+", 1)[1])
+
+
+def _jumbo_field_key(digest, codec_name):
+    """
+    Key of a content-addressed jumbo field.
+
+    :param digest: SHA-256 of the uncompressed content
+    :type digest: hashlib.sha256
+    :param codec_name:
+    :type codec_name: str
+    :rtype: str
+    """
+    if codec_name not in JUMBO_FIELDS_CODECS:
+        raise ValueError("unknown jumbo fields codec: {}".format(codec_name))
+    # 128 bits are enough, and keep the signature short
+    return digest.hexdigest()[:32] + JUMBO_FIELDS_CODECS[codec_name].suffix
+
+
+def _check_encoded_size(size):
+    if size > constants.JUMBO_FIELDS_MAX_SIZE:
+        raise JumboTooLargeError(
+            "Message too long even for a jumbo field ({} bytes once encoded)".format(
+                size
+            )
+        )
 
-    storage.push_content(bucket, path, message)
-    _set_cached(path, message)
 
-    return "{}{}/{} {}".format(constants.JUMBO_FIELDS_PREFIX, bucket, path, size)
+def _push_jumbo_field(message):
+    codec_name = _jumbo_fields_codec()
+    if not codec_name:
+        size = len(message)
+        bucket, path = _new_jumbo_field_location()
+        storage.push_content(bucket, path, message)
+        _set_cached(path, message)
+        return _format_jumbo_field(bucket, path, size)
+
+    data = message.encode("utf-8")
+    bucket, path = _new_jumbo_field_location(
+        _jumbo_field_key(hashlib.sha256(data), codec_name)
+    )
+    compressobj = JUMBO_FIELDS_CODECS[codec_name].compressobj
+    if compressobj:
+        compressor = compressobj()
+        data = compressor.compress(data) + compressor.flush()
+    size = len(data)
+    if size > constants.JUMBO_FIELDS_MAX_SIZE:
+        _log_message_too_long(message)
+    _check_encoded_size(size)
+    # Same key, same content: no need to push it again. The cache isn't
+    # enough to tell: it isn't keyed by bucket, and objects may have expired.
+    if not storage.exists(bucket, path):
+        storage.push_content(bucket, path, data)
+    _set_cached(path, message)
+    return _format_jumbo_field(bucket, path, size)
+
+
+def push_jumbo_field_file(fileobj, size):
+    """
+    Push the content of a file as a jumbo field. The content is streamed from
+    the file: it isn't loaded, nor cached, in memory.
+
+    :param fileobj: file positioned at the start of the content
+    :type fileobj: IO[bytes]
+    :param size: content size in bytes
+    :type size: int
+    :return: jumbo field signature
+    :rtype: str
+    """
+    if not _jumbo_fields_bucket():
+        raise JumboTooLargeError("Message too long ({} bytes)".format(size))
+    codec_name = _jumbo_fields_codec()
+    if not codec_name:
+        if size > constants.JUMBO_FIELDS_MAX_SIZE:
+            raise JumboTooLargeError(
+                "Message too long even for a jumbo field ({} bytes)".format(size)
+            )
+        bucket, path = _new_jumbo_field_location()
+        storage.push_stream(bucket, path, fileobj)
+        return _format_jumbo_field(bucket, path, size)
+
+    start = fileobj.tell()
+    compressobj = JUMBO_FIELDS_CODECS[codec_name].compressobj
+    compressed = tempfile.TemporaryFile() if compressobj else None
+    try:
+        digest = hashlib.sha256()
+        compressor = compressobj() if compressobj else None
+        for chunk in iter(lambda: fileobj.read(JUMBO_FIELDS_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            if compressor:
+                compressed.write(compressor.compress(chunk))
+        if compressor:
+            compressed.write(compressor.flush())
+            size = compressed.tell()
+            compressed.seek(0)
+        else:
+            fileobj.seek(start)
+        _check_encoded_size(size)
+        bucket, path = _new_jumbo_field_location(_jumbo_field_key(digest, codec_name))
+        if not storage.exists(bucket, path):
+            storage.push_stream(bucket, path, compressed or fileobj)
+    finally:
+        if compressed:
+            compressed.close()
+    return _format_jumbo_field(bucket, path, size)
+
+
+def _jumbo_field_signature(message):
+    """
+    Signature of a message that is a decoded JSON jumbo field, if it wasn't
+    loaded yet: it can be sent again as is.
+
+    :rtype: Optional[str]
+    """
+    if isinstance(message, lazy_object_proxy.Proxy):
+        loader = message.__factory__
+        if isinstance(loader, JumboFieldLoader) and loader.parse_json:
+            return loader.content
 
 
 def _pull_jumbo_field(location):
-    bucket, path = location.replace(constants.JUMBO_FIELDS_PREFIX, "").split("/", 1)
+    bucket, path = _split_jumbo_field_location(location)
 
     cached_value = _get_cached(path)
     if cached_value:
         return cached_value
 
-    content = storage.pull_content(bucket, path)
+    content = _download_jumbo_field(bucket, path)
     _set_cached(path, content)
 
     return content
 
 
+def _download_jumbo_field(bucket, path):
+    codec = _get_codec(path)
+    if not codec:
+        return storage.pull_content(bucket, path)
+    # Streamed: the compressed content isn't held in memory too
+    decompressor = codec.decompressobj()
+    with storage.open_read(bucket, path) as f:
+        data = b"".join(
+            decompressor.decompress(chunk)
+            for chunk in iter(lambda: f.read(JUMBO_FIELDS_CHUNK_SIZE), b"")
+        )
+    return data.decode("utf-8")
+
+
+def _pull_jumbo_field_content(bucket, path):
+    try:
+        return path, _download_jumbo_field(bucket, path)
+    except Exception as error:
+        # Pulled again when decoded, where the error is raised
+        logger.warning(
+            "cannot prefetch jumbo field {}/{}: {}".format(bucket, path, error)
+        )
+        return path, None
+
+
+def prefetch_jumbo_fields(signatures, concurrency=None, timeout=None):
+    """
+    Pull jumbo fields concurrently into the cache, so that decoding them
+    doesn't pull them one at a time. The fields not pulled within `timeout`
+    are pulled when decoded.
+
+    :param signatures: jumbo field signatures
+    :type signatures: Iterable[str]
+    :param concurrency: maximum number of concurrent pulls
+    :type concurrency: Optional[int]
+    :param timeout: time budget in seconds
+    :type timeout: Optional[float]
+    :return: number of fields pulled
+    :rtype: int
+    """
+    if concurrency is None:
+        concurrency = constants.JUMBO_FIELDS_PREFETCH_CONCURRENCY
+    if timeout is None:
+        timeout = constants.JUMBO_FIELDS_PREFETCH_TIMEOUT
+    if concurrency < 1:
+        return 0
+
+    to_pull = collections.OrderedDict()
+    for signature in signatures:
+        location = signature.split()[0]
+        bucket, path = _split_jumbo_field_location(location)
+        if path not in to_pull and not _get_cached(path):
+            to_pull[path] = bucket
+    if not to_pull:
+        return 0
+
+    deadline = time.time() + timeout
+    for bucket in set(to_pull.values()):
+        # Not thread-safe: connect before starting the threads
+        storage.connect(bucket)
+
+    pending = queue.Queue()
+    for path, bucket in to_pull.items():
+        pending.put((bucket, path))
+    pulled = queue.Queue()
+    stopped = threading.Event()
+
+    def pull():
+        while not stopped.is_set():
+            try:
+                bucket, path = pending.get_nowait()
+            except queue.Empty:
+                return
+            pulled.put(_pull_jumbo_field_content(bucket, path))
+
+    for _ in range(min(concurrency, len(to_pull))):
+        thread = threading.Thread(target=pull)
+        thread.daemon = True
+        thread.start()
+
+    nb_pulled = 0
+    try:
+        for _ in range(len(to_pull)):
+            try:
+                path, content = pulled.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                logger.warning(
+                    "prefetched {}/{} jumbo fields within {}s".format(
+                        nb_pulled, len(to_pull), timeout
+                    )
+                )
+                break
+            if content is not None:
+                # Caches are updated by this thread only
+                _set_cached(path, content)
+                nb_pulled += 1
+    finally:
+        # Threads still pulling are abandoned
+        stopped.set()
+    return nb_pulled
+
+
 def _log_message_too_long(message):
     if len(message) > constants.MAX_LOG_FIELD:
         message = "{} <...truncated to {} chars>".format(
@@ -199,6 +613,9 @@ def reason(message):
 
 
 def result(message):
+    signature = _jumbo_field_signature(message)
+    if signature:
+        return signature
     return encode(json_dumps(message), constants.MAX_RESULT_LENGTH)
 
 
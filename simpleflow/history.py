@@ -1,6 +1,28 @@
 import collections
 
-from simpleflow import logger
+from simpleflow import constants, logger
+from simpleflow.utils.json_tools import TransparentProxy
+
+# Event attributes holding the jumbo fields decoded by a replay; inputs and
+# controls are only decoded when used (see lazy_payload)
+JUMBO_FIELD_ATTRIBUTES = ("result", "details")
+
+
+def lazy_payload(event, name):
+    """
+    Get a payload (``input`` or ``control``) of an event, decoded on first
+    access: a history may hold thousands of task inputs, while a replay
+    only needs a few of them.
+
+    :param event:
+    :type event: swf.models.event.Event
+    :param name: "input" or "control"
+    :type name: str
+    :return: the decoded payload, or a proxy to it, serialized like it
+    """
+    if event.attributes.get(name) is None:
+        return getattr(event, name)  # default value
+    return TransparentProxy(lambda: getattr(event, name))
 
 
 # noinspection PyUnresolvedReferences
@@ -22,10 +44,22 @@ class History(object):
     :type _signals: collections.OrderedDict[str, dict[str, Any]]
     :ivar _markers: marker events
     :type _markers: collections.OrderedDict[str, list[dict[str, Any]]]
+    :ivar _signaled_workflows_index: signaled workflows, by (signal name, workflow ID, run ID)
+    :type _signaled_workflows_index: dict[(str, str, str), dict[str, Any]]
+    :ivar _signaled_workflows_any_run_index: first signaled workflows, by (signal name, workflow ID)
+    :type _signaled_workflows_any_run_index: dict[(str, str), dict[str, Any]]
+    :ivar _recorded_markers: last recorded marker events, by (marker name, JSON details)
+    :type _recorded_markers: dict[(str, Optional[str]), dict[str, Any]]
     :ivar _timers: timer events
     :type _timers: dict[str, dict[str, Any]]]
     :ivar _tasks: ordered list of tasks/etc
     :type _tasks: list[dict[str, Any]]
+    :ivar _parsed_events_count: number of events already parsed
+    :type _parsed_events_count: int
+    :ivar _jumbo_fields: signatures of the jumbo fields of the parsed events
+    :type _jumbo_fields: list[str]
+    :ivar _new_jumbo_fields_index: index of the first jumbo field found by the last parse
+    :type _new_jumbo_fields_index: int
     """
 
     def __init__(self, history):
@@ -37,12 +71,18 @@ class History(object):
         self._signals = collections.OrderedDict()
         self._signaled_workflows = collections.defaultdict(list)
         self._markers = collections.OrderedDict()
+        self._signaled_workflows_index = {}
+        self._signaled_workflows_any_run_index = {}
+        self._recorded_markers = {}
         self._timers = {}
         self._tasks = []
         self._cancel_requested = None
         self._cancel_failed = None
         self.started_decision_id = None
         self.completed_decision_id = None
+        self._parsed_events_count = 0
+        self._jumbo_fields = []
+        self._new_jumbo_fields_index = 0
 
     @property
     def swf_history(self):
@@ -53,6 +93,23 @@ class History(object):
         """
         return self._history
 
+    @property
+    def jumbo_fields(self):
+        """
+        :return: signatures of the jumbo fields of the parsed events that a
+            replay decodes, see JUMBO_FIELD_ATTRIBUTES
+        :rtype: list[str]
+        """
+        return self._jumbo_fields
+
+    @property
+    def new_jumbo_fields(self):
+        """
+        :return: signatures of the jumbo fields found by the last ``parse()``
+        :rtype: list[str]
+        """
+        return self._jumbo_fields[self._new_jumbo_fields_index :]
+
     @property
     def activities(self):
         """
@@ -138,6 +195,41 @@ class History(object):
         """
         return self._markers
 
+    def find_signaled_workflow(self, name, workflow_id, run_id, any_run=False):
+        """
+        Get the first workflow signaled with this signal name.
+
+        The run ID is matched exactly, so None only matches a run without ID,
+        unless `any_run` is set.
+
+        :param name: signal name
+        :type name: str
+        :param workflow_id: signaled workflow ID
+        :type workflow_id: str
+        :param run_id: signaled run ID
+        :type run_id: Optional[str]
+        :param any_run: match any run of the workflow, ignoring `run_id`
+        :type any_run: bool
+        :return: signaled workflow, if any
+        :rtype: Optional[dict[str, Any]]
+        """
+        if any_run:
+            return self._signaled_workflows_any_run_index.get((name, workflow_id))
+        return self._signaled_workflows_index.get((name, workflow_id, run_id))
+
+    def find_recorded_marker(self, name, details):
+        """
+        Get the last marker recorded with this name and details.
+
+        :param name: marker name
+        :type name: str
+        :param details: JSON-encoded details, as recorded
+        :type details: Optional[str]
+        :return: marker, if any
+        :rtype: Optional[dict[str, Any]]
+        """
+        return self._recorded_markers.get((name, details))
+
     @property
     def timers(self):
         # type: () -> Dict[str, Dict[str, Any]]
@@ -188,9 +280,9 @@ class History(object):
                 "state": event.state,
                 "scheduled_id": event.id,
                 "scheduled_timestamp": event.timestamp,
-                "input": event.input,
+                "input": lazy_payload(event, "input"),
                 "task_list": event.task_list["name"],
-                "control": event.control,
+                "control": lazy_payload(event, "control"),
                 "decision_task_completed_event_id": event.decision_task_completed_event_id,
             }
             if event.activity_id not in self._activities:
@@ -345,9 +437,9 @@ class History(object):
                 "raw_input": event.raw.get(
                     "input"
                 ),  # FIXME obsolete; any user out there?
-                "input": event.input,
+                "input": lazy_payload(event, "input"),
                 "child_policy": event.child_policy,
-                "control": event.control,
+                "control": lazy_payload(event, "control"),
                 "tag_list": getattr(event, "tag_list", None),
                 "task_list": event.task_list["name"],
                 "initiated_event_timestamp": event.timestamp,
@@ -381,7 +473,7 @@ class History(object):
                 "cause": event.cause,
                 "name": event.workflow_type["name"],
                 "version": event.workflow_type["version"],
-                "control": event.control,
+                "control": lazy_payload(event, "control"),
                 "start_failed_id": event.id,
                 "start_failed_timestamp": event.timestamp,
                 "decision_task_completed_event_id": event.decision_task_completed_event_id,
@@ -538,8 +630,8 @@ class History(object):
                 "signal_name": event.signal_name,
                 "state": event.state,
                 "initiated_event_id": event.id,
-                "input": event.input,
-                "control": event.control,
+                "input": lazy_payload(event, "input"),
+                "control": lazy_payload(event, "control"),
                 "initiated_event_timestamp": event.timestamp,
             }
             self._external_workflows_signaling[event.id] = workflow
@@ -566,13 +658,17 @@ class History(object):
                 }
             )
             self._signaled_workflows[workflow["signal_name"]].append(workflow)
+            key = (workflow["signal_name"], workflow["workflow_id"])
+            self._signaled_workflows_any_run_index.setdefault(key, workflow)
+            key += (workflow["run_id"],)
+            self._signaled_workflows_index.setdefault(key, workflow)
         elif event.state == "request_cancel_execution_initiated":
             workflow = {
                 "type": "external_workflow",
                 "id": event.workflow_id,
                 "run_id": getattr(event, "run_id", None),
                 "state": event.state,
-                "control": event.control,
+                "control": lazy_payload(event, "control"),
                 "initiated_event_id": event.id,
                 "initiated_event_timestamp": event.timestamp,
             }
@@ -619,6 +715,7 @@ class History(object):
                 "timestamp": event.timestamp,
             }
             self._markers.setdefault(event.marker_name, []).append(marker)
+            self._recorded_markers[marker["name"], marker["details"]] = marker
         elif event.state == "record_failed":
             marker = {
                 "type": "marker",
@@ -714,15 +811,51 @@ class History(object):
 
     def parse(self):
         """
-        Parse the events.
+        Parse the events not parsed yet.
         Update the corresponding statuses.
         """
 
-        events = self.events
-        for event in events:
+        # Events are consumed while the SWF history is loaded, the parsers
+        # only look up previous events.
+        events = self._history
+        self._new_jumbo_fields_index = len(self._jumbo_fields)
+        for index, event in enumerate(
+            events.iter_events(self._parsed_events_count), self._parsed_events_count,
+        ):
             parser = self.TYPE_TO_PARSER.get(event.type)
             if parser:
                 parser(self, events, event)
+            attributes = event.attributes
+            for name in JUMBO_FIELD_ATTRIBUTES:
+                value = attributes.get(name)
+                if value and value.startswith(constants.JUMBO_FIELDS_PREFIXES):
+                    self._jumbo_fields.append(value)
+            self._parsed_events_count = index + 1
+
+    def update(self, history):
+        """
+        Switch to a more recent SWF history of the same workflow execution,
+        so that the next ``parse()`` only processes the new events.
+
+        The history is left untouched if the events already parsed aren't a
+        prefix of the new one; a full parse is then required.
+
+        :param history: SWF history
+        :type history: swf.models.history.History
+        :return: whether the parsed state can be reused
+        :rtype: bool
+        """
+        count = self._parsed_events_count
+        if count:
+            try:
+                same_event = history[count - 1]
+            except IndexError:
+                return False
+            last_parsed = self._history[count - 1]
+            if last_parsed.id != same_event.id or last_parsed.raw != same_event.raw:
+                return False
+        self._history = history
+        return True
 
     @staticmethod
     def get_event_id(event):
@@ -1,21 +1,144 @@
 import abc
+import codecs
 import json
 import os
 import re
+import sys
+import threading
 import time
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict, namedtuple
+from typing import TYPE_CHECKING
+
+import psutil
+from future.moves import queue
 
 try:
     from urllib.parse import quote_plus  # py 3.x
 except ImportError:
     from urllib import quote_plus  # py 2.x
 
-from . import settings, storage
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from . import futures, logger, registry, settings, storage
 from .swf.stats.pretty import dump_history_to_json
+from .utils import issubclass_
 from .workflow import Workflow
 
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional  # NOQA
+
 ACTIVITY_KEY_RE = re.compile(r"activity\.(.+)\.json")
 
+# Seconds between two samples of the resources used by a step
+STEP_SAMPLE_INTERVAL = 1.0
+# Samples kept per step; beyond, every other sample is dropped and the
+# interval doubled
+STEP_MAX_SAMPLES = 256
+# Seconds the closing of a workflow waits for the metrology uploaded in the
+# background
+UPLOAD_WAIT_TIMEOUT = 60
+# Seconds between two checks of the metrology uploaded in the background
+UPLOAD_CHECK_INTERVAL = 5
+# Prefix of the timers waking up a workflow to check it again
+UPLOAD_TIMER_PREFIX = "_simpleflow_metrology_upload_"
+
+
+def _push_json(bucket, path, content):
+    """
+    Push a JSON document, streamed instead of being serialized in memory.
+    """
+    with storage.open_write(bucket, path, content_type="application/json") as f:
+        json.dump(content, codecs.getwriter("utf-8")(f), indent=2)
+
+
+def _pull_json(bucket, path):
+    with storage.open_read(bucket, path) as f:
+        return json.load(codecs.getreader("utf-8")(f))
+
+
+class BackgroundUploader(object):
+    """
+    Push JSON documents from a thread. The documents queued while the
+    thread uploads are pushed together, in parallel. The thread stops once
+    the queue is empty; it isn't a daemon, so the interpreter waits for it
+    before exiting.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None  # type: Optional[threading.Thread]
+        self._pid = os.getpid()
+
+    def push(self, bucket, path, content):
+        with self._lock:
+            if self._pid != os.getpid():
+                # The thread of the parent process isn't running here
+                self._queue = queue.Queue()
+                self._thread = None
+                self._pid = os.getpid()
+            self._queue.put((bucket, path, content))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.start()
+
+    def _next_batch(self):
+        with self._lock:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                self._thread = None
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            storage.map_parallel(self._push, batch)
+
+    @staticmethod
+    def _push(document):
+        bucket, path, content = document
+        try:
+            _push_json(bucket, path, content)
+        except Exception as err:
+            logger.exception("cannot push metrology {}: {}".format(path, err))
+
+    def wait(self, timeout=None):
+        """
+        Wait for the queued documents to be pushed.
+
+        :param timeout:
+        :type timeout: Optional[float]
+        :return: whether they were all pushed
+        :rtype: bool
+        """
+        with self._lock:
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is None:
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+
+BACKGROUND_UPLOADER = BackgroundUploader()
+
+
+def wait_for_uploads(timeout=None):
+    """
+    Wait for the metrology uploaded in the background, e.g. before the
+    process exits.
+    """
+    return BACKGROUND_UPLOADER.wait(timeout)
+
 
 class StepIO(object):
     def __init__(self):
@@ -41,8 +164,258 @@ class StepIO(object):
         )
 
 
+class LatencyHistogram(object):
+    """
+    HDR-style histogram: values are counted in buckets whose width grows
+    with the values, so that percentiles are within 1% of the recorded
+    values, whatever their range, in bounded memory.
+    """
+
+    # 2 ** (SUB_BUCKET_BITS - 1) buckets per power of two
+    SUB_BUCKET_BITS = 8
+    # Recorded values are counted in microseconds
+    UNIT = 1e-6
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self):
+        self.counts = defaultdict(int)  # type: Dict[int, int]
+        self.count = 0
+        self.total = 0.0
+        self.min = None  # type: Optional[float]
+        self.max = None  # type: Optional[float]
+
+    def _index(self, value):
+        shift = max(0, value.bit_length() - self.SUB_BUCKET_BITS)
+        return (shift << (self.SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+    def _highest_value(self, index):
+        """
+        Highest value counted in a bucket.
+        """
+        half = 1 << (self.SUB_BUCKET_BITS - 1)
+        shift = max(0, index // half - 1)
+        return ((index - (shift * half) + 1) << shift) - 1
+
+    def record(self, seconds, count=1):
+        """
+        :param seconds:
+        :type seconds: float
+        :param count: number of values
+        :type count: int
+        """
+        seconds = max(0.0, seconds)
+        self.counts[self._index(int(round(seconds / self.UNIT)))] += count
+        self.count += count
+        self.total += seconds * count
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, percentile):
+        """
+        :param percentile: between 0 and 100
+        :type percentile: float
+        :rtype: Optional[float]
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(round(percentile / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                break
+        return min(self.max, self._highest_value(index) * self.UNIT)
+
+    def get_stats(self):
+        if not self.count:
+            return None
+        stats = OrderedDict(
+            [
+                ("count", self.count),
+                ("min", self.min),
+                ("mean", self.total / self.count),
+                ("max", self.max),
+            ]
+        )
+        for percentile in self.PERCENTILES:
+            stats["p{:g}".format(percentile)] = self.percentile(percentile)
+        # To merge the histograms of several steps afterwards
+        stats["buckets"] = sorted(self.counts.items())
+        return stats
+
+
+def rss_high_water_mark():
+    """
+    Peak RSS of the process, if the platform reports it.
+
+    :return: bytes
+    :rtype: Optional[int]
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+# Cumulative counters of a step, since its start
+ResourceSample = namedtuple(
+    "ResourceSample",
+    (
+        "time",
+        "cpu",
+        "rss",
+        "io_read_bytes",
+        "io_write_bytes",
+        "read_bytes",
+        "read_records",
+        "write_bytes",
+        "write_records",
+    ),
+)
+
+
+class ResourceSampler(object):
+    """
+    Sample the resources used by the process, and the IO counters of a step,
+    from a thread, until it's stopped.
+    """
+
+    def __init__(self, step, interval):
+        """
+        :param step:
+        :type step: Step
+        :param interval: seconds between two samples
+        :type interval: float
+        """
+        self._step = step
+        self.interval = interval
+        self._process = psutil.Process()
+        self._start = self._measure()
+        self.samples = []  # type: List[ResourceSample]
+        # Highest sampled RSS, reported with the peak RSS of the process
+        self.rss_max = self._start.rss
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _measure(self):
+        cpu = self._process.cpu_times()
+        try:
+            io = self._process.io_counters()
+            io_read_bytes, io_write_bytes = io.read_bytes, io.write_bytes
+        except (AttributeError, NotImplementedError, psutil.AccessDenied):
+            # Not available on every platform
+            io_read_bytes = io_write_bytes = None
+        return ResourceSample(
+            time.time(),
+            cpu.user + cpu.system,
+            self._process.memory_info().rss,
+            io_read_bytes,
+            io_write_bytes,
+            self._step.read.bytes,
+            self._step.read.records,
+            self._step.write.bytes,
+            self._step.write.records,
+        )
+
+    def sample(self):
+        current = self._measure()
+        self.rss_max = max(self.rss_max, current.rss)
+        self.samples.append(
+            ResourceSample(
+                *(
+                    None if value is None else value - start
+                    for value, start in zip(current, self._start)
+                )
+            )._replace(rss=current.rss)
+        )
+        if len(self.samples) > STEP_MAX_SAMPLES:
+            self.samples = self.samples[1::2]
+            self.interval *= 2
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._thread.join()
+        self.sample()
+
+    def get_stats(self):
+        if not self.samples:
+            return None
+        last = self.samples[-1]
+        throughput = OrderedDict(
+            (name, 0.0)
+            for name in ("read_mb_s", "read_rec_s", "write_mb_s", "write_rec_s")
+        )
+        previous = ResourceSample(*[0] * len(ResourceSample._fields))
+        for sample in self.samples:
+            elapsed = sample.time - previous.time
+            if elapsed > 0:
+                for name, field, scale in (
+                    ("read_mb_s", "read_bytes", 1024 * 1024),
+                    ("read_rec_s", "read_records", 1),
+                    ("write_mb_s", "write_bytes", 1024 * 1024),
+                    ("write_rec_s", "write_records", 1),
+                ):
+                    rate = (
+                        (getattr(sample, field) - getattr(previous, field))
+                        / float(scale)
+                        / elapsed
+                    )
+                    throughput[name] = max(throughput[name], round(rate, 2))
+            previous = sample
+        return OrderedDict(
+            [
+                ("cpu", last.cpu),
+                # Both are tracked, and synchronized, in different ways
+                ("rss_max", max(self.rss_max, rss_high_water_mark() or 0)),
+                ("io_read_bytes", last.io_read_bytes),
+                ("io_write_bytes", last.io_write_bytes),
+                # Highest throughput over a sample interval
+                ("throughput_max", throughput),
+                (
+                    "timeline",
+                    OrderedDict(
+                        [
+                            ("interval", self.interval),
+                            ("columns", ResourceSample._fields),
+                            ("samples", [list(sample) for sample in self.samples]),
+                        ]
+                    ),
+                ),
+            ]
+        )
+
+
+class StepBatch(object):
+    def __init__(self, step):
+        self.step = step
+        self.time_started = None
+
+    def __enter__(self):
+        self.time_started = time.time()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.step.latency.record(time.time() - self.time_started)
+
+
 class Step(object):
-    def __init__(self, name, task):
+    """
+    Stats of a step. Its resources are sampled from a thread while it runs in
+    a `with` block, which stops it even if the step fails:
+    > with Step("my step", task) as step:
+    >     step.read.records += 1
+    """
+
+    def __init__(self, name, task, sample_interval=STEP_SAMPLE_INTERVAL):
         self.name = name
         self.task = task
         self.read = StepIO()
@@ -51,10 +424,40 @@ class Step(object):
         self.time_finished = None
         self.time_total = None
         self.metadata = {}
+        self.latency = LatencyHistogram()
+        self.sample_interval = sample_interval
+        self.resources = None  # type: Optional[ResourceSampler]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.done()
+
+    def start(self):
+        """
+        Start sampling the resources used by the step.
+        """
+        self.time_started = time.time()
+        if self.resources is None:
+            self.resources = ResourceSampler(self, self.sample_interval)
+
+    def batch(self):
+        """
+        Time a batch of records, in a `with` block, for the latency percentiles
+        Ex :
+        > for records in batches:
+        >     with step.batch():
+        >         process(records)
+        """
+        return StepBatch(self)
 
     def done(self):
         self.time_finished = time.time()
         self.time_total = self.time_finished - self.time_started
+        if self.resources is not None:
+            self.resources.stop()
 
     def get_stats(self):
         stats = OrderedDict(
@@ -66,6 +469,8 @@ class Step(object):
                 ("time_total", self.time_total),
                 ("read", self.read.get_stats(self.time_total)),
                 ("write", self.write.get_stats(self.time_total)),
+                ("latency", self.latency.get_stats()),
+                ("resources", self.resources.get_stats() if self.resources else None,),
             ]
         )
         return stats
@@ -80,13 +485,19 @@ class StepExecution(object):
         self.step = step
 
     def __enter__(self):
-        return self.step
+        return self.step.__enter__()
 
     def __exit__(self, type, value, traceback):
-        self.step.done()
+        self.step.__exit__(type, value, traceback)
 
 
 class MetrologyTask(object):
+    # Upload the stats in the background, so the task completes without
+    # waiting for them
+    background_upload = False
+    # Seconds between two samples of the resources used by the steps
+    step_sample_interval = STEP_SAMPLE_INTERVAL
+
     def can_upload(self):
         if not hasattr(self, "context"):
             return False
@@ -109,7 +520,7 @@ class MetrologyTask(object):
         > with self.step('My step') as step:
         >     step.records = 5
         """
-        step = Step(name, self)
+        step = Step(name, self, self.step_sample_interval)
         step_exec = StepExecution(step)
         if not hasattr(self, "steps"):
             self.steps = []
@@ -125,12 +536,12 @@ class MetrologyTask(object):
         for step in getattr(self, "steps", []):
             content["steps"].append(step.get_stats())
 
-        storage.push_content(
-            settings.METROLOGY_BUCKET,
-            self.metrology_path,
-            json.dumps(content, indent=2),
-            content_type="application/json",
-        )
+        if self.background_upload:
+            BACKGROUND_UPLOADER.push(
+                settings.METROLOGY_BUCKET, self.metrology_path, content
+            )
+        else:
+            _push_json(settings.METROLOGY_BUCKET, self.metrology_path, content)
 
     @abc.abstractmethod
     def execute(self):
@@ -141,6 +552,10 @@ class MetrologyTask(object):
 
 
 class MetrologyWorkflow(Workflow):
+    def before_close(self, history):
+        super(MetrologyWorkflow, self).before_close(history)
+        self.wait_for_background_uploads(history)
+
     def after_closed(self, history):
         super(MetrologyWorkflow, self).after_closed(history)
         return self.push_metrology(history)
@@ -160,27 +575,91 @@ class MetrologyWorkflow(Workflow):
         """
         Fetch workflow history and merge it with metrology
         """
+        # Uploaded by this process when running locally
+        wait_for_uploads()
+        prefix = os.path.join(self.metrology_path, "activity.")
         activity_keys = [
-            obj
-            for obj in storage.list_keys(settings.METROLOGY_BUCKET, self.metrology_path)
+            obj.key
+            for obj in storage.list_keys(settings.METROLOGY_BUCKET, prefix)
+            if obj.key.startswith(prefix)
         ]
         history_dumped = dump_history_to_json(history)
         history = json.loads(history_dumped)
 
-        for key in activity_keys:
-            if not key.key.startswith(os.path.join(self.metrology_path, "activity.")):
-                continue
-            contents = key.get_contents_as_string(encoding="utf-8")
-            result = json.loads(contents)
-            search = ACTIVITY_KEY_RE.search(key.name)
-            name = search.group(1)
-            for h in history:
-                if h[0] == name:
-                    h[1]["metrology"] = result
-
-        storage.push_content(
+        events_by_name = defaultdict(list)
+        for name, event in history:
+            events_by_name[name].append(event)
+
+        results = storage.map_parallel(
+            lambda key: _pull_json(settings.METROLOGY_BUCKET, key), activity_keys
+        )
+        for key, result in zip(activity_keys, results):
+            name = ACTIVITY_KEY_RE.search(key).group(1)
+            for event in events_by_name.get(name, ()):
+                event["metrology"] = result
+
+        _push_json(
             settings.METROLOGY_BUCKET,
             os.path.join(self.metrology_path, "metrology.json"),
-            json.dumps(history, indent=2),
-            content_type="application/json",
+            history,
+        )
+
+    def wait_for_background_uploads(self, history):
+        """
+        Delay the closing while the workers of completed activities may still
+        be uploading their metrology in the background, for up to
+        UPLOAD_WAIT_TIMEOUT seconds. The uploads are checked once per decision,
+        and a timer wakes the workflow up to check them again.
+
+        :type history: simpleflow.history.History
+        """
+        timer_ids = [
+            timer_id
+            for timer_id in history.timers
+            if timer_id.startswith(UPLOAD_TIMER_PREFIX)
+        ]
+        for timer_id in timer_ids:
+            if history.timers[timer_id]["state"] == "started":
+                # Not fired yet
+                futures.wait(
+                    self.submit(self.start_timer(timer_id, UPLOAD_CHECK_INTERVAL))
+                )
+
+        missing = self.missing_background_uploads(history)
+        if not missing:
+            return
+        if len(timer_ids) * UPLOAD_CHECK_INTERVAL >= UPLOAD_WAIT_TIMEOUT:
+            logger.warning(
+                "metrology not uploaded after {}s: {}".format(
+                    UPLOAD_WAIT_TIMEOUT, ", ".join(missing)
+                )
+            )
+            return
+        timer_id = "{}{}".format(UPLOAD_TIMER_PREFIX, len(timer_ids))
+        futures.wait(self.submit(self.start_timer(timer_id, UPLOAD_CHECK_INTERVAL)))
+
+    def missing_background_uploads(self, history):
+        """
+        Keys of the metrology of the completed activities uploading it in the
+        background that isn't uploaded yet. Only the activities registered in
+        this process, e.g. by importing the workflow module, are considered.
+
+        :type history: simpleflow.history.History
+        :rtype: List[str]
+        """
+        activities = registry.registry[None]
+        expected = []
+        for activity in history.activities.values():
+            if activity["state"] != "completed" or activity["name"] not in activities:
+                continue
+            task = activities[activity["name"]].callable
+            if issubclass_(task, MetrologyTask) and task.background_upload:
+                expected.append(
+                    os.path.join(
+                        self.metrology_path, "activity.{}.json".format(activity["id"])
+                    )
+                )
+        found = storage.map_parallel(
+            lambda key: storage.exists(settings.METROLOGY_BUCKET, key), expected
         )
+        return [key for key, exists in zip(expected, found) if not exists]
@@ -69,6 +69,8 @@ SIMPLEFLOW_SYSLOG_TARGET = str_or_none
 
 SIMPLEFLOW_S3_HOST = str
 SIMPLEFLOW_S3_SSE = bool
+SIMPLEFLOW_S3_PART_SIZE = int
+SIMPLEFLOW_S3_CONCURRENCY = int
 
 STEP_BUCKET = str
 
@@ -77,5 +79,7 @@ METROLOGY_PATH_PREFIX = str_or_none
 
 SIMPLEFLOW_ENABLE_DISK_CACHE = bool
 SIMPLEFLOW_BINARIES_DIRECTORY = str
+SIMPLEFLOW_BINARIES_CACHE_SIZE = int
+SIMPLEFLOW_BINARIES_DOWNLOAD_CONCURRENCY = int
 
 ACTIVITY_SIGTERM_WAIT_SEC = float
@@ -16,6 +16,10 @@ ACTIVITY_HEARTBEAT_TIMEOUT = ACTIVITY_DEFAULT_TIMEOUT
 
 SIMPLEFLOW_S3_HOST = "s3.amazonaws.com"
 SIMPLEFLOW_S3_SSE = False
+# Objects larger than this are transferred in parts (bytes, at least 5MB)
+SIMPLEFLOW_S3_PART_SIZE = 8 * 1024 ** 2
+# Parts transferred in parallel
+SIMPLEFLOW_S3_CONCURRENCY = 8
 
 STEP_BUCKET = "step_bucket"
 
@@ -53,6 +57,9 @@ SIMPLEFLOW_SYSLOG_TARGET = None
 
 SIMPLEFLOW_ENABLE_DISK_CACHE = False
 SIMPLEFLOW_BINARIES_DIRECTORY = "/tmp/simpleflow-binaries"
+# Disk budget of the downloaded binaries (bytes, 0 for no limit)
+SIMPLEFLOW_BINARIES_CACHE_SIZE = 5 * 1024 ** 3
+SIMPLEFLOW_BINARIES_DOWNLOAD_CONCURRENCY = 4
 
 # Activity management
 
@@ -1,21 +1,45 @@
+import codecs
+import contextlib
+import errno
+import io
+import mimetypes
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 from typing import TYPE_CHECKING
 
 from boto.exception import S3ResponseError
 from boto.s3 import connect_to_region, connection
 from boto.s3.key import Key
+from boto.s3.multipart import MultiPartUpload
 
 from . import logger, settings
 
 if TYPE_CHECKING:
-    from typing import Optional, Tuple  # NOQA
+    from typing import Any, Callable, IO, Iterable, List, Optional, Tuple, Union  # NOQA
     from boto.s3.bucket import Bucket  # NOQA
-    from boto.s3.bucketlistresultset import BucketListResultSet  # NOQA
 
-BUCKET_CACHE = {}
 BUCKET_LOCATIONS_CACHE = {}
 
+# Size of the written data kept in memory before spilling to a temporary file
+WRITE_BUFFER_SIZE = 1024 ** 2
 
-def get_connection(host_or_region):
+# Size, ETag (if the backend has one) and MD5 (if known) of an object
+ObjectInfo = namedtuple("ObjectInfo", ("size", "etag", "md5"))
+
+# Prefix of the temporary files written by the filesystem backend
+TEMPORARY_FILE_PREFIX = ".simpleflow-tmp-"
+# Permissions of the files written by the filesystem backend
+FILE_MODE = 0o644
+# Size of the chunks of files copied by the filesystem backend
+CHUNK_SIZE = 1024 ** 2
+
+
+def _connect(host_or_region):
     # type: (str) -> connection.S3Connection
     # first case: we got a valid DNS (host)
     if "." in host_or_region:
@@ -25,6 +49,47 @@ def get_connection(host_or_region):
     return connect_to_region(host_or_region)
 
 
+class _ConnectionCache(threading.local):
+    """
+    Connections and buckets of the current thread. A boto connection isn't
+    thread-safe: the threads of map_parallel() or of an S3WriteStream each
+    use their own.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.connections = {}
+        self.buckets = {}
+
+    def check_pid(self):
+        """
+        Drop the connections inherited from a parent process: their sockets
+        are shared with it.
+        """
+        if os.getpid() != self.pid:
+            self.connections.clear()
+            self.buckets.clear()
+            self.pid = os.getpid()
+
+
+CONNECTION_CACHE = _ConnectionCache()
+
+
+def get_connection(host_or_region):
+    # type: (str) -> connection.S3Connection
+    """
+    Get the connection to a host or region, shared by the calls of a thread.
+    A boto connection keeps a pool of HTTP connections, reused by its
+    requests.
+    """
+    CONNECTION_CACHE.check_pid()
+    connections = CONNECTION_CACHE.connections
+    conn = connections.get(host_or_region)
+    if conn is None:
+        conn = connections[host_or_region] = _connect(host_or_region)
+    return conn
+
+
 def sanitize_bucket_and_host(bucket):
     # type: (str) -> Tuple[str, str]
     """
@@ -81,51 +146,750 @@ def get_bucket(bucket_name):
     # type: (str) -> Bucket
     bucket_name, location = sanitize_bucket_and_host(bucket_name)
     conn = get_connection(location)
-    if bucket_name not in BUCKET_CACHE:
+    buckets = CONNECTION_CACHE.buckets
+    if bucket_name not in buckets:
         bucket = conn.get_bucket(bucket_name, validate=False)
-        BUCKET_CACHE[bucket_name] = bucket
-    return BUCKET_CACHE[bucket_name]
+        buckets[bucket_name] = bucket
+    return buckets[bucket_name]
+
+
+class StorageBackend(object):
+    """
+    Storage of objects by bucket and path.
+
+    The functions of this module take a bucket argument, which is either an S3
+    bucket name or a URL whose scheme selects a backend: ``s3://bucket`` or
+    ``file:///root/directory``. The backend gets the rest of the URL.
+    """
+
+    def split(self, location):
+        """
+        Split a URL without its scheme into bucket and path.
+
+        :type location: str
+        :rtype: (str, str)
+        """
+        raise NotImplementedError
+
+    def url(self, bucket, path):
+        """
+        :return: URL of an object
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def connect(self, bucket):
+        """
+        Prepare the access to a bucket, e.g. before using it from several
+        threads.
+        """
+
+    def pull(self, bucket, path, dest_file):
+        raise NotImplementedError
+
+    def pull_content(self, bucket, path, encoding="utf-8"):
+        raise NotImplementedError
+
+    def exists(self, bucket, path):
+        raise NotImplementedError
+
+    def stat(self, bucket, path):
+        """
+        :rtype: ObjectInfo
+        """
+        raise NotImplementedError
+
+    def push(self, bucket, path, src_file, content_type=None):
+        raise NotImplementedError
+
+    def push_content(self, bucket, path, content, content_type=None):
+        raise NotImplementedError
+
+    def push_stream(self, bucket, path, fileobj, content_type=None):
+        raise NotImplementedError
+
+    def list_keys(self, bucket, path=None):
+        """
+        :return: objects whose path starts with `path`, sorted by path; they
+            have `key`, `name`, `size` and `get_contents_as_string()`
+            attributes like boto keys
+        """
+        raise NotImplementedError
+
+    def open_read(self, bucket, path):
+        """
+        :return: binary file object streaming the content of an object
+        :rtype: IO[bytes]
+        """
+        raise NotImplementedError
+
+    def open_write(self, bucket, path, content_type=None):
+        """
+        :return: binary file object storing what is written to it when closed;
+            nothing is stored if the `with` block exits with an exception
+        :rtype: IO[bytes]
+        """
+        raise NotImplementedError
+
+
+def map_parallel(func, items, concurrency=None):
+    # type: (Callable, List, Optional[int]) -> List
+    """
+    Call a function on items in up to `concurrency` threads, by default
+    SIMPLEFLOW_S3_CONCURRENCY.
+
+    :return: results, in the order of the items
+    """
+    if concurrency is None:
+        concurrency = settings.SIMPLEFLOW_S3_CONCURRENCY
+    concurrency = min(concurrency, len(items))
+    if concurrency < 2:
+        return [func(item) for item in items]
+    pool = ThreadPool(concurrency)
+    try:
+        return pool.map(func, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _thread_upload(bucket_name, upload):
+    # type: (str, MultiPartUpload) -> MultiPartUpload
+    """
+    Multipart upload sent through the connection of the current thread.
+    """
+    thread_upload = MultiPartUpload(get_bucket(bucket_name))
+    thread_upload.key_name = upload.key_name
+    thread_upload.id = upload.id
+    return thread_upload
+
+
+def _split_parts(size, part_size):
+    # type: (int, int) -> List[Tuple[int, int, int]]
+    """
+    :return: number (from 1), offset and size of each part
+    """
+    return [
+        (number, offset, min(part_size, size - offset))
+        for number, offset in enumerate(range(0, size, part_size), 1)
+    ]
+
+
+class S3ReadStream(io.RawIOBase):
+    """
+    Content of an S3 object, streamed from a single GET.
+    """
+
+    def __init__(self, key):
+        super(S3ReadStream, self).__init__()
+        self._key = key
+        self._eof = False
+        key.open_read()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._eof:
+            return 0
+        # Key.read() opens the key again once it's consumed: don't call it
+        data = self._key.read(len(b))
+        if not data:
+            self._eof = True
+            return 0
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._key.close(fast=not self._eof)
+        super(S3ReadStream, self).close()
+
+
+class S3WriteStream(io.RawIOBase):
+    """
+    Upload to an S3 object. Objects larger than SIMPLEFLOW_S3_PART_SIZE are
+    sent as multipart uploads, whose parts are uploaded in parallel while the
+    next ones are written.
+    """
+
+    def __init__(self, bucket, path, headers):
+        """
+        :param bucket: bucket name, as passed to get_bucket()
+        :type bucket: str
+        :type path: str
+        :type headers: dict
+        """
+        super(S3WriteStream, self).__init__()
+        self._bucket = bucket
+        self._path = path
+        self._headers = headers
+        self._part_size = settings.SIMPLEFLOW_S3_PART_SIZE
+        self._concurrency = max(1, settings.SIMPLEFLOW_S3_CONCURRENCY)
+        self._part = self._new_part()
+        self._part_number = 0
+        self._upload = None
+        self._pool = None  # type: Optional[ThreadPool]
+        self._results = []
+        # Bound the number of parts written but not uploaded yet
+        self._pending = threading.BoundedSemaphore(self._concurrency)
+
+    @staticmethod
+    def _new_part():
+        return tempfile.SpooledTemporaryFile(max_size=WRITE_BUFFER_SIZE)
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        b = memoryview(b)
+        written = 0
+        while written < len(b):
+            room = self._part_size - self._part.tell()
+            chunk = b[written : written + room]
+            self._part.write(chunk.tobytes())
+            written += len(chunk)
+            if self._part.tell() >= self._part_size:
+                self._flush_part()
+        return written
+
+    def _flush_part(self):
+        if self._upload is None:
+            self._upload = get_bucket(self._bucket).initiate_multipart_upload(
+                self._path,
+                headers=self._headers,
+                encrypt_key=settings.SIMPLEFLOW_S3_SSE,
+            )
+            self._pool = ThreadPool(self._concurrency)
+        for result in self._results:
+            # Fail early
+            if result.ready():
+                result.get()
+        part, self._part = self._part, self._new_part()
+        self._part_number += 1
+        self._pending.acquire()
+        self._results.append(
+            self._pool.apply_async(self._upload_part, (part, self._part_number))
+        )
+
+    def _upload_part(self, part, number):
+        try:
+            part.seek(0)
+            # The headers avoid guessing the type from the temporary file name
+            _thread_upload(self._bucket, self._upload).upload_part_from_file(
+                part, number, headers=self._headers
+            )
+        finally:
+            part.close()
+            self._pending.release()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._upload is None:
+                self._part.seek(0)
+                Key(get_bucket(self._bucket), self._path).set_contents_from_file(
+                    self._part,
+                    headers=self._headers,
+                    encrypt_key=settings.SIMPLEFLOW_S3_SSE,
+                )
+            else:
+                if self._part.tell():
+                    self._flush_part()
+                for result in self._results:
+                    result.get()
+                self._upload.complete_upload()
+        except BaseException:
+            self.abort()
+            raise
+        self._cleanup()
+
+    def abort(self):
+        """
+        Close without storing anything.
+        """
+        if self.closed:
+            return
+        try:
+            if self._pool:
+                self._pool.close()
+                self._pool.join()
+            if self._upload is not None:
+                self._upload.cancel_upload()
+        finally:
+            self._cleanup()
+
+    def _cleanup(self):
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self._part.close()
+        super(S3WriteStream, self).close()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class S3Backend(StorageBackend):
+    def split(self, location):
+        bucket, _, path = location.partition("/")
+        return bucket, path
+
+    def url(self, bucket, path):
+        return "s3://{}/{}".format(bucket, path)
+
+    def connect(self, bucket):
+        get_bucket(bucket)
+
+    def pull(self, bucket, path, dest_file):
+        bucket_name = bucket
+        bucket = get_bucket(bucket)
+        key = bucket.get_key(path)
+        size = key.size
+        part_size = settings.SIMPLEFLOW_S3_PART_SIZE
+        if size <= part_size or settings.SIMPLEFLOW_S3_CONCURRENCY < 2:
+            key.get_contents_to_filename(dest_file)
+            return
+
+        def pull_part(part):
+            _, offset, part_size = part
+            headers = {
+                "Range": "bytes={}-{}".format(offset, offset + part_size - 1),
+                # Don't mix versions if the object is replaced meanwhile
+                "If-Match": key.etag,
+            }
+            with open(dest_file, "r+b") as f:
+                f.seek(offset)
+                # Through the connection of this thread
+                Key(get_bucket(bucket_name), path).get_contents_to_file(
+                    f, headers=headers
+                )
+
+        with open(dest_file, "wb") as f:
+            f.truncate(size)
+        try:
+            map_parallel(pull_part, _split_parts(size, part_size))
+        except BaseException:
+            os.remove(dest_file)
+            raise
+
+    def pull_content(self, bucket, path, encoding="utf-8"):
+        bucket = get_bucket(bucket)
+        key = bucket.get_key(path)
+        return key.get_contents_as_string(encoding=encoding)
+
+    def exists(self, bucket, path):
+        bucket = get_bucket(bucket)
+        return bucket.get_key(path) is not None
+
+    def stat(self, bucket, path):
+        key = get_bucket(bucket).get_key(path)
+        if key is None:
+            raise IOError(errno.ENOENT, "no such key", path)
+        etag = key.etag.strip('"')
+        # The ETag is the MD5 of the content, except for multipart uploads
+        # and objects encrypted with KMS keys
+        md5 = etag if "-" not in etag and key.encrypted != "aws:kms" else None
+        return ObjectInfo(key.size, etag, md5)
+
+    def push(self, bucket, path, src_file, content_type=None):
+        bucket_name = bucket
+        bucket = get_bucket(bucket)
+        size = os.path.getsize(src_file)
+        part_size = settings.SIMPLEFLOW_S3_PART_SIZE
+        if size <= part_size:
+            key = Key(bucket, path)
+            headers = {}
+            if content_type:
+                headers["content_type"] = content_type
+            key.set_contents_from_filename(
+                src_file, headers=headers, encrypt_key=settings.SIMPLEFLOW_S3_SSE
+            )
+            return
+
+        # Guessed like boto does for single uploads
+        headers = {
+            "Content-Type": content_type
+            or mimetypes.guess_type(src_file)[0]
+            or Key.DefaultContentType
+        }
+        upload = bucket.initiate_multipart_upload(
+            path, headers=headers, encrypt_key=settings.SIMPLEFLOW_S3_SSE
+        )
+
+        def push_part(part):
+            number, offset, part_size = part
+            with open(src_file, "rb") as f:
+                f.seek(offset)
+                _thread_upload(bucket_name, upload).upload_part_from_file(
+                    f, number, size=part_size
+                )
+
+        try:
+            map_parallel(push_part, _split_parts(size, part_size))
+            upload.complete_upload()
+        except BaseException:
+            upload.cancel_upload()
+            raise
+
+    def push_content(self, bucket, path, content, content_type=None):
+        bucket = get_bucket(bucket)
+        key = Key(bucket, path)
+        headers = {}
+        if content_type:
+            headers["content_type"] = content_type
+        key.set_contents_from_string(
+            content, headers=headers, encrypt_key=settings.SIMPLEFLOW_S3_SSE
+        )
+
+    def push_stream(self, bucket, path, fileobj, content_type=None):
+        with self.open_write(bucket, path, content_type) as f:
+            shutil.copyfileobj(fileobj, f, settings.SIMPLEFLOW_S3_PART_SIZE)
+
+    def list_keys(self, bucket, path=None):
+        bucket = get_bucket(bucket)
+        return bucket.list(path)
+
+    def open_read(self, bucket, path):
+        key = Key(get_bucket(bucket), path)
+        return io.BufferedReader(S3ReadStream(key))
+
+    def open_write(self, bucket, path, content_type=None):
+        # Not guessed from the file name: there is none
+        headers = {"Content-Type": content_type or Key.DefaultContentType}
+        return S3WriteStream(bucket, path, headers)
+
+
+class FileKey(object):
+    """
+    Object stored by the filesystem backend, mimicking a boto key.
+    """
+
+    def __init__(self, root, key):
+        self.root = root
+        self.key = self.name = key
+        self.filename = os.path.join(root, key)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.filename)
+
+    def get_contents_as_string(self, encoding=None):
+        return read_file(self.filename, encoding)
+
+
+@contextlib.contextmanager
+def map_file(filename):
+    """
+    Map a file in memory, read-only: its content is read from the page
+    cache, without being copied.
+
+    :type filename: str
+    :rtype: Iterator[Union[mmap.mmap, bytes]]
+    """
+    with open(filename, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            # Empty files can't be mapped
+            yield b""
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def read_file(filename, encoding=None):
+    """
+    Read a file through a memory mapping. Its text is decoded from the
+    mapping, without an intermediate copy of its bytes.
+
+    :type filename: str
+    :type encoding: Optional[str]
+    :rtype: Union[str, bytes]
+    """
+    with map_file(filename) as mapped:
+        if not encoding:
+            return mapped[:]
+        return codecs.decode(mapped, encoding)
+
+
+class AtomicFile(io.FileIO):
+    """
+    File written to a temporary file, renamed to its final name when closed,
+    so readers never see it partially written. It's discarded if the `with`
+    block exits with an exception.
+    """
+
+    def __init__(self, filename):
+        directory = os.path.dirname(filename) or "."
+        try:
+            os.makedirs(directory)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        fd, self._tmp_filename = tempfile.mkstemp(
+            dir=directory, prefix=TEMPORARY_FILE_PREFIX
+        )
+        self._filename = filename
+        super(AtomicFile, self).__init__(fd, "wb")
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super(AtomicFile, self).close()
+            # mkstemp() creates files only readable by their owner
+            os.chmod(self._tmp_filename, FILE_MODE)
+            os.rename(self._tmp_filename, self._filename)
+        except BaseException:
+            self._remove()
+            raise
+
+    def abort(self):
+        """
+        Close without storing anything.
+        """
+        if self.closed:
+            return
+        super(AtomicFile, self).close()
+        self._remove()
+
+    def _remove(self):
+        try:
+            os.remove(self._tmp_filename)
+        except OSError:
+            pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class FileSystemBackend(StorageBackend):
+    """
+    Objects stored as files under a root directory, e.g. on a shared
+    filesystem. Files are written to a temporary file first, then renamed,
+    so readers never see partial objects.
+    """
+
+    def split(self, location):
+        # No bucket: the path is absolute
+        return "/", location.lstrip("/")
+
+    def url(self, bucket, path):
+        return "file://" + os.path.join(bucket, path)
+
+    @staticmethod
+    def _filename(bucket, path):
+        return os.path.join(bucket, path)
+
+    @staticmethod
+    def _write(filename, write):
+        """
+        Write a file atomically.
+
+        :param filename:
+        :type filename: str
+        :param write: writes the content to the given file object
+        :type write: Callable[[IO[bytes]], None]
+        """
+        with AtomicFile(filename) as f:
+            write(f)
+
+    def pull(self, bucket, path, dest_file):
+        src_file = self._filename(bucket, path)
+        # Streamed: the file may be too large to fit in memory
+        with open(src_file, "rb") as src:
+            self._write(dest_file, lambda f: shutil.copyfileobj(src, f, CHUNK_SIZE))
+
+    def pull_content(self, bucket, path, encoding="utf-8"):
+        return read_file(self._filename(bucket, path), encoding)
+
+    def exists(self, bucket, path):
+        return os.path.isfile(self._filename(bucket, path))
+
+    def stat(self, bucket, path):
+        return ObjectInfo(os.path.getsize(self._filename(bucket, path)), None, None)
+
+    def push(self, bucket, path, src_file, content_type=None):
+        with open(src_file, "rb") as src:
+            self.push_stream(bucket, path, src)
+
+    def push_content(self, bucket, path, content, content_type=None):
+        if not isinstance(content, bytes):
+            content = content.encode("utf-8")
+        self._write(self._filename(bucket, path), lambda f: f.write(content))
+
+    def push_stream(self, bucket, path, fileobj, content_type=None):
+        self._write(
+            self._filename(bucket, path), lambda f: shutil.copyfileobj(fileobj, f)
+        )
+
+    def list_keys(self, bucket, path=None):
+        prefix = path or ""
+        # Only walk the directory holding the prefix
+        top = os.path.join(bucket, os.path.dirname(prefix))
+        keys = []
+        for directory, _, filenames in os.walk(top):
+            for filename in filenames:
+                if filename.startswith(TEMPORARY_FILE_PREFIX):
+                    continue
+                key = os.path.relpath(os.path.join(directory, filename), bucket)
+                if key.startswith(prefix):
+                    keys.append(FileKey(bucket, key))
+        return sorted(keys, key=lambda k: k.key)
+
+    def open_read(self, bucket, path):
+        return open(self._filename(bucket, path), "rb")
+
+    def open_write(self, bucket, path, content_type=None):
+        return AtomicFile(self._filename(bucket, path))
+
+
+# Storage backends, by URL scheme
+BACKENDS = {
+    "s3": S3Backend(),
+    "file": FileSystemBackend(),
+}
+
+
+def register_backend(scheme, backend):
+    # type: (str, StorageBackend) -> None
+    BACKENDS[scheme] = backend
+
+
+def get_backend(bucket):
+    # type: (str) -> Tuple[StorageBackend, str]
+    """
+    Get the backend of a bucket.
+
+    :param bucket: S3 bucket name, or URL
+    :return: backend, and bucket argument for the backend
+    """
+    scheme, sep, location = bucket.partition("://")
+    if not sep:
+        return BACKENDS["s3"], bucket
+    try:
+        backend = BACKENDS[scheme]
+    except KeyError:
+        raise ValueError("unknown storage scheme: {}".format(bucket))
+    if scheme == "file":
+        return backend, location or "/"
+    return backend, location
+
+
+def split_url(url):
+    # type: (str) -> Tuple[str, str]
+    """
+    Split a URL into the bucket and path arguments of this module's functions.
+
+        >>> split_url("s3://bucket/path/to/key")
+        ('bucket', 'path/to/key')
+        >>> split_url("file:///path/to/file")
+        ('file:///', 'path/to/file')
+    """
+    scheme, sep, location = url.partition("://")
+    if not sep or scheme not in BACKENDS:
+        raise ValueError("unknown storage URL: {}".format(url))
+    bucket, path = BACKENDS[scheme].split(location)
+    if scheme != "s3":
+        bucket = "{}://{}".format(scheme, bucket)
+    return bucket, path
+
+
+def get_url(bucket, path):
+    # type: (str, str) -> str
+    """
+    :return: URL of an object; the reverse of `split_url`
+    """
+    backend, bucket = get_backend(bucket)
+    return backend.url(bucket, path)
+
+
+def connect(bucket):
+    # type: (str) -> None
+    backend, bucket = get_backend(bucket)
+    backend.connect(bucket)
 
 
 def pull(bucket, path, dest_file):
     # type: (str, str, str) -> None
-    bucket = get_bucket(bucket)
-    key = bucket.get_key(path)
-    key.get_contents_to_filename(dest_file)
+    backend, bucket = get_backend(bucket)
+    backend.pull(bucket, path, dest_file)
 
 
-def pull_content(bucket, path):
-    # type: (str, str) -> str
-    bucket = get_bucket(bucket)
-    key = bucket.get_key(path)
-    return key.get_contents_as_string(encoding="utf-8")
+def pull_content(bucket, path, encoding="utf-8"):
+    # type: (str, str, Optional[str]) -> Union[str, bytes]
+    backend, bucket = get_backend(bucket)
+    return backend.pull_content(bucket, path, encoding=encoding)
+
+
+def exists(bucket, path):
+    # type: (str, str) -> bool
+    backend, bucket = get_backend(bucket)
+    return backend.exists(bucket, path)
+
+
+def stat(bucket, path):
+    # type: (str, str) -> ObjectInfo
+    backend, bucket = get_backend(bucket)
+    return backend.stat(bucket, path)
 
 
 def push(bucket, path, src_file, content_type=None):
     # type: (str, str, str, Optional[str]) -> None
-    bucket = get_bucket(bucket)
-    key = Key(bucket, path)
-    headers = {}
-    if content_type:
-        headers["content_type"] = content_type
-    key.set_contents_from_filename(
-        src_file, headers=headers, encrypt_key=settings.SIMPLEFLOW_S3_SSE
-    )
+    backend, bucket = get_backend(bucket)
+    backend.push(bucket, path, src_file, content_type=content_type)
 
 
 def push_content(bucket, path, content, content_type=None):
     # type: (str, str, str, Optional[str]) -> None
-    bucket = get_bucket(bucket)
-    key = Key(bucket, path)
-    headers = {}
-    if content_type:
-        headers["content_type"] = content_type
-    key.set_contents_from_string(
-        content, headers=headers, encrypt_key=settings.SIMPLEFLOW_S3_SSE
-    )
+    backend, bucket = get_backend(bucket)
+    backend.push_content(bucket, path, content, content_type=content_type)
+
+
+def push_stream(bucket, path, fileobj, content_type=None):
+    # type: (str, str, IO[bytes], Optional[str]) -> None
+    backend, bucket = get_backend(bucket)
+    backend.push_stream(bucket, path, fileobj, content_type=content_type)
 
 
 def list_keys(bucket, path=None):
-    # type: (str, str) -> BucketListResultSet
-    bucket = get_bucket(bucket)
-    return bucket.list(path)
+    # type: (str, Optional[str]) -> Iterable
+    backend, bucket = get_backend(bucket)
+    return backend.list_keys(bucket, path)
+
+
+def open_read(bucket, path):
+    # type: (str, str) -> IO[bytes]
+    """
+    Stream the content of an object.
+
+        with open_read("bucket", "path") as f:
+            for line in f:
+                pass
+    """
+    backend, bucket = get_backend(bucket)
+    return backend.open_read(bucket, path)
+
+
+def open_write(bucket, path, content_type=None):
+    # type: (str, str, Optional[str]) -> IO[bytes]
+    """
+    Stream the content of an object. It's stored when the file is closed,
+    unless the `with` block exits with an exception.
+
+        with open_write("bucket", "path") as f:
+            f.write(b"content")
+    """
+    backend, bucket = get_backend(bucket)
+    return backend.open_write(bucket, path, content_type=content_type)
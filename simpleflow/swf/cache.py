@@ -0,0 +1,85 @@
+from __future__ import absolute_import
+
+import collections
+
+from simpleflow.swf import constants
+
+
+class RunCache(object):
+    """
+    State kept by a decider for a workflow execution between two decision
+    tasks.
+
+    :ivar history: parsed history, updated incrementally on each decision.
+    :type history: Optional[simpleflow.history.History]
+    :ivar futures: futures of the tasks known to be completed, by task ID.
+    :type futures: dict[str, simpleflow.futures.Future]
+    :ivar argument_hashes: hashes of idempotent task arguments, by identity
+        of the (immutable) arguments, least recently used first; see
+        ``Executor._hash_arguments``.
+    :type argument_hashes: collections.OrderedDict[tuple, (tuple, dict, str)]
+    """
+
+    def __init__(self):
+        self.history = None
+        self.futures = {}
+        self.argument_hashes = collections.OrderedDict()
+
+    def reset(self):
+        """
+        Forget everything, e.g. when the history doesn't match the cached one.
+        """
+        self.history = None
+        self.futures = {}
+        self.argument_hashes = collections.OrderedDict()
+
+
+class DeciderCache(object):
+    """
+    LRU of :py:class:`RunCache` objects, by workflow ID and run ID.
+
+    It only lives as long as the process holding it: with the default
+    fork-per-decision model, it is discarded with the decision process.
+    """
+
+    def __init__(self, max_size=None):
+        if max_size is None:
+            max_size = constants.DECIDER_CACHE_SIZE
+        self.max_size = max_size
+        self._runs = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._runs)
+
+    def __contains__(self, key):
+        return key in self._runs
+
+    def get(self, workflow_id, run_id):
+        """
+        Get the cached state of an execution, creating it if needed.
+
+        :type workflow_id: str
+        :type run_id: str
+        :rtype: RunCache
+        """
+        key = (workflow_id, run_id)
+        run_cache = self._runs.pop(key, None)
+        if run_cache is None:
+            run_cache = RunCache()
+        self._runs[key] = run_cache
+        while len(self._runs) > self.max_size:
+            self._runs.popitem(last=False)
+        return run_cache
+
+    def pop(self, workflow_id, run_id):
+        """
+        Forget an execution.
+
+        :type workflow_id: str
+        :type run_id: str
+        :rtype: Optional[RunCache]
+        """
+        return self._runs.pop((workflow_id, run_id), None)
+
+    def clear(self):
+        self._runs.clear()
@@ -14,5 +14,34 @@ else:
 
 VALID_PROCESS_MODES = {
     "local",
+    "concurrent",
     "kubernetes",
 }
+
+# Number of workflow executions whose parsed state is kept by a decider
+# between two decision tasks
+DECIDER_CACHE_SIZE = int(os.getenv("SIMPLEFLOW_DECIDER_CACHE_SIZE", 100))
+
+# Number of idempotent task arguments whose hash is memoized for each of these
+# executions; the memo keeps the arguments alive
+ARGUMENT_HASHES_CACHE_SIZE = int(
+    os.getenv("SIMPLEFLOW_ARGUMENT_HASHES_CACHE_SIZE", 1000)
+)
+
+# Default number of decisions taken by a sticky decider process before it's
+# replaced by a fresh one
+DECIDER_STICKY_MAX_DECISIONS = int(
+    os.getenv("SIMPLEFLOW_DECIDER_STICKY_MAX_DECISIONS", 1000)
+)
+
+# Maximum rate and burst of activity task heartbeats sent by the worker
+# processes started together through a shared multiplexer (0, the default, to
+# let each of them heartbeat on its own)
+HEARTBEAT_RATE = float(os.getenv("SIMPLEFLOW_HEARTBEAT_RATE", 0))
+HEARTBEAT_BURST = float(os.getenv("SIMPLEFLOW_HEARTBEAT_BURST", 20))
+
+# Maximum wait of an activity task polled in advance by a worker before it's
+# released to time out (seconds)
+ACTIVITY_PREFETCH_TIMEOUT = float(
+    os.getenv("SIMPLEFLOW_ACTIVITY_PREFETCH_TIMEOUT", 300)
+)
@@ -2,8 +2,6 @@ from __future__ import absolute_import
 
 import copy
 import hashlib
-import inspect
-import json
 import multiprocessing
 import re
 import traceback
@@ -20,6 +18,7 @@ from simpleflow.history import History
 from simpleflow.marker import Marker
 from simpleflow.signal import WaitForSignal
 from simpleflow.swf import constants
+from simpleflow.swf.cache import DeciderCache, RunCache
 from simpleflow.swf.helpers import swf_identity
 from simpleflow.swf.task import (
     ActivityTask,
@@ -31,7 +30,7 @@ from simpleflow.swf.task import (
     WorkflowTask,
 )
 from simpleflow.swf.utils import DecisionsAndContext
-from simpleflow.utils import hex_hash, issubclass_, json_dumps, retry
+from simpleflow.utils import DispatchTable, hex_hash, issubclass_, json_dumps, retry
 from simpleflow.workflow import Workflow
 from swf.core import ConnectedSWFObject
 
@@ -41,6 +40,31 @@ if TYPE_CHECKING:
 __all__ = ["Executor"]
 
 
+def hash_arguments(args, kwargs):
+    """
+    MD5 hex digest of ``json_dumps({"args": args, "kwargs": kwargs})``.
+
+    :type args: tuple
+    :type kwargs: dict
+    :rtype: str
+    """
+    arguments = json_dumps({"args": args, "kwargs": kwargs})
+    return hashlib.md5(arguments.encode("utf-8")).hexdigest()
+
+
+_IMMUTABLE_TYPES = (
+    compat.string_types
+    + (compat.binary_type, bool, float, type(None),)
+    + compat.integer_types
+)
+
+
+def _is_immutable(value):
+    if isinstance(value, tuple):
+        return all(_is_immutable(v) for v in value)
+    return isinstance(value, _IMMUTABLE_TYPES)
+
+
 # if "poll_for_activity_task" doesn't contain a "taskToken"
 # key, then retry ; it happens (not often) that the decider
 # doesn't get the scheduled task while it should...
@@ -131,9 +155,18 @@ class Executor(executor.Executor):
     :type _repair_workflow_id: Optional[str]
     :ivar repair_run_id: run ID to repair, if any
     :type _repair_run_id: Optional[str]
+    :ivar _decider_cache: state kept between decision tasks, by execution
+    :type _decider_cache: DeciderCache
+    :ivar _run_cache: state kept between decision tasks for the current execution
+    :type _run_cache: RunCache
+    :ivar prefetch_jumbo_fields: pull the jumbo fields of new events before
+        replaying, when the history and the cache are kept between decisions
+    :type prefetch_jumbo_fields: bool
 
     """
 
+    prefetch_jumbo_fields = False
+
     def __init__(
         self,
         domain,
@@ -165,6 +198,8 @@ class Executor(executor.Executor):
         self.current_priority = None
         self.handled_failures = {}
         self.created_activity_types = set()
+        self._decider_cache = DeciderCache()
+        self._run_cache = RunCache()
 
     def reset(self):
         """
@@ -190,6 +225,46 @@ class Executor(executor.Executor):
         # type: () -> Optional[History]
         return self._history
 
+    def _hash_arguments(self, args, kwargs):
+        """
+        Hash the arguments of an idempotent task.
+
+        The hash is memoized by identity of the arguments when they're all
+        immutable: the workflow can't have changed them since the previous
+        submission, possibly in a previous replay if the decider is sticky.
+        The memo keeps the arguments alive; only the most recently used ones
+        are kept.
+
+        :type args: tuple
+        :type kwargs: dict
+        :rtype: str
+        """
+        if not all(_is_immutable(arg) for arg in args) or not all(
+            _is_immutable(arg) for arg in kwargs.values()
+        ):
+            return hash_arguments(args, kwargs)
+
+        key = (
+            tuple(id(arg) for arg in args),
+            tuple(sorted((k, id(v)) for k, v in kwargs.items())),
+        )
+        argument_hashes = self._run_cache.argument_hashes
+        memo = argument_hashes.pop(key, None)
+        # The arguments are kept in the memo, so their ids can't be reused;
+        # still, check them.
+        if (
+            memo is not None
+            and all(a is b for a, b in zip(memo[0], args))
+            and all(memo[1][k] is v for k, v in kwargs.items())
+        ):
+            digest = memo[2]
+        else:
+            digest = hash_arguments(args, kwargs)
+        argument_hashes[key] = (args, kwargs, digest)
+        while len(argument_hashes) > constants.ARGUMENT_HASHES_CACHE_SIZE:
+            argument_hashes.popitem(last=False)
+        return digest
+
     def _make_task_id(self, a_task, workflow_id, run_id, *args, **kwargs):
         """
         Assign a new ID to *a_task*.
@@ -217,8 +292,7 @@ class Executor(executor.Executor):
             # If a_task is idempotent, we can do better and hash arguments.
             # It makes the workflow resistant to retries or variations on the
             # same task name (see #11).
-            arguments = json_dumps({"args": args, "kwargs": kwargs})
-            suffix = hashlib.md5(arguments.encode("utf-8")).hexdigest()
+            suffix = self._hash_arguments(args, kwargs)
 
         if isinstance(a_task, (WorkflowTask,)):
             # Some task types must have globally unique names.
@@ -505,18 +579,16 @@ class Executor(executor.Executor):
         :return:
         :rtype: Optional[dict]
         """
-        # FIXME could look directly in signaled_workflows?
         event = history.signals.get(a_task.name)
         if not event:
             if a_task.workflow_id is None:  # Broadcast, should be in signals
                 return None
-            signaled_workflows = history.signaled_workflows.get(a_task.name, [])
-            for w in signaled_workflows:
-                if w["workflow_id"] == a_task.workflow_id and (
-                    a_task.run_id is None or w["run_id"] == a_task.run_id
-                ):
-                    event = w
-                    break
+            event = history.find_signaled_workflow(
+                a_task.name,
+                a_task.workflow_id,
+                a_task.run_id,
+                any_run=a_task.run_id is None,
+            )
         return event
 
     def find_marker_event(self, a_task, history):
@@ -533,16 +605,7 @@ class Executor(executor.Executor):
         json_details = (
             json_dumps(a_task.details) if a_task.details is not None else None
         )
-        marker_list = history.markers.get(a_task.name)
-        if not marker_list:
-            return None
-        marker_list = list(
-            filter(
-                lambda m: m["state"] == "recorded" and m["details"] == json_details,
-                marker_list,
-            )
-        )
-        return marker_list[-1] if marker_list else None
+        return history.find_recorded_marker(a_task.name, json_details)
 
     def find_timer_event(self, a_task, history):
         """
@@ -567,14 +630,16 @@ class Executor(executor.Executor):
                 return None
         return event
 
-    TASK_TYPE_TO_EVENT_FINDER = {
-        ActivityTask: find_activity_event,
-        WorkflowTask: find_child_workflow_event,
-        SignalTask: find_signal_event,
-        MarkerTask: find_marker_event,
-        TimerTask: find_timer_event,
-        CancelTimerTask: find_timer_event,
-    }
+    TASK_TYPE_TO_EVENT_FINDER = DispatchTable(
+        {
+            ActivityTask: find_activity_event,
+            WorkflowTask: find_child_workflow_event,
+            SignalTask: find_signal_event,
+            MarkerTask: find_marker_event,
+            TimerTask: find_timer_event,
+            CancelTimerTask: find_timer_event,
+        }
+    )
 
     def find_event(self, a_task, history):
         """
@@ -586,10 +651,9 @@ class Executor(executor.Executor):
         :return:
         :rtype: Optional[dict]
         """
-        for typ in inspect.getmro(type(a_task)):
-            finder = self.TASK_TYPE_TO_EVENT_FINDER.get(typ)
-            if finder:
-                return finder(self, a_task, history)
+        finder = self.TASK_TYPE_TO_EVENT_FINDER.dispatch(type(a_task))
+        if finder:
+            return finder(self, a_task, history)
         raise TypeError("invalid type {} for task {}".format(type(a_task), a_task))
 
     def resume_activity(self, a_task, event):
@@ -864,11 +928,9 @@ class Executor(executor.Executor):
         # schedule the requested task and block execution instead, with a timer
         # to wake up the workflow immediately after completing these decisions.
         # See: http://docs.aws.amazon.com/amazonswf/latest/developerguide/swf-dg-limits.html
-        # NB: here we use json.dumps, not json_dumps, since the serialization will
-        # happen inside boto.swf and is out of our control.
-        request_size = len(
-            json.dumps(self._decisions_and_context.decisions + decisions)
-        )
+        # NB: decisions are encoded like boto.swf does, and sent as is.
+        encoded_decisions = [DecisionsAndContext.encode_decision(d) for d in decisions]
+        request_size = self._decisions_and_context.request_size(encoded_decisions)
         # We keep a 5kB of error margin for headers, json structure, and the
         # timer decision, and 32kB for the context, even if we don't use it now.
         if request_size > constants.MAX_REQUEST_SIZE - 5000 - 32000:
@@ -878,7 +940,7 @@ class Executor(executor.Executor):
             self._append_timer = True
             raise exceptions.ExecutionBlocked()
 
-        self._decisions_and_context.extend_decision(decisions)
+        self._decisions_and_context.extend_decision(decisions, encoded_decisions)
 
         # Check if we won't exceed max decisions -1
         # TODO: if we had exactly MAX_DECISIONS - 1 to take, this will wake up
@@ -895,14 +957,16 @@ class Executor(executor.Executor):
         )
         self._decisions_and_context.append_decision(timer)
 
-    EVENT_TYPE_TO_FUTURE = {
-        "activity": resume_activity,
-        "child_workflow": resume_child_workflow,
-        "signal": get_future_from_signal_event,
-        "external_workflow": get_future_from_external_workflow_event,
-        "marker": _get_future_from_marker_event,
-        "timer": _get_future_from_timer_event,
-    }
+    EVENT_TYPE_TO_FUTURE = DispatchTable(
+        {
+            "activity": resume_activity,
+            "child_workflow": resume_child_workflow,
+            "signal": get_future_from_signal_event,
+            "external_workflow": get_future_from_external_workflow_event,
+            "marker": _get_future_from_marker_event,
+            "timer": _get_future_from_timer_event,
+        }
+    )
 
     def resume(self, a_task, *args, **kwargs):
         """Resume the execution of a task.
@@ -929,6 +993,13 @@ class Executor(executor.Executor):
             else:
                 workflow_id, run_id = self._workflow_id, self._run_id
             a_task.id = self._make_task_id(a_task, workflow_id, run_id, *args, **kwargs)
+
+        # Completed tasks don't change anymore: reuse the future resolved in
+        # a previous replay.
+        future = self._run_cache.futures.get(a_task.id)
+        if future is not None:
+            return future
+
         event = self.find_event(a_task, self._history)
         logger.debug("executor: resume {}, event={}".format(a_task, event))
         future = None
@@ -962,7 +1033,7 @@ class Executor(executor.Executor):
 
         # back to normal execution flow
         if event:
-            ttf = self.EVENT_TYPE_TO_FUTURE.get(event["type"])
+            ttf = self.EVENT_TYPE_TO_FUTURE.dispatch(event["type"])
             if ttf:
                 future_and_more = ttf(self, a_task, event)
                 if isinstance(future_and_more, tuple):
@@ -972,6 +1043,14 @@ class Executor(executor.Executor):
             if event["type"] == "activity":
                 if future and future.state in (futures.PENDING, futures.RUNNING):
                     self._open_activity_count += 1
+            if (
+                event["type"] in ("activity", "child_workflow")
+                and event["state"] == "completed"
+                and future
+                and future.finished
+                and future.exception is None
+            ):
+                self._run_cache.futures[a_task.id] = future
 
         if not future:
             self.schedule_task(a_task, task_list=self.task_list)
@@ -1114,8 +1193,11 @@ class Executor(executor.Executor):
 
         # noinspection PyUnresolvedReferences
         history = decision_response.history
-        self._history = History(history)
-        self._history.parse()
+        self._run_cache = self.get_run_cache(decision_response)
+        self._history = self.parse_history(history, self._run_cache)
+        if self.prefetch_jumbo_fields:
+            # Only the new ones when the history is kept between decisions
+            format.prefetch_jumbo_fields(self._history.new_jumbo_fields)
         self.build_run_context(decision_response)
         # noinspection PyUnresolvedReferences
         self._execution = decision_response.execution
@@ -1140,6 +1222,7 @@ class Executor(executor.Executor):
                     return DecisionsAndContext(decisions)
             self.propagate_signals()
             result = self.run_workflow(*args, **kwargs)
+            self.before_close()
         except exceptions.ExecutionBlocked:
             logger.info(
                 "{} open activities ({} decisions)".format(
@@ -1217,6 +1300,46 @@ class Executor(executor.Executor):
             self.decref_workflow()
         return DecisionsAndContext([decision])
 
+    def get_run_cache(self, decision_response):
+        # type: (swf.responses.Response) -> RunCache
+        """
+        Get the state kept from the previous decision tasks of this execution.
+
+        :param decision_response: an object wrapping the PollForDecisionTask response
+        """
+        # noinspection PyUnresolvedReferences
+        execution = decision_response.execution
+        if not execution:
+            # For tests that don't provide an execution object.
+            return RunCache()
+        return self._decider_cache.get(execution.workflow_id, execution.run_id)
+
+    @staticmethod
+    def parse_history(history, run_cache):
+        # type: (swf.models.history.History, RunCache) -> History
+        """
+        Parse the history of a decision task.
+
+        The parsed history is kept between decision tasks of the same
+        execution so that only the new events are parsed; we fall back to a
+        full parse if the cached events don't match the new history.
+
+        :param history: SWF history
+        :param run_cache: state kept for this execution
+        :return: parsed history
+        """
+        parsed_history = run_cache.history
+        if parsed_history is None or not parsed_history.update(history):
+            run_cache.reset()
+            parsed_history = History(history)
+        try:
+            parsed_history.parse()
+        except Exception:
+            run_cache.reset()
+            raise
+        run_cache.history = parsed_history
+        return parsed_history
+
     def maybe_clear_execution_context(self):
         """
         Replace a null execution_context with an empty string if the preceding one was set.
@@ -1253,7 +1376,12 @@ class Executor(executor.Executor):
     def after_replay(self):
         return self._workflow.after_replay(self._history)
 
+    def before_close(self):
+        return self._workflow.before_close(self._history)
+
     def after_closed(self):
+        if self._execution:
+            self._decider_cache.pop(self._execution.workflow_id, self._execution.run_id)
         return self._workflow.after_closed(self._history)
 
     def on_failure(self, reason, details=None):
@@ -1406,13 +1534,11 @@ class Executor(executor.Executor):
             args = input.get("args", ())
             kwargs = input.get("kwargs", {})
             sender = (signal["external_workflow_id"], signal["external_run_id"])
-            signaled_workflows_ids = set(
-                (w["workflow_id"], w["run_id"])
-                for w in history.signaled_workflows[name]
-            )
-            not_signaled_workflows_ids = list(
-                known_workflows_ids - signaled_workflows_ids - {sender}
-            )
+            not_signaled_workflows_ids = [
+                (workflow_id, run_id)
+                for workflow_id, run_id in known_workflows_ids - {sender}
+                if not history.find_signaled_workflow(name, workflow_id, run_id)
+            ]
             extra_input = {"__propagate": propagate}
             for workflow_id, run_id in not_signaled_workflows_ids:
                 self.schedule_task(
@@ -4,11 +4,14 @@ import multiprocessing
 import os
 from typing import TYPE_CHECKING
 
+import psutil
+
 import swf.actors
 import swf.exceptions
 import swf.models.decision
 from simpleflow import format, logger
 from simpleflow.process import Supervisor, with_state
+from simpleflow.swf import constants
 from simpleflow.swf.process import Poller
 from simpleflow.swf.utils import DecisionsAndContext
 
@@ -44,6 +47,12 @@ class DeciderPoller(Poller, swf.actors.Decider):
     :type _workflow_executors: Dict[str, Executor]
     :ivar nb_retries: # of retries allowed
     :type nb_retries: int
+    :ivar sticky: take decisions in this process instead of forking
+    :type sticky: bool
+    :ivar sticky_max_decisions: recycle a sticky process after this many decisions (0: never)
+    :type sticky_max_decisions: int
+    :ivar sticky_max_rss: recycle a sticky process above this RSS (MB)
+    :type sticky_max_rss: Optional[int]
     """
 
     def __init__(
@@ -53,6 +62,10 @@ class DeciderPoller(Poller, swf.actors.Decider):
         task_list,  # type: str
         is_standalone,  # type: bool
         nb_retries=3,  # type: int
+        sticky=False,  # type: bool
+        sticky_max_decisions=None,  # type: Optional[int]
+        sticky_max_rss=None,  # type: Optional[int]
+        preloaded_executors=None,  # type: Optional[List[Executor]]
         *args,
         **kwargs
     ):
@@ -73,8 +86,21 @@ class DeciderPoller(Poller, swf.actors.Decider):
         behind this is to limit operational burden by having a single service
         handling multiple workflows.
 
+        By default, each decision is taken in a forked process, which
+        protects us against memory leaks. In *sticky* mode, decisions are
+        taken in the poller process itself, which keeps the executors, their
+        caches and the imported modules warm; the process exits after
+        *sticky_max_decisions* decisions or when its RSS exceeds
+        *sticky_max_rss* MB, and is replaced by the supervisor.
+
+        Executors of other workflows, typically child workflows started on
+        the same task list, can be *preloaded*: the decision processes then
+        inherit them instead of importing their module at each decision.
+
         :param workflow_executors: executors handling workflow executions.
         :type  workflow_executors: list[simpleflow.swf.executor.Executor]
+        :param preloaded_executors: executors of other workflows.
+        :type  preloaded_executors: Optional[list[simpleflow.swf.executor.Executor]]
 
         """
         self.workflow_name = "{}".format(
@@ -98,6 +124,20 @@ class DeciderPoller(Poller, swf.actors.Decider):
         self.nb_retries = nb_retries
         self.domain = domain
         self.is_standalone = is_standalone
+        self.sticky = sticky
+        if sticky_max_decisions is None:
+            sticky_max_decisions = constants.DECIDER_STICKY_MAX_DECISIONS
+        self.sticky_max_decisions = sticky_max_decisions
+        self.sticky_max_rss = sticky_max_rss
+        self._nb_sticky_decisions = 0
+
+        for executor in preloaded_executors or ():
+            self._workflow_executors.setdefault(executor.workflow_class.name, executor)
+
+        for executor in self._workflow_executors.values():
+            # Forked decisions start with an empty cache and a whole history
+            # to parse: prefetching would pull every field, used or not.
+            executor.prefetch_jumbo_fields = sticky
 
         # All executors must have the same domain.
         self._check_all_domains_identical()
@@ -157,12 +197,16 @@ class DeciderPoller(Poller, swf.actors.Decider):
         :param execution_context: None...
         :return: nothing.
         """
+        encoded_decisions = None
         if isinstance(decisions, DecisionsAndContext):
-            decisions, execution_context = (
+            decisions, execution_context, encoded_decisions = (
                 decisions.decisions,
                 decisions.execution_context,
+                decisions.encoded_decisions,
             )
-        return swf.actors.Decider.complete(self, token, decisions, execution_context)
+        return swf.actors.Decider.complete(
+            self, token, decisions, execution_context, encoded_decisions
+        )
 
     @with_state("processing")
     def process(self, decision_response):
@@ -170,12 +214,50 @@ class DeciderPoller(Poller, swf.actors.Decider):
         Take a PollForDecisionTask response object and try to complete the
         decision task, by calling self._complete() with the response token and
         a set of decisions. We fork so it protects us reliably against memory
-        leaks on long-running deciders.
+        leaks on long-running deciders, unless in sticky mode.
 
         :param decision_response: an object wrapping the PollForDecisionTask response.
         :type  decision_response: swf.responses.Response
         """
-        spawn(self, decision_response)
+        if not self.sticky:
+            spawn(self, decision_response)
+            return
+
+        try:
+            process_decision(self, decision_response)
+        except Exception as err:
+            # The decision task will time out and be rescheduled.
+            logger.exception("decision failed: {}".format(err))
+        self._nb_sticky_decisions += 1
+        if self.should_recycle():
+            self.is_alive = False  # exit, the supervisor starts a new process
+
+    def should_recycle(self):
+        """
+        Whether a sticky decider process has done enough work.
+
+        :rtype: bool
+        """
+        if (
+            self.sticky_max_decisions
+            and self._nb_sticky_decisions >= self.sticky_max_decisions
+        ):
+            logger.info(
+                "recycling decider process after {} decisions".format(
+                    self._nb_sticky_decisions
+                )
+            )
+            return True
+        if self.sticky_max_rss:
+            rss = psutil.Process().memory_info().rss // (1024 * 1024)
+            if rss >= self.sticky_max_rss:
+                logger.info(
+                    "recycling decider process using {}MB after {} decisions".format(
+                        rss, self._nb_sticky_decisions
+                    )
+                )
+                return True
+        return False
 
     @with_state("deciding")
     def decide(self, decision_response):
@@ -234,6 +316,14 @@ class DeciderWorker(object):
             self._workflow_executors[workflow_name] = workflow_executor
         try:
             decisions = workflow_executor.replay(decision_response)
+        except (
+            swf.exceptions.PollTimeout,
+            swf.exceptions.DoesNotExistError,
+            swf.exceptions.ResponseError,
+        ):
+            # The history couldn't be fully fetched: the decision task will
+            # time out and be rescheduled.
+            raise
         except Exception as err:
             import traceback
 
@@ -253,8 +343,10 @@ def process_decision(poller, decision_response):
     workflow_str = "workflow {} ({})".format(workflow_id, poller.workflow_name)
     logger.debug("process_decision() pid={}".format(os.getpid()))
     logger.info("taking decision for {}".format(workflow_str))
-    format.JUMBO_FIELDS_MEMORY_CACHE.clear()
+    if not poller.sticky:
+        format.JUMBO_FIELDS_MEMORY_CACHE.clear()
     decisions = poller.decide(decision_response)
+    logger.debug("jumbo fields cache: {}".format(format.jumbo_fields_cache_stats()))
     try:
         logger.info("completing decision for {}".format(workflow_str))
         poller.complete_with_retry(decision_response.token, decisions)
@@ -16,6 +16,10 @@ def start(
     is_standalone=False,
     repair_workflow_id=None,
     repair_run_id=None,
+    sticky=False,
+    sticky_max_decisions=None,
+    sticky_max_rss=None,
+    preload_workflows=None,
 ):
     """
     Start a decider.
@@ -39,6 +43,14 @@ def start(
     :type repair_workflow_id: Optional[str]
     :param repair_run_id: run ID to repair
     :type repair_run_id: Optional[str]
+    :param sticky: Whether to take decisions without forking
+    :type sticky: bool
+    :param sticky_max_decisions: Decisions taken before recycling a sticky process
+    :type sticky_max_decisions: Optional[int]
+    :param sticky_max_rss: RSS (MB) above which a sticky process is recycled
+    :type sticky_max_rss: Optional[int]
+    :param preload_workflows: other workflows whose executors are loaded upfront
+    :type preload_workflows: Optional[list[str]]
     """
     if log_level:
         logger.warning(
@@ -54,6 +66,10 @@ def start(
         is_standalone=is_standalone,
         repair_workflow_id=repair_workflow_id,
         repair_run_id=repair_run_id,
+        sticky=sticky,
+        sticky_max_decisions=sticky_max_decisions,
+        sticky_max_rss=sticky_max_rss,
+        preload_workflows=preload_workflows,
     )
     decider.is_alive = True
     decider.start()
@@ -1,9 +1,15 @@
+import time
+
 import swf.models
 from simpleflow import logger
 from simpleflow.swf.executor import Executor
 
 from . import Decider, DeciderPoller
 
+# Time taken to import and build each workflow executor loaded by this
+# process, by workflow name
+EXECUTOR_LOAD_TIMES = {}
+
 
 def load_workflow_executor(
     domain,
@@ -35,6 +41,7 @@ def load_workflow_executor(
     :rtype: Executor
     """
     logger.debug('load_workflow_executor(workflow_name="{}")'.format(workflow_name))
+    start = time.time()
     module_name, object_name = workflow_name.rsplit(".", 1)
     module = __import__(module_name, fromlist=["*"])
 
@@ -44,7 +51,7 @@ def load_workflow_executor(
     if not isinstance(domain, swf.models.Domain):
         domain = swf.models.Domain(domain)
 
-    return Executor(
+    executor = Executor(
         domain,
         workflow,
         task_list,
@@ -54,6 +61,13 @@ def load_workflow_executor(
         repair_run_id=repair_run_id,
     )
 
+    load_time = time.time() - start
+    EXECUTOR_LOAD_TIMES[workflow_name] = load_time
+    logger.info(
+        'loaded workflow executor for "{}" in {:.3f}s'.format(workflow_name, load_time)
+    )
+    return executor
+
 
 def make_decider_poller(
     workflows,
@@ -64,6 +78,10 @@ def make_decider_poller(
     is_standalone=False,
     repair_workflow_id=None,
     repair_run_id=None,
+    sticky=False,
+    sticky_max_decisions=None,
+    sticky_max_rss=None,
+    preload_workflows=None,
 ):
     """
     Factory building a decider poller.
@@ -83,6 +101,15 @@ def make_decider_poller(
     :type repair_workflow_id: Optional[str]
     :param repair_run_id: run ID to repair
     :type repair_run_id: Optional[str]
+    :param sticky: Whether to take decisions without forking
+    :type sticky: bool
+    :param sticky_max_decisions: Decisions taken before recycling a sticky process
+    :type sticky_max_decisions: Optional[int]
+    :param sticky_max_rss: RSS (MB) above which a sticky process is recycled
+    :type sticky_max_rss: Optional[int]
+    :param preload_workflows: other workflows (e.g. children) whose executors
+        are loaded now, so that the decision processes inherit them
+    :type preload_workflows: Optional[list[str]]
     :return:
     :rtype: DeciderPoller
     """
@@ -104,8 +131,24 @@ def make_decider_poller(
         )
         for workflow in workflows
     ]
+    preloaded_executors = [
+        load_workflow_executor(
+            domain, workflow, task_list=task_list if is_standalone else None
+        )
+        for workflow in preload_workflows or ()
+        if workflow not in workflows
+    ]
     domain = swf.models.Domain(domain)
-    return DeciderPoller(executors, domain, task_list, is_standalone)
+    return DeciderPoller(
+        executors,
+        domain,
+        task_list,
+        is_standalone,
+        sticky=sticky,
+        sticky_max_decisions=sticky_max_decisions,
+        sticky_max_rss=sticky_max_rss,
+        preloaded_executors=preloaded_executors,
+    )
 
 
 def make_decider(
@@ -118,6 +161,10 @@ def make_decider(
     is_standalone=False,
     repair_workflow_id=None,
     repair_run_id=None,
+    sticky=False,
+    sticky_max_decisions=None,
+    sticky_max_rss=None,
+    preload_workflows=None,
 ):
     """
     Instantiate a Decider.
@@ -139,6 +186,15 @@ def make_decider(
     :type repair_workflow_id: Optional[str]
     :param repair_run_id: run ID to repair
     :type repair_run_id: Optional[str]
+    :param sticky: Whether to take decisions without forking
+    :type sticky: bool
+    :param sticky_max_decisions: Decisions taken before recycling a sticky process
+    :type sticky_max_decisions: Optional[int]
+    :param sticky_max_rss: RSS (MB) above which a sticky process is recycled
+    :type sticky_max_rss: Optional[int]
+    :param preload_workflows: other workflows (e.g. children) whose executors
+        are loaded now, so that the decision processes inherit them
+    :type preload_workflows: Optional[list[str]]
     :return:
     :rtype: Decider
     """
@@ -151,5 +207,9 @@ def make_decider(
         is_standalone=is_standalone,
         repair_workflow_id=repair_workflow_id,
         repair_run_id=repair_run_id,
+        sticky=sticky,
+        sticky_max_decisions=sticky_max_decisions,
+        sticky_max_rss=sticky_max_rss,
+        preload_workflows=preload_workflows,
     )
     return Decider(poller, nb_children=nb_children)
@@ -2,28 +2,36 @@ import json
 import multiprocessing
 import os
 import sys
+import threading
+import time
 import traceback
 import uuid
 from base64 import b64decode
+from typing import TYPE_CHECKING
 
 import psutil
 
 import swf.actors
 import swf.exceptions
-from simpleflow import format, logger, settings
+from simpleflow import format, logger, metrology, settings
 from simpleflow.dispatch import dynamic_dispatcher
-from simpleflow.download import download_binaries
+from simpleflow.dispatch.exceptions import DispatchError
+from simpleflow.download import use_binaries
 from simpleflow.exceptions import ExecutionError
 from simpleflow.job import KubernetesJob
 from simpleflow.process import Supervisor, with_state
-from simpleflow.swf.constants import VALID_PROCESS_MODES
+from simpleflow.swf.constants import ACTIVITY_PREFETCH_TIMEOUT, VALID_PROCESS_MODES
 from simpleflow.swf.process import Poller
+from simpleflow.swf.process.worker.heartbeat import DOES_NOT_EXIST
 from simpleflow.swf.task import ActivityTask
 from simpleflow.swf.utils import sanitize_activity_context
 from simpleflow.utils import format_exc, format_exc_type, json_dumps, to_k8s_identifier
 from swf.models import ActivityTask as BaseActivityTask
 from swf.responses import Response
 
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional  # NOQA
+
 
 class Worker(Supervisor):
     def __init__(self, poller, nb_children=None):
@@ -40,7 +48,15 @@ class ActivityPoller(Poller, swf.actors.ActivityWorker):
     """
 
     def __init__(
-        self, domain, task_list, heartbeat=60, process_mode=None, poll_data=None
+        self,
+        domain,
+        task_list,
+        heartbeat=60,
+        process_mode=None,
+        poll_data=None,
+        nb_slots=None,
+        heartbeater=None,
+        prefetch=False,
     ):
         """
 
@@ -50,8 +66,18 @@ class ActivityPoller(Poller, swf.actors.ActivityWorker):
         :type task_list:
         :param heartbeat:
         :type heartbeat:
-        :param process_mode: Whether to process locally (default) or spawn a Kubernetes job.
+        :param process_mode: Whether to process locally (default), concurrently
+            in long-lived slot processes or spawn a Kubernetes job.
         :type process_mode: Optional[str]
+        :param nb_slots: Number of activities run concurrently in the
+            "concurrent" process mode. Default: number of CPUs
+        :type nb_slots: Optional[int]
+        :param heartbeater: heartbeat multiplexer shared by the processes of
+            the worker; tasks are heartbeated directly if None
+        :type heartbeater: Optional[simpleflow.swf.process.worker.heartbeat.HeartbeatMultiplexer]
+        :param prefetch: Whether to poll the next task while the current one
+            is processed, in the "local" process mode.
+        :type prefetch: bool
         """
         self.nb_retries = 3
         # heartbeat=0 is a special value to disable heartbeating. We want to
@@ -65,14 +91,83 @@ class ActivityPoller(Poller, swf.actors.ActivityWorker):
         ), 'invalid process_mode "{}"'.format(self.process_mode)
 
         self.poll_data = poll_data
+        self.nb_slots = nb_slots or multiprocessing.cpu_count()
+        self._slots = None  # type: Optional[ActivitySlots]
+        self.heartbeater = heartbeater
+
+        self.prefetch = prefetch
+        if self.prefetch and self.process_mode != "local":
+            raise ValueError(
+                'prefetch is only supported in the "local" process mode, not "{}"'.format(
+                    self.process_mode
+                )
+            )
+        self._prefetcher = None  # type: Optional[ActivityTaskPrefetcher]
         super(ActivityPoller, self).__init__(domain, task_list)
 
     @property
     def name(self):
         return "{}(task_list={})".format(self.__class__.__name__, self.task_list,)
 
+    def start(self):
+        if self.prefetch:
+            self._prefetcher = ActivityTaskPrefetcher(
+                self,
+                super(ActivityPoller, self).poll_with_retry,
+                ACTIVITY_PREFETCH_TIMEOUT,
+                self._heartbeat,
+            )
+            self._prefetcher.start()
+        try:
+            super(ActivityPoller, self).start()
+        finally:
+            self.stop_prefetching()
+            self.stop_slots()
+
+    def run_once(self):
+        try:
+            super(ActivityPoller, self).run_once()
+        finally:
+            self.stop_slots()
+
+    def stop_prefetching(self):
+        """
+        Wait for the running poll and process the task it may have returned:
+        it's already started on SWF side.
+        """
+        if self._prefetcher is not None:
+            response = self._prefetcher.stop()
+            self._prefetcher = None
+            if response is not None:
+                self.process(response)
+
+    def poll_with_retry(self):
+        if self._prefetcher is None:
+            return super(ActivityPoller, self).poll_with_retry()
+        response = self._prefetcher.get(PREFETCH_WAIT_INTERVAL)
+        if response is None:
+            # Let the main loop check whether we're still alive
+            raise swf.exceptions.PollTimeout("no prefetched activity task")
+        return response
+
+    def stop_slots(self):
+        """
+        Wait for the activities running in the slots, then stop them.
+        """
+        if self._slots is not None:
+            self._slots.stop()
+            self._slots = None
+
     @with_state("polling")
     def poll(self, task_list=None, identity=None):
+        if self.process_mode == "concurrent":
+            # Slots are started lazily so that they inherit the signal
+            # handlers of the poller, like the processes forked by spawn().
+            if self._slots is None:
+                self._slots = ActivitySlots(self, self.nb_slots, self._heartbeat)
+                self._slots.start()
+            # Don't hold a task we couldn't start right away.
+            self._slots.wait_for_free_slot()
         if self.poll_data:
             # the poll data has been passed as input
             return self.fake_poll()
@@ -82,13 +177,21 @@ class ActivityPoller(Poller, swf.actors.ActivityWorker):
 
     def fake_poll(self):
         polled_activity_data = json.loads(b64decode(self.poll_data))
+        return self.make_response(polled_activity_data)
+
+    def make_response(self, raw_response):
+        """
+        :param raw_response: PollForActivityTask response
+        :type raw_response: dict
+        :rtype: swf.responses.Response
+        """
         activity_task = BaseActivityTask.from_poll(
-            self.domain, self.task_list, polled_activity_data,
+            self.domain, self.task_list, raw_response,
         )
         return Response(
             task_token=activity_task.task_token,
             activity_task=activity_task,
-            raw_response=polled_activity_data,
+            raw_response=raw_response,
         )
 
     @with_state("processing")
@@ -109,6 +212,8 @@ class ActivityPoller(Poller, swf.actors.ActivityWorker):
                     task.activity_id, err.__class__.__name__, err,
                 )
                 self.fail_with_retry(token, task, reason)
+        elif self.process_mode == "concurrent":
+            self._slots.submit(token, task, response.raw_response)
         else:
             spawn(self, token, task, self._heartbeat)
 
@@ -191,9 +296,11 @@ class ActivityWorker(object):
             kwargs = input.get("kwargs", {})
             context = sanitize_activity_context(task.context)
             context["domain_name"] = poller.domain.name
-            if input.get("meta", {}).get("binaries"):
-                download_binaries(input["meta"]["binaries"])
-            result = ActivityTask(activity, *args, context=context, **kwargs).execute()
+            # Leased until the task is done
+            with use_binaries(input.get("meta", {}).get("binaries", {})):
+                result = ActivityTask(
+                    activity, *args, context=context, **kwargs
+                ).execute()
         except Exception:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             logger.exception("process error: {}".format(str(exc_value)))
@@ -239,6 +346,8 @@ def process_task(poller, token, task):
     format.JUMBO_FIELDS_MEMORY_CACHE.clear()
     worker = ActivityWorker()
     worker.process(poller, token, task)
+    # Metrology uploaded in the background, after the task completion
+    metrology.wait_for_uploads()
 
 
 def spawn_kubernetes_job(poller, swf_response):
@@ -322,59 +431,645 @@ def spawn(poller, token, task, heartbeat=60):
     def worker_alive():
         return psutil.pid_exists(worker.pid)
 
-    while worker_alive():
-        worker.join(timeout=heartbeat)
-        if not worker_alive():
-            # Most certainly unneeded: we'll see
-            if worker.exitcode is None:
-                # race condition, try and re-join
-                worker.join(timeout=0)
+    # With a heartbeater, heartbeats are sent for us and we only check the
+    # status of the task.
+    heartbeater = poller.heartbeater if heartbeat else None
+    if heartbeater is not None:
+        heartbeater.register(token, heartbeat)
+        join_timeout = min(heartbeat, HEARTBEATER_CHECK_INTERVAL)
+    else:
+        join_timeout = heartbeat
+
+    try:
+        while worker_alive():
+            worker.join(timeout=join_timeout)
+            if not worker_alive():
+                # Most certainly unneeded: we'll see
                 if worker.exitcode is None:
-                    logger.warning(
-                        "process {} is dead but multiprocessing doesn't know it (simpleflow bug)".format(
-                            worker.pid
+                    # race condition, try and re-join
+                    worker.join(timeout=0)
+                    if worker.exitcode is None:
+                        logger.warning(
+                            "process {} is dead but multiprocessing doesn't know it (simpleflow bug)".format(
+                                worker.pid
+                            )
                         )
+                if worker.exitcode != 0:
+                    poller.fail_with_retry(
+                        token,
+                        task,
+                        reason="process {} died: exit code {}".format(
+                            worker.pid, worker.exitcode
+                        ),
+                    )
+                return
+            if heartbeater is not None:
+                status = heartbeater.status(token)
+                if status is None:
+                    continue
+                if status == DOES_NOT_EXIST:
+                    logger.warning(
+                        "killing (KILL) worker with pid={}".format(worker.pid)
+                    )
+                # Task cancelled or no longer existing.
+                reap_process_tree(worker.pid)
+                return
+            try:
+                logger.debug(
+                    "heartbeating for pid={} (token={})".format(worker.pid, token)
+                )
+                response = poller.heartbeat(token)
+            except swf.exceptions.DoesNotExistError as error:
+                # Either the task or the workflow execution no longer exists,
+                # let's kill the worker process.
+                logger.warning("heartbeat failed: {}".format(error))
+                logger.warning("killing (KILL) worker with pid={}".format(worker.pid))
+                reap_process_tree(worker.pid)
+                return
+            except swf.exceptions.RateLimitExceededError as error:
+                # ignore rate limit errors: high chances the next heartbeat will be
+                # ok anyway, so it would be stupid to break the task for that
+                logger.warning(
+                    'got a "ThrottlingException / Rate exceeded" when heartbeating for task {}: {}'.format(
+                        task.activity_type.name, error
+                    )
+                )
+                continue
+            except Exception as error:
+                # Let's crash if it cannot notify the heartbeat failed.  The
+                # subprocess will become orphan and the heartbeat timeout may
+                # eventually trigger on Amazon SWF side.
+                logger.error(
+                    "cannot send heartbeat for task {}: {}".format(
+                        task.activity_type.name, error
+                    )
+                )
+                raise
+
+            # Task cancelled.
+            if response and response.get("cancelRequested"):
+                reap_process_tree(worker.pid)
+                return
+    finally:
+        if heartbeater is not None:
+            heartbeater.unregister(token)
+
+
+# Longest wait for a prefetched task before checking whether the poller is
+# still alive (seconds)
+PREFETCH_WAIT_INTERVAL = 1.0
+
+# Fraction of the start-to-close timeout of a task it may spend prefetched
+PREFETCH_BUDGET_RATIO = 0.1
+
+# Message of the poller asking for the prefetched task
+_TAKE = "take"
+
+
+class ActivityTaskPrefetcher(object):
+    """
+    Poll the next activity task in a child process while the current one is
+    processed. The poller stays single-threaded: the processes it forks for
+    the tasks can't inherit a lock held by a prefetching thread.
+
+    At most one task is held. As it's already started on SWF side, it is
+    heartbeated while it waits. If it isn't taken within its budget, a
+    fraction of its start-to-close timeout capped by `timeout` seconds, it's
+    failed so that the decider schedules it again right away, instead of
+    waiting for it to time out. A held task whose cancellation is requested
+    is reported as canceled.
+    """
+
+    def __init__(self, poller, poll, timeout, heartbeat=None):
+        """
+        :param poller:
+        :type poller: ActivityPoller
+        :param poll: polls a task, raising PollTimeout if there's none
+        :type poll: Callable[[], swf.responses.Response]
+        :param timeout: maximum wait of a prefetched task (seconds)
+        :type timeout: float
+        :param heartbeat: heartbeat delay (seconds), None to disable it
+        :type heartbeat: Optional[float]
+        """
+        self._poller = poller
+        self._poll = poll
+        self._timeout = timeout
+        self._heartbeat = heartbeat
+        self._connection = None  # type: Optional[multiprocessing.connection.Connection]
+        self._process = None  # type: Optional[multiprocessing.Process]
+        # Whether the poller waits for the task
+        self._requested = False
+        self._stopped = False
+
+    def start(self):
+        self._connection, connection = multiprocessing.Pipe()
+        self._requested = False
+        self._process = multiprocessing.Process(target=self._run, args=(connection,))
+        self._process.daemon = True
+        self._process.start()
+        connection.close()
+
+    def stop(self):
+        """
+        Stop prefetching once the running poll is done.
+
+        :return: the task that was prefetched, if any
+        :rtype: Optional[swf.responses.Response]
+        """
+        raw_response = None
+        try:
+            self._connection.send(None)
+            while True:
+                raw_response = self._connection.recv()
+        except (EOFError, IOError, OSError):
+            # Closed by the prefetch process once it's done
+            pass
+        self._connection.close()
+        self._process.join()
+        if raw_response is None:
+            return None
+        return self._poller.make_response(raw_response)
+
+    def get(self, timeout=None):
+        """
+        Take the prefetched task, waiting for it up to `timeout` seconds.
+
+        :param timeout:
+        :type timeout: Optional[float]
+        :rtype: Optional[swf.responses.Response]
+        """
+        try:
+            if not self._requested:
+                self._connection.send(_TAKE)
+                self._requested = True
+            if not self._connection.poll(timeout):
+                return None
+            raw_response = self._connection.recv()
+        except (EOFError, IOError, OSError):
+            logger.error(
+                "prefetch process {} died: exit code {}, restarting it".format(
+                    self._process.pid, self._process.exitcode
+                )
+            )
+            self._connection.close()
+            self._process.join()
+            self.start()
+            return None
+        self._requested = False
+        return self._poller.make_response(raw_response)
+
+    def budget(self, response):
+        """
+        Time a task may be held before it's released.
+
+        :param response:
+        :type response: swf.responses.Response
+        :return: seconds
+        :rtype: float
+        """
+        try:
+            activity = dynamic_dispatcher.Dispatcher.dispatch_activity(
+                response.activity_task.activity_type.name
+            )
+            start_to_close = float(activity.task_start_to_close_timeout)
+        except (DispatchError, TypeError, ValueError):
+            # Unknown or unlimited
+            return self._timeout
+        return min(self._timeout, start_to_close * PREFETCH_BUDGET_RATIO)
+
+    def _run(self, connection):
+        """
+        Main loop of the prefetch process.
+
+        :param connection: prefetcher end of the pipe
+        :type connection: multiprocessing.connection.Connection
+        """
+        self._connection.close()
+        self._connection = connection
+        try:
+            while True:
+                self._receive(0)
+                if self._stopped:
+                    break
+                try:
+                    response = self._poll()
+                except swf.exceptions.PollTimeout:
+                    continue
+                except Exception:
+                    logger.exception("cannot prefetch activity task")
+                    time.sleep(PREFETCH_WAIT_INTERVAL)
+                    continue
+                self._hold(response)
+        except (EOFError, IOError, OSError):
+            # The poller is gone
+            pass
+        finally:
+            connection.close()
+
+    def _receive(self, timeout):
+        """
+        Wait up to `timeout` seconds for the messages of the poller.
+
+        :param timeout: seconds
+        :type timeout: float
+        """
+        while self._connection.poll(timeout):
+            message = self._connection.recv()
+            if message is None:
+                self._stopped = True
+            elif message == _TAKE:
+                self._requested = True
+            timeout = 0
+
+    def _hold(self, response):
+        """
+        Wait for the task to be taken, heartbeating it meanwhile.
+
+        :param response:
+        :type response: swf.responses.Response
+        """
+        budget = self.budget(response)
+        polled_at = time.time()
+        deadline = polled_at + budget
+        next_heartbeat = polled_at + self._heartbeat if self._heartbeat else deadline
+        while True:
+            if self._requested or self._stopped:
+                # Processed by the poller, even when it stops
+                self._connection.send(response.raw_response)
+                self._requested = False
+                return
+            now = time.time()
+            if now >= deadline:
+                reason = "prefetched activity {} not started within {}s".format(
+                    response.activity_task.activity_id, budget
+                )
+                logger.warning("{}: failing it to reschedule it".format(reason))
+                self._poller.fail_with_retry(
+                    response.task_token, response.activity_task, reason=reason
+                )
+                return
+            if now >= next_heartbeat:
+                if not self._heartbeat_task(response):
+                    return
+                next_heartbeat = now + self._heartbeat
+                continue
+            self._receive(min(deadline, next_heartbeat) - now)
+
+    def _heartbeat_task(self, response):
+        """
+        :param response:
+        :type response: swf.responses.Response
+        :return: whether the task should still be processed
+        :rtype: bool
+        """
+        try:
+            result = self._poller.heartbeat(response.task_token)
+        except swf.exceptions.DoesNotExistError as error:
+            logger.warning("heartbeat failed: {}".format(error))
+            return False
+        except Exception as error:
+            logger.error(
+                "cannot send heartbeat for prefetched activity {}: {}".format(
+                    response.activity_task.activity_id, error
+                )
+            )
+            return True
+        if result and result.get("cancelRequested"):
+            try:
+                self._poller.cancel(response.task_token)
+            except Exception as error:
+                logger.error(
+                    "cannot cancel prefetched activity {}: {}".format(
+                        response.activity_task.activity_id, error
+                    )
+                )
+            return False
+        return True
+
+
+# Delay between two checks of the status of a task heartbeated by a
+# heartbeat multiplexer (seconds)
+HEARTBEATER_CHECK_INTERVAL = 1.0
+
+# Delay between two checks of the activities running in slots (seconds)
+SLOTS_SUPERVISION_INTERVAL = 0.1
+
+
+def run_slot(poller, parent_connection, connection):
+    """
+    Main loop of a slot process: run the activity tasks received on the
+    connection one at a time, until None is received or the poller goes away.
+    The environment and working directory a task may change, such as the
+    $PATH of its binaries, are restored for the next ones.
+
+    :param poller:
+    :type poller: ActivityPoller
+    :param parent_connection: poller end of the pipe, closed in the slot
+    :type parent_connection: multiprocessing.connection.Connection
+    :param connection: slot end of the pipe
+    :type connection: multiprocessing.connection.Connection
+    """
+    parent_connection.close()
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        token, raw_response = message
+        task = BaseActivityTask.from_poll(poller.domain, poller.task_list, raw_response)
+        environ, cwd = dict(os.environ), os.getcwd()
+        try:
+            process_task(poller, token, task)
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+            os.chdir(cwd)
+        connection.send(token)
+
+
+class ActivitySlot(object):
+    """
+    Long-lived process running activity tasks one at a time.
+
+    The process is only replaced when it dies or when it's reaped because its
+    task was cancelled or doesn't exist anymore; it's then restarted by the
+    poller thread, not by the supervision thread.
+    """
+
+    def __init__(self, poller):
+        self.poller = poller
+        self.process = None  # type: Optional[multiprocessing.Process]
+        self.connection = None
+        self.token = None  # type: Optional[str]
+        self.task = None  # type: Optional[BaseActivityTask]
+        self.last_heartbeat = None  # type: Optional[float]
+
+    @property
+    def busy(self):
+        return self.token is not None
+
+    @property
+    def started(self):
+        return self.process is not None
+
+    def start(self):
+        parent_connection, connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=run_slot, args=(self.poller, parent_connection, connection),
+        )
+        self.process.start()
+        connection.close()
+        self.connection = parent_connection
+        logger.info("started activity slot pid={}".format(self.process.pid))
+
+    def stop(self):
+        if not self.started:
+            return
+        try:
+            self.connection.send(None)
+        except (IOError, OSError):
+            pass
+        self.process.join()
+        self.connection.close()
+
+    def submit(self, token, task, raw_response):
+        """
+        :param token:
+        :type token: str
+        :param task:
+        :type task: swf.models.ActivityTask
+        :param raw_response: activity task as polled from SWF
+        :type raw_response: Dict[str, Any]
+        """
+        self.token = token
+        self.task = task
+        self.last_heartbeat = time.time()
+        self.connection.send((token, raw_response))
+
+    def release(self):
+        self.token = None
+        self.task = None
+        self.last_heartbeat = None
+
+    def is_finished(self):
+        """
+        Whether the running task finished. If the process died, the task is
+        failed and the process left to restart.
+
+        :rtype: bool
+        """
+        if self.connection.poll():
+            try:
+                self.connection.recv()
+                return True
+            except EOFError:
+                pass
+        elif self.process.is_alive():
+            return False
+
+        self.process.join()
+        self.connection.close()
+        self.poller.fail_with_retry(
+            self.token,
+            self.task,
+            reason="process {} died: exit code {}".format(
+                self.process.pid, self.process.exitcode
+            ),
+        )
+        self.process = None
+        return True
+
+    def reap(self):
+        """
+        Kill the running task along with the process, left to restart.
+        """
+        logger.warning("killing (KILL) worker with pid={}".format(self.process.pid))
+        reap_process_tree(self.process.pid)
+        self.process.join()
+        self.connection.close()
+        self.process = None
+
+
+class ActivitySlots(object):
+    """
+    Run up to `nb_slots` activity tasks concurrently in long-lived processes.
+
+    A supervision thread detects finished tasks and heartbeats the running
+    ones; cancelled tasks are reaped with their process tree, like with
+    spawn(). The poller thread restarts the slot processes between two checks,
+    so that they don't inherit a lock the supervision thread holds, such as
+    the logging ones.
+    """
+
+    def __init__(self, poller, nb_slots, heartbeat=60):
+        """
+        :param poller:
+        :type poller: ActivityPoller
+        :param nb_slots: number of slots
+        :type nb_slots: int
+        :param heartbeat: heartbeat delay (seconds), None to disable it
+        :type heartbeat: Optional[float]
+        """
+        self._poller = poller
+        self._heartbeat = heartbeat
+        self._heartbeater = poller.heartbeater if heartbeat else None
+        self._slots = [
+            ActivitySlot(poller) for _ in range(nb_slots)
+        ]  # type: List[ActivitySlot]
+        self._condition = threading.Condition()
+        # Held by the supervision thread while checking a slot, and by the
+        # poller thread while forking one
+        self._fork_lock = threading.Lock()
+        self._stopped = False
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def start(self):
+        for slot in self._slots:
+            slot.start()
+        self._thread = threading.Thread(target=self._supervise)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Wait for the running tasks then stop the slot processes.
+        """
+        with self._condition:
+            while any(slot.busy for slot in self._slots):
+                self._condition.wait()
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+        for slot in self._slots:
+            slot.stop()
+
+    def wait_for_free_slot(self):
+        with self._condition:
+            while all(slot.busy for slot in self._slots):
+                self._condition.wait()
+            stopped_slots = [slot for slot in self._slots if not slot.started]
+        for slot in stopped_slots:
+            self._restart(slot)
+
+    def _restart(self, slot):
+        """
+        Restart a slot whose process died or was reaped.
+
+        :param slot:
+        :type slot: ActivitySlot
+        """
+        with self._fork_lock:
+            if not slot.started:
+                slot.start()
+
+    def submit(self, token, task, raw_response):
+        """
+        Run a task in a free slot.
+
+        :param token:
+        :type token: str
+        :param task:
+        :type task: swf.models.ActivityTask
+        :param raw_response: activity task as polled from SWF
+        :type raw_response: Dict[str, Any]
+        """
+        with self._condition:
+            slot = next(slot for slot in self._slots if not slot.busy)
+        self._restart(slot)
+        with self._condition:
+            slot.submit(token, task, raw_response)
+        if self._heartbeater is not None:
+            self._heartbeater.register(token, self._heartbeat)
+        logger.info(
+            "running activity {} in slot pid={}".format(
+                task.activity_id, slot.process.pid
+            )
+        )
+
+    def _supervise(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                self._condition.wait(SLOTS_SUPERVISION_INTERVAL)
+                busy_slots = [slot for slot in self._slots if slot.busy]
+            for slot in busy_slots:
+                with self._fork_lock:
+                    self._check(slot)
+
+    def _check(self, slot):
+        """
+        Release the slot if its task is finished, else heartbeat it if needed.
+
+        :param slot:
+        :type slot: ActivitySlot
+        """
+        if slot.is_finished():
+            self._release(slot)
+            return
+        if self._heartbeater is not None:
+            if time.time() - slot.last_heartbeat < HEARTBEATER_CHECK_INTERVAL:
+                return
+            slot.last_heartbeat = time.time()
+            try:
+                status = self._heartbeater.status(slot.token)
+            except Exception as error:
+                # Keep supervising the other slots.
+                logger.error(
+                    "cannot get the heartbeat status of task {}: {}".format(
+                        slot.task.activity_type.name, error
                     )
-            if worker.exitcode != 0:
-                poller.fail_with_retry(
-                    token,
-                    task,
-                    reason="process {} died: exit code {}".format(
-                        worker.pid, worker.exitcode
-                    ),
                 )
+                return
+            # Task cancelled or no longer existing.
+            if status is not None:
+                slot.reap()
+                self._release(slot)
+            return
+        if not self._heartbeat or time.time() - slot.last_heartbeat < self._heartbeat:
             return
+
+        token, task = slot.token, slot.task
+        slot.last_heartbeat = time.time()
         try:
-            logger.debug("heartbeating for pid={} (token={})".format(worker.pid, token))
-            response = poller.heartbeat(token)
+            logger.debug(
+                "heartbeating for pid={} (token={})".format(slot.process.pid, token)
+            )
+            response = self._poller.heartbeat(token)
         except swf.exceptions.DoesNotExistError as error:
             # Either the task or the workflow execution no longer exists,
             # let's kill the worker process.
             logger.warning("heartbeat failed: {}".format(error))
-            logger.warning("killing (KILL) worker with pid={}".format(worker.pid))
-            reap_process_tree(worker.pid)
+            slot.reap()
+            self._release(slot)
             return
         except swf.exceptions.RateLimitExceededError as error:
-            # ignore rate limit errors: high chances the next heartbeat will be
-            # ok anyway, so it would be stupid to break the task for that
             logger.warning(
                 'got a "ThrottlingException / Rate exceeded" when heartbeating for task {}: {}'.format(
                     task.activity_type.name, error
                 )
             )
-            continue
+            return
         except Exception as error:
-            # Let's crash if it cannot notify the heartbeat failed.  The
-            # subprocess will become orphan and the heartbeat timeout may
-            # eventually trigger on Amazon SWF side.
+            # Unlike spawn() we can't crash: other slots are still running.
+            # The heartbeat timeout may eventually trigger on Amazon SWF side.
             logger.error(
                 "cannot send heartbeat for task {}: {}".format(
                     task.activity_type.name, error
                 )
             )
-            raise
+            return
 
         # Task cancelled.
         if response and response.get("cancelRequested"):
-            reap_process_tree(worker.pid)
-            return
+            slot.reap()
+            self._release(slot)
+
+    def _release(self, slot):
+        if self._heartbeater is not None:
+            self._heartbeater.unregister(slot.token)
+        with self._condition:
+            slot.release()
+            self._condition.notify_all()
@@ -1,11 +1,16 @@
 from __future__ import absolute_import
 
 import swf.models
+from simpleflow.dispatch.dynamic_dispatcher import preload_modules
+from simpleflow.swf.constants import HEARTBEAT_BURST, HEARTBEAT_RATE
 
 from .base import ActivityPoller, Worker
+from .heartbeat import start_heartbeater
 
 
-def make_worker_poller(domain, task_list, heartbeat, process_mode, poll_data):
+def make_worker_poller(
+    domain, task_list, heartbeat, process_mode, poll_data, nb_slots=None, prefetch=False
+):
     """
     Make a worker poller for the domain and task list.
     :param domain:
@@ -14,15 +19,27 @@ def make_worker_poller(domain, task_list, heartbeat, process_mode, poll_data):
     :type task_list: str
     :param heartbeat:
     :type heartbeat: int
-    :param process_mode: Whether to process locally (default) or spawn a Kubernetes job.
+    :param process_mode: Whether to process locally (default), concurrently or spawn a Kubernetes job.
     :type process_mode: str
     :param poll_data: Base64 encoded poll data from SWF, in case you don't want to poll directly.
     :type poll_data: str
+    :param nb_slots: Number of concurrent activities in the "concurrent" process mode.
+    :type nb_slots: Optional[int]
+    :param prefetch: Poll the next task while the current one is processed.
+    :type prefetch: bool
     :return:
     :rtype: ActivityPoller
     """
     domain = swf.models.Domain(domain)
-    return ActivityPoller(domain, task_list, heartbeat, process_mode, poll_data)
+    return ActivityPoller(
+        domain,
+        task_list,
+        heartbeat,
+        process_mode,
+        poll_data,
+        nb_slots=nb_slots,
+        prefetch=prefetch,
+    )
 
 
 def start(
@@ -33,6 +50,9 @@ def start(
     one_task=False,
     process_mode=None,
     poll_data=None,
+    nb_slots=None,
+    prefetch=False,
+    preload=None,
 ):
     """
     Start a worker for the given domain and task_list.
@@ -46,12 +66,32 @@ def start(
     :type heartbeat: Optional[int]
     :param one_task: Process only one task then shutdown
     :type one_task: Optional[bool]
-    :param process_mode: Whether to process locally (default) or spawn a Kubernetes job.
+    :param process_mode: Whether to process locally (default), concurrently or spawn a Kubernetes job.
     :type process_mode: Optional[str]
     :param poll_data: Base64 encoded poll data from SWF, in case you don't want to poll directly.
     :type poll_data: Optional[str]
+    :param nb_slots: Number of concurrent activities per process in the
+        "concurrent" process mode. Default: number of CPUs
+    :type nb_slots: Optional[int]
+    :param prefetch: Poll the next task while the current one is processed.
+        Only supported in the local process mode.
+    :type prefetch: bool
+    :param preload: Modules imported at startup instead of in each task.
+    :type preload: Optional[List[str]]
     """
-    poller = make_worker_poller(domain, task_list, heartbeat, process_mode, poll_data)
+    if preload:
+        # The worker processes, and the task processes they fork, inherit them.
+        preload_modules(preload)
+
+    poller = make_worker_poller(
+        domain,
+        task_list,
+        heartbeat,
+        process_mode,
+        poll_data,
+        nb_slots=nb_slots,
+        prefetch=prefetch,
+    )
 
     if poll_data:
         # if "poll_data" is provided, no need to process it multiple times
@@ -59,7 +99,19 @@ def start(
 
     if one_task:
         poller.run_once()
-    else:
+        return
+
+    # All the tasks of the worker processes are heartbeated by a single
+    # multiplexer, which spreads heartbeats under a global rate limit.
+    manager = None
+    if heartbeat and HEARTBEAT_RATE and poller.process_mode != "kubernetes":
+        manager, poller.heartbeater = start_heartbeater(
+            poller.domain.name, task_list, HEARTBEAT_RATE, HEARTBEAT_BURST
+        )
+    try:
         worker = Worker(poller, nb_processes)
         worker.is_alive = True
         worker.start()
+    finally:
+        if manager is not None:
+            manager.shutdown()
@@ -1,13 +1,29 @@
 import multiprocessing
 import os
+import random
+import signal
+import threading
 import time
+from multiprocessing.managers import BaseManager
+from typing import TYPE_CHECKING
 
+import swf.actors
 import swf.exceptions
+import swf.models
 from simpleflow import logger
 from simpleflow._decorators import deprecated
 from simpleflow.utils import retry
 
-__all__ = ["Heartbeater", "HeartbeatProcess"]
+if TYPE_CHECKING:
+    from typing import Callable, Dict, Optional  # NOQA
+
+__all__ = [
+    "Heartbeater",
+    "HeartbeatProcess",
+    "HeartbeatMultiplexer",
+    "TokenBucket",
+    "start_heartbeater",
+]
 
 
 @deprecated
@@ -122,3 +138,300 @@ class Heartbeater(object):  # Are people using it?
         self._heartbeater.terminate()
 
         return self
+
+
+# Statuses of a task reported by the heartbeater
+CANCEL_REQUESTED = "cancel_requested"
+DOES_NOT_EXIST = "does_not_exist"
+
+# Delay before heartbeating again a task after a throttling error (seconds)
+THROTTLING_RETRY_DELAY = 1.0
+
+# Longest sleep of the heartbeating thread, so that new tasks are picked up
+# quickly enough (seconds)
+MAX_IDLE_DELAY = 1.0
+
+
+class TokenBucket(object):
+    """
+    Token bucket: allows `rate` operations per second on average, with bursts
+    of up to `capacity` operations.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.time):
+        """
+        :param rate: tokens added per second
+        :type rate: float
+        :param capacity: maximum number of tokens; defaults to `rate`
+        :type capacity: Optional[float]
+        :param clock:
+        :type clock: Callable[[], float]
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def consume(self):
+        """
+        Take a token if one is available.
+
+        :rtype: bool
+        """
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def delay(self):
+        """
+        Seconds until a token is available.
+
+        :rtype: float
+        """
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class HeartbeatedTask(object):
+    __slots__ = ("token", "interval", "next_heartbeat", "details", "status")
+
+    def __init__(self, token, interval, next_heartbeat, details=None):
+        self.token = token
+        self.interval = interval
+        self.next_heartbeat = next_heartbeat
+        self.details = details
+        self.status = None  # type: Optional[str]
+
+
+class HeartbeatMultiplexer(object):
+    """
+    Heartbeat the activity tasks run by the processes of a worker, i.e. of
+    one `simpleflow worker.start` invocation.
+
+    Tasks are registered with their heartbeat interval and heartbeated by a
+    single thread, under a global rate limit. Heartbeats are jittered so that
+    tasks started together don't heartbeat together. The running tasks poll
+    the `status` of their token to know whether they were cancelled or don't
+    exist anymore.
+    """
+
+    def __init__(self, actor, rate=10, burst=None, jitter=0.1, clock=time.time):
+        """
+        :param actor: actor used to heartbeat
+        :type actor: swf.actors.ActivityWorker
+        :param rate: maximum number of heartbeats per second
+        :type rate: float
+        :param burst: maximum number of heartbeats sent at once
+        :type burst: Optional[float]
+        :param jitter: fraction of the interval by which heartbeats are advanced
+        :type jitter: float
+        :param clock:
+        :type clock: Callable[[], float]
+        """
+        self._actor = actor
+        self._bucket = TokenBucket(rate, burst, clock=clock)
+        self._jitter = jitter
+        self._clock = clock
+        self._tasks = {}  # type: Dict[str, HeartbeatedTask]
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def _next_heartbeat(self, interval):
+        # Never later than the interval, so the heartbeat timeout isn't hit
+        return self._clock() + interval * (1 - self._jitter * random.random())
+
+    def register(self, token, interval, details=None):
+        """
+        Heartbeat a task every `interval` seconds, or a bit less.
+
+        :param token:
+        :type token: str
+        :param interval:
+        :type interval: float
+        :param details: sent with each heartbeat of the task; they aren't
+            updated afterwards
+        :type details: Optional[str]
+        """
+        with self._lock:
+            self._tasks[token] = HeartbeatedTask(
+                token, interval, self._next_heartbeat(interval), details
+            )
+
+    def unregister(self, token):
+        """
+        Stop heartbeating a task.
+
+        :param token:
+        :type token: str
+        :return: last status of the task
+        :rtype: Optional[str]
+        """
+        with self._lock:
+            task = self._tasks.pop(token, None)
+        return task.status if task else None
+
+    def status(self, token):
+        """
+        :param token:
+        :type token: str
+        :return: None, CANCEL_REQUESTED or DOES_NOT_EXIST
+        :rtype: Optional[str]
+        """
+        with self._lock:
+            task = self._tasks.get(token)
+            return task.status if task else None
+
+    def heartbeat_due_tasks(self):
+        """
+        Heartbeat the tasks whose heartbeat is due, as long as the rate limit
+        allows it.
+
+        :return: seconds until there may be something to do again
+        :rtype: float
+        """
+        with self._lock:
+            due = sorted(
+                (
+                    task
+                    for task in self._tasks.values()
+                    if task.status is None and task.next_heartbeat <= self._clock()
+                ),
+                key=lambda task: task.next_heartbeat,
+            )
+        for task in due:
+            if not self._bucket.consume():
+                return self._bucket.delay()
+            self._heartbeat(task)
+
+        with self._lock:
+            next_heartbeats = [
+                task.next_heartbeat
+                for task in self._tasks.values()
+                if task.status is None
+            ]
+        if not next_heartbeats:
+            return MAX_IDLE_DELAY
+        return min(MAX_IDLE_DELAY, max(0.0, min(next_heartbeats) - self._clock()))
+
+    def _heartbeat(self, task):
+        """
+        :param task:
+        :type task: HeartbeatedTask
+        """
+        status = None
+        next_heartbeat = self._next_heartbeat(task.interval)
+        try:
+            logger.debug("heartbeating token={}".format(task.token))
+            response = self._actor.heartbeat(task.token, task.details)
+        except swf.exceptions.DoesNotExistError as error:
+            # Either the task or the workflow execution no longer exists.
+            logger.warning("heartbeat failed: {}".format(error))
+            status = DOES_NOT_EXIST
+        except swf.exceptions.RateLimitExceededError as error:
+            logger.warning(
+                'got a "ThrottlingException / Rate exceeded" when heartbeating token={}: {}'.format(
+                    task.token, error
+                )
+            )
+            next_heartbeat = self._clock() + THROTTLING_RETRY_DELAY
+        except Exception as error:
+            # The heartbeat timeout may eventually trigger on Amazon SWF side.
+            logger.error(
+                "cannot send heartbeat for token={}: {}".format(task.token, error)
+            )
+        else:
+            if response and response.get("cancelRequested"):
+                status = CANCEL_REQUESTED
+
+        with self._lock:
+            task.status = status
+            task.next_heartbeat = next_heartbeat
+
+    def run(self):
+        while not self._stopped.is_set():
+            delay = self.heartbeat_due_tasks()
+            self._stopped.wait(delay)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+
+def _init_heartbeater(parent_pid):
+    """
+    The heartbeater must outlive the pollers when they shut down gracefully,
+    but not the process that started it: it exits once orphaned.
+
+    :param parent_pid:
+    :type parent_pid: int
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    thread = threading.Thread(target=_exit_with_parent, args=(parent_pid,))
+    thread.daemon = True
+    thread.start()
+
+
+def _exit_with_parent(parent_pid):
+    while os.getppid() == parent_pid:
+        time.sleep(MAX_IDLE_DELAY)
+    logger.warning("heartbeater: parent process {} is gone".format(parent_pid))
+    os._exit(1)
+
+
+def _make_heartbeat_multiplexer(domain, task_list, rate, burst):
+    actor = swf.actors.ActivityWorker(swf.models.Domain(domain), task_list)
+    multiplexer = HeartbeatMultiplexer(actor, rate, burst)
+    multiplexer.start()
+    return multiplexer
+
+
+class HeartbeatManager(BaseManager):
+    """
+    Serves a HeartbeatMultiplexer to the processes of a worker.
+    """
+
+
+HeartbeatManager.register(
+    "HeartbeatMultiplexer",
+    _make_heartbeat_multiplexer,
+    exposed=("register", "unregister", "status"),
+)
+
+
+def start_heartbeater(domain, task_list, rate, burst=None):
+    """
+    Start a heartbeat multiplexer in a new process.
+
+    :param domain: domain name
+    :type domain: str
+    :param task_list:
+    :type task_list: str
+    :param rate: maximum number of heartbeats per second
+    :type rate: float
+    :param burst: maximum number of heartbeats sent at once
+    :type burst: Optional[float]
+    :return: manager, to shut down, and multiplexer proxy, to share with
+        the worker processes
+    :rtype: (HeartbeatManager, HeartbeatMultiplexer)
+    """
+    manager = HeartbeatManager()
+    manager.start(_init_heartbeater, (os.getpid(),))
+    return manager, manager.HeartbeatMultiplexer(domain, task_list, rate, burst)
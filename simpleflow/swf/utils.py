@@ -1,5 +1,6 @@
 from __future__ import absolute_import
 
+import json
 from typing import TYPE_CHECKING
 
 import swf.exceptions
@@ -66,30 +67,72 @@ class DecisionsAndContext(object):
     """
     Encapsulate decisions and execution context.
     The execution context contains keys with either plain values, lists or sets.
+
+    Decisions are JSON-encoded once, when added, so that the size of the
+    RespondDecisionTaskCompleted request is known at all times and the
+    encoded decisions can be sent as is.
     """
 
     def __init__(self, decisions=None, execution_context=None):
         self.decisions = decisions or []  # type: List[Decision]
         self.execution_context = execution_context  # type: Dict[str, Any]
+        self._encoded_decisions = [
+            self.encode_decision(d) for d in self.decisions
+        ]  # type: List[str]
+        self._encoded_size = sum(len(d) for d in self._encoded_decisions)
 
     def __repr__(self):
         return "<{} decisions={}, execution_context={}>".format(
             self.__class__.__name__, self.decisions, self.execution_context
         )
 
+    @staticmethod
+    def encode_decision(decision):
+        # type: (Decision) -> str
+        """
+        JSON-encode a decision as is, like boto.swf encodes the decisions of
+        RespondDecisionTaskCompleted requests.
+        """
+        return json.dumps(decision)
+
     def append_decision(self, decision):
         # type: (Decision) -> None
         """
         Append a decision.
         """
-        self.decisions.append(decision)
+        self.extend_decision([decision])
 
-    def extend_decision(self, decisions):
-        # type: (List[Decision]) -> None
+    def extend_decision(self, decisions, encoded_decisions=None):
+        # type: (List[Decision], List[str]) -> None
         """
         Append a list of decisions.
         """
+        if encoded_decisions is None:
+            encoded_decisions = [self.encode_decision(d) for d in decisions]
         self.decisions += decisions
+        self._encoded_decisions += encoded_decisions
+        self._encoded_size += sum(len(d) for d in encoded_decisions)
+
+    @property
+    def encoded_decisions(self):
+        # type: () -> List[str]
+        """
+        JSON-encoded decisions.
+        """
+        if len(self._encoded_decisions) != len(self.decisions):
+            # self.decisions was modified directly
+            self._encoded_decisions = [self.encode_decision(d) for d in self.decisions]
+            self._encoded_size = sum(len(d) for d in self._encoded_decisions)
+        return self._encoded_decisions
+
+    def request_size(self, encoded_decisions=()):
+        # type: (List[str]) -> int
+        """
+        Size of the JSON list of the decisions, with additional ones.
+        """
+        count = len(self.encoded_decisions) + len(encoded_decisions)
+        size = self._encoded_size + sum(len(d) for d in encoded_decisions)
+        return size + 2 + 2 * max(count - 1, 0)  # "[" + ", ".join(...) + "]"
 
     def append_kv_to_context(self, key, value):
         # type: (str, Any) -> None
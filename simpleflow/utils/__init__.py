@@ -1,3 +1,4 @@
+import inspect
 import re
 from typing import TYPE_CHECKING
 from zlib import adler32
@@ -22,6 +23,50 @@ def issubclass_(arg1, arg2):
         return False
 
 
+class DispatchTable(dict):
+    """
+    Dict whose ``dispatch(key)`` also finds, for a class key, the value
+    registered for its nearest base class, like ``functools.singledispatch``.
+    Resolutions are cached per key until the table is modified.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(DispatchTable, self).__init__(*args, **kwargs)
+        self._dispatch_cache = {}
+
+    def __setitem__(self, key, value):
+        self._dispatch_cache.clear()
+        super(DispatchTable, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._dispatch_cache.clear()
+        super(DispatchTable, self).__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        self._dispatch_cache.clear()
+        super(DispatchTable, self).update(*args, **kwargs)
+
+    def dispatch(self, key):
+        """
+        Get the value registered for key or, if key is a class, for the
+        first class of its MRO having one.
+        :param key:
+        :return: value, or None
+        """
+        try:
+            return self._dispatch_cache[key]
+        except KeyError:
+            pass
+        value = self.get(key)
+        if value is None and isinstance(key, type):
+            for typ in inspect.getmro(key)[1:]:
+                value = self.get(typ)
+                if value is not None:
+                    break
+        self._dispatch_cache[key] = value
+        return value
+
+
 def hex_hash(s):
     """
     Hex hash of a string. Not too much constrained
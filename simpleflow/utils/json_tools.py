@@ -9,6 +9,13 @@ from future.utils import iteritems
 from simpleflow.futures import Future
 
 
+class TransparentProxy(lazy_object_proxy.Proxy):
+    """
+    Lazy proxy serialized as the object it wraps, unlike the other proxies
+    which are serialized as their str().
+    """
+
+
 def serialize_complex_object(obj):
     if isinstance(
         obj, bytes
@@ -34,7 +41,10 @@ def serialize_complex_object(obj):
         return obj.result
     elif isinstance(obj, UUID):
         return str(obj)
+    elif isinstance(obj, TransparentProxy):
+        return obj.__wrapped__
     elif isinstance(obj, lazy_object_proxy.Proxy):
+        # Kept as is: the IDs of idempotent tasks are hashed from it
         return str(obj)
     elif isinstance(obj, (set, frozenset)):
         return list(obj)
@@ -45,6 +55,8 @@ def serialize_complex_object(obj):
 
 
 def _resolve_proxy(obj):
+    if isinstance(obj, TransparentProxy):
+        obj = obj.__wrapped__
     if isinstance(obj, dict):
         return {k: _resolve_proxy(v) for k, v in iteritems(obj)}
     if isinstance(obj, (list, tuple)):
@@ -132,6 +132,17 @@ class Workflow(Submittable):
         """
         pass
 
+    def before_close(self, history):
+        """
+        Method called by the SWF executor once the execution returned, before
+        closing it. Like `run`, it may submit tasks and wait for them, e.g. a
+        timer to delay the closing.
+
+        :param history:
+        :type history: simpleflow.history.History
+        """
+        pass
+
     def after_closed(self, history):
         """
         Method called after closing the execution.
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import json
+
 import boto.exception
 
 from simpleflow import compat, format, logging_context
@@ -23,7 +25,9 @@ class Decider(Actor):
     def __init__(self, domain, task_list):
         super(Decider, self).__init__(domain, task_list)
 
-    def complete(self, task_token, decisions=None, execution_context=None):
+    def complete(
+        self, task_token, decisions=None, execution_context=None, encoded_decisions=None
+    ):
         """Responds to ``swf`` decisions have been made about
         the task with `task_token``
 
@@ -35,15 +39,25 @@ class Decider(Actor):
         :type   decisions: list[swf.models.decision.base.Decision]
         :param execution_context: User-defined context to add to workflow execution.
         :type execution_context: str
+        :param encoded_decisions: The same decisions, already JSON-encoded;
+                                  sent as is if provided
+        :type encoded_decisions: Optional[list[str]]
         """
         if execution_context is not None and not isinstance(
             execution_context, compat.string_types
         ):
             execution_context = json_dumps(execution_context)
         try:
-            self.connection.respond_decision_task_completed(
-                task_token, decisions, format.execution_context(execution_context),
-            )
+            if encoded_decisions is None:
+                self.connection.respond_decision_task_completed(
+                    task_token, decisions, format.execution_context(execution_context),
+                )
+            else:
+                self._respond_with_encoded_decisions(
+                    task_token,
+                    encoded_decisions,
+                    format.execution_context(execution_context),
+                )
         except boto.exception.SWFResponseError as e:
             message = self.get_error_message(e)
             if e.error_code == "UnknownResourceFault":
@@ -55,11 +69,36 @@ class Decider(Actor):
         finally:
             logging_context.reset()
 
+    def _respond_with_encoded_decisions(
+        self, task_token, encoded_decisions, execution_context=None
+    ):
+        """Same as ``connection.respond_decision_task_completed``, with
+        already encoded decisions
+
+        :param  task_token: completed decision task token
+        :type   task_token: str
+        :param  encoded_decisions: JSON-encoded decisions
+        :type   encoded_decisions: list[str]
+        :param  execution_context: encoded execution context
+        :type   execution_context: Optional[str]
+        """
+        data = {"taskToken": task_token}
+        # An empty context clears the latest one
+        if execution_context is not None:
+            data["executionContext"] = execution_context
+        body = '{}, "decisions": [{}]}}'.format(
+            json.dumps(data)[:-1], ", ".join(encoded_decisions)
+        )
+        return self.connection.make_request("RespondDecisionTaskCompleted", body)
+
     def poll(self, task_list=None, identity=None, **kwargs):
         """
         Polls a decision task and returns the token and the full history of the
         workflow's events.
 
+        The history is paginated lazily: the next pages of events are only
+        fetched when the parsing reaches them, one at a time.
+
         :param task_list: task list to poll for decision tasks from.
         :type task_list: str
 
@@ -85,11 +124,45 @@ class Decider(Actor):
         if not token:
             raise PollTimeout("Decider poll timed out")
 
-        events = task["events"]
         logging_context.set("workflow_id", task["workflowExecution"]["workflowId"])
         logging_context.set("task_type", "decision")
         logging_context.set("event_id", task["startedEventId"])
 
+        history = History.from_event_pages(
+            self._iter_event_pages(task, task_list, identity, **kwargs)
+        )
+
+        workflow_type = WorkflowType(
+            domain=self.domain,
+            name=task["workflowType"]["name"],
+            version=task["workflowType"]["version"],
+        )
+        execution = WorkflowExecution(
+            domain=self.domain,
+            workflow_id=task["workflowExecution"]["workflowId"],
+            run_id=task["workflowExecution"]["runId"],
+            workflow_type=workflow_type,
+        )
+
+        # TODO: move history into execution (needs refactoring on WorkflowExecution.history())
+        return Response(token=token, history=history, execution=execution)
+
+    def _iter_event_pages(self, task, task_list, identity=None, **kwargs):
+        """
+        Yields the events of a polled decision task, page by page, fetching
+        the next ones on demand.
+
+        :param task: first page of the PollForDecisionTask response
+        :type task: dict[str, Any]
+        :param task_list: task list the decision task was polled from
+        :type task_list: str
+        :param identity: identity of the decider
+        :type identity: Optional[str]
+
+        :rtype: collections.Iterator[list[dict[str, Any]]]
+        """
+        yield task["events"]
+
         next_page = task.get("nextPageToken")
         while next_page:
             try:
@@ -113,22 +186,5 @@ class Decider(Actor):
             if not token:
                 raise PollTimeout("Decider poll timed out")
 
-            events.extend(task["events"])
+            yield task["events"]
             next_page = task.get("nextPageToken")
-
-        history = History.from_event_list(events)
-
-        workflow_type = WorkflowType(
-            domain=self.domain,
-            name=task["workflowType"]["name"],
-            version=task["workflowType"]["version"],
-        )
-        execution = WorkflowExecution(
-            domain=self.domain,
-            workflow_id=task["workflowExecution"]["workflowId"],
-            run_id=task["workflowExecution"]["runId"],
-            workflow_type=workflow_type,
-        )
-
-        # TODO: move history into execution (needs refactoring on WorkflowExecution.history())
-        return Response(token=token, history=history, execution=execution)
@@ -11,7 +11,30 @@ import pytz
 from future.utils import iteritems
 
 from simpleflow import format
-from swf.utils import cached_property, camel_to_underscore
+from simpleflow.compat import intern
+from swf.utils import camel_to_underscore, decapitalize
+
+# camelCase raw key -> snake_case attribute name
+_ATTRIBUTE_NAMES = {}
+
+# attributes key -> {snake_case attribute name: camelCase raw key}
+_ATTRIBUTE_KEYS = {}
+
+_NOT_DECODED = object()
+
+
+def _attribute_name(raw_key):
+    """Returns the snake_case attribute name of a raw event key
+
+    :param  raw_key: camelCase key, e.g. 'scheduledEventId'
+    :type   raw_key: str
+
+    :rtype: str
+    """
+    name = _ATTRIBUTE_NAMES.get(raw_key)
+    if name is None:
+        name = _ATTRIBUTE_NAMES[raw_key] = intern(str(camel_to_underscore(raw_key)))
+    return name
 
 
 class Event(object):
@@ -31,6 +54,10 @@ class Event(object):
     instance would for example have type 'DecisionTask',
     name 'DecisionTaskScheduleFailed', id '1' and state 'failed'.
 
+    Events have no ``__dict__``: the attributes stored under the
+    attributes key of the raw event are read from it when accessed, and
+    ``input`` and ``control`` are decoded on first access.
+
     :param  id: event id provided by amazon service
     :type   id: string
 
@@ -42,30 +69,111 @@ class Event(object):
 
     :param  raw_data: raw_event representation provided by amazon service
     :type   raw_data: dict
+
+    :param  name: event name, e.g. 'DecisionTaskScheduleFailed'
+    :type   name: Optional[str]
+
+    :param  attributes_key: key of the event attributes in ``raw_data``
+    :type   attributes_key: Optional[str]
     """
 
+    __slots__ = (
+        "_id",
+        "_state",
+        "_timestamp",
+        "_datetime",
+        "_name",
+        "_attributes_key",
+        "_input",
+        "_control",
+        "_raw",
+    )
+
     _type = None
-    _name = None
-    _attributes_key = None
-    _attributes = None
 
     excluded_attributes = ("eventId", "eventType", "eventTimestamp")
 
-    def __init__(self, id, state, timestamp, raw_data):
+    def __init__(self, id, state, timestamp, raw_data, name=None, attributes_key=None):
         """
         """
+        if attributes_key is None and name is not None:
+            attributes_key = decapitalize(name) + "EventAttributes"
+
         self._id = id
         self._state = state
         self._timestamp = timestamp
-        self._input = {}
-        self._control = None
-        self.raw = raw_data or {}
-
-        self.process_attributes()
+        self._datetime = None
+        self._name = name
+        self._attributes_key = attributes_key
+        self._input = _NOT_DECODED
+        self._control = _NOT_DECODED
+        self._raw = raw_data or {}
 
     def __repr__(self):
         return "<Event %s %s : %s >" % (self.id, self.type, self.state)
 
+    def __getattr__(self, name):
+        # Only called when the name isn't a slot or class attribute: look
+        # for it in the raw event attributes.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attributes = self.attributes
+        key = self._attribute_key(name, attributes)
+        if key is None:
+            raise AttributeError(
+                "'{}' object has no attribute '{}'".format(
+                    self.__class__.__name__, name
+                )
+            )
+        return attributes[key]
+
+    def __getstate__(self):
+        # Decoded values are left out, they're rebuilt on access
+        return dict(
+            (slot, getattr(self, slot))
+            for slot in (
+                "_id",
+                "_state",
+                "_timestamp",
+                "_name",
+                "_attributes_key",
+                "_raw",
+            )
+        )
+
+    def __setstate__(self, state):
+        self._datetime = None
+        self._input = self._control = _NOT_DECODED
+        for slot, value in iteritems(state):
+            setattr(self, slot, value)
+
+    @property
+    def attributes(self):
+        """Raw attributes of the event, as provided by amazon service"""
+        return self._raw.get(self._attributes_key) or {}
+
+    def _attribute_key(self, name, attributes):
+        """Returns the raw key of the ``name`` attribute, if present
+
+        :param  name: snake_case attribute name
+        :type   name: str
+        :param  attributes: raw event attributes
+        :type   attributes: dict[str, Any]
+
+        :rtype: Optional[str]
+        """
+        keys = _ATTRIBUTE_KEYS.setdefault(self._attributes_key, {})
+        key = keys.get(name)
+        if key is None:
+            for raw_key in attributes:
+                keys.setdefault(_attribute_name(raw_key), raw_key)
+            key = keys.get(name)
+        return key if key in attributes else None
+
+    @property
+    def raw(self):
+        return self._raw
+
     @property
     def id(self):
         return self._id
@@ -82,28 +190,21 @@ class Event(object):
     def state(self):
         return self._state
 
-    @cached_property
+    @property
     def timestamp(self):
-        return datetime.fromtimestamp(self._timestamp, tz=pytz.UTC)
+        if self._datetime is None:
+            self._datetime = datetime.fromtimestamp(self._timestamp, tz=pytz.UTC)
+        return self._datetime
 
     @property
     def input(self):
+        if self._input is _NOT_DECODED:
+            value = self.attributes.get("input")
+            self._input = format.decode(value) if value is not None else {}
         return self._input
 
-    @input.setter
-    def input(self, value):
-        self._input = format.decode(value)
-
     @property
     def control(self):
+        if self._control is _NOT_DECODED:
+            self._control = format.decode(self.attributes.get("control"))
         return self._control
-
-    @control.setter
-    def control(self, value):
-        self._control = format.decode(value)
-
-    def process_attributes(self):
-        """Processes the event raw_data attributes_key elements
-        and sets current instance attributes accordingly"""
-        for key, value in iteritems(self.raw[self._attributes_key]):
-            setattr(self, camel_to_underscore(key), value)
@@ -71,7 +71,7 @@ class CompiledEvent(Event, Stateful):
                     event.state, self.initial_state
                 )
             )
-        self.__dict__ = event.__dict__.copy()
+        self.__setstate__(event.__getstate__())
 
     def __repr__(self):
         return "<CompiledEvent %s %s>" % (self.type, self.state)
@@ -95,4 +95,4 @@ class CompiledEvent(Event, Stateful):
         if event.state not in self.transitions[self.state]:
             raise TransitionError("Transition to state %s not allowed")
 
-        self.__dict__ = event.__dict__.copy()
+        self.__setstate__(event.__getstate__())
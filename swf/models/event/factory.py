@@ -7,6 +7,7 @@
 
 import collections
 
+from simpleflow.compat import intern
 from swf.models.event.marker import CompiledMarkerEvent, MarkerEvent
 from swf.models.event.task import (
     ActivityTaskEvent,
@@ -96,30 +97,60 @@ class EventFactory(object):
     # eventType to Event subclass bindings
     events = EVENTS
 
+    # eventType to (Event subclass, name, state, attributes key); the
+    # strings are interned and shared by the events of the same type
+    _event_types = {}
+
     def __new__(klass, raw_event):
-        event_id = raw_event["eventId"]
         event_name = raw_event["eventType"]
-        event_timestamp = raw_event["eventTimestamp"]
+        event_type = klass._event_types.get(event_name)
+        if event_type is None:
+            event_type = klass._event_types[event_name] = klass._parse_event_name(
+                event_name
+            )
+        event_class, name, state, attributes_key = event_type
+
+        instance = event_class(
+            id=raw_event["eventId"],
+            state=state,
+            timestamp=raw_event["eventTimestamp"],
+            raw_data=raw_event,
+            name=name,
+            attributes_key=attributes_key,
+        )
+
+        return instance
+
+    @classmethod
+    def _parse_event_name(klass, event_name):
+        """Extracts the event class, name, state and attributes key from
+        raw event_name
+
+        :param  event_name:
+
+        Example:
 
+            with event_name = 'StartChildWorkflowExecutionInitiated'
+
+        Returns:
+
+            (ChildWorkflowExecutionEvent, 'StartChildWorkflowExecutionInitiated',
+             'start_initiated', 'startChildWorkflowExecutionInitiatedEventAttributes')
+
+        """
         event_type = klass._extract_event_type(event_name)
         event_state = klass._extract_event_state(event_type, event_name)
         # amazon swf format is not very normalized and event attributes
         # response field is non-capitalized...
         event_attributes_key = decapitalize(event_name) + "EventAttributes"
 
-        klass = EventFactory.events[event_type]["event"]
-        klass._name = event_name
-        klass._attributes_key = event_attributes_key
-
-        instance = klass(
-            id=event_id,
-            state=event_state,
-            timestamp=event_timestamp,
-            raw_data=raw_event,
+        return (
+            klass.events[event_type]["event"],
+            intern(str(event_name)),
+            intern(str(event_state)),
+            intern(str(event_attributes_key)),
         )
 
-        return instance
-
     @classmethod
     def _extract_event_type(klass, event_name):
         """Extracts event type from raw event_name
@@ -10,6 +10,7 @@ from swf.models.event.compiler import CompiledEvent
 
 
 class ActivityTaskEvent(Event):
+    __slots__ = ()
     _type = "ActivityTask"
 
 
@@ -42,6 +43,7 @@ class CompiledActivityTaskEvent(CompiledEvent):
 
 
 class DecisionTaskEvent(Event):
+    __slots__ = ()
     _type = "DecisionTask"
 
 
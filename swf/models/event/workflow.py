@@ -10,6 +10,7 @@ from swf.models.event.compiler import CompiledEvent
 
 
 class WorkflowExecutionEvent(Event):
+    __slots__ = ()
     _type = "WorkflowExecution"
 
 
@@ -46,6 +47,7 @@ class CompiledWorkflowExecutionEvent(CompiledEvent):
 
 
 class ChildWorkflowExecutionEvent(Event):
+    __slots__ = ()
     _type = "ChildWorkflowExecution"
 
 
@@ -73,6 +75,7 @@ class CompiledChildWorkflowExecutionEvent(CompiledEvent):
 
 
 class ExternalWorkflowExecutionEvent(Event):
+    __slots__ = ()
     _type = "ExternalWorkflowExecution"
 
 
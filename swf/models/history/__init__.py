@@ -1 +1 @@
-from .base import History  # NOQA
+from .base import History, LazyPagedHistory  # NOQA
@@ -113,6 +113,18 @@ class History(object):
         """
         return self.next()
 
+    def iter_events(self, start=0):
+        """Iterates over the events, starting at index *start*
+
+        :param  start: index of the first event to return
+        :type   start: int
+
+        :rtype: collections.Iterator[swf.models.event.Event]
+        """
+        events = self.events
+        for index in range(start, len(events)):
+            yield events[index]
+
     @property
     def last(self):
         """Returns the last stored event
@@ -275,3 +287,75 @@ class History(object):
             events_history.append(event)
 
         return cls(events=events_history, raw=data)
+
+    @classmethod
+    def from_event_pages(cls, pages):
+        """Instantiates a ``swf.models.history.LazyPagedHistory`` from
+        successive pages of an amazon service response.
+
+        :param  pages: pages of events, typically a generator fetching them
+        :type   pages: collections.Iterable[list[dict[str, Any]]]
+
+        :rtype: swf.models.history.LazyPagedHistory
+        """
+        return LazyPagedHistory(pages)
+
+
+class LazyPagedHistory(History):
+    """History built lazily from pages of events
+
+    Pages are only pulled, and their events instantiated, when
+    ``iter_events`` or an index access reaches them: a page is pulled
+    synchronously, once the events of the previous ones are consumed, so
+    pulling and parsing don't overlap. The events of pulled pages are kept,
+    like in ``History``. Any other access loads the whole history.
+
+    :param  pages: pages of events, typically a generator fetching them
+    :type   pages: collections.Iterable[list[dict[str, Any]]]
+    """
+
+    def __init__(self, pages):
+        self._pages = iter(pages)
+        self._events = []
+        self.it_pos = 0
+
+    @property
+    def events(self):
+        while self._load_next_page():
+            pass
+        return self._events
+
+    @property
+    def raw(self):
+        return [event.raw for event in self.events]
+
+    def _load_next_page(self):
+        """Instantiates the events of the next page, if any
+
+        :returns: whether a page was loaded
+        :rtype: bool
+        """
+        if self._pages is None:
+            return False
+        page = next(self._pages, None)
+        if page is None:
+            self._pages = None
+            return False
+        self._events.extend(EventFactory(d) for d in page)
+        return True
+
+    def __getitem__(self, val):
+        if isinstance(val, int) and val >= 0:
+            while val >= len(self._events) and self._load_next_page():
+                pass
+            return self._events[val]
+        return super(LazyPagedHistory, self).__getitem__(val)
+
+    def iter_events(self, start=0):
+        index = start
+        while True:
+            while index >= len(self._events):
+                if not self._load_next_page():
+                    return
+            yield self._events[index]
+            index += 1
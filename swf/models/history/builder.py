@@ -718,6 +718,50 @@ class History(swf.models.History):
 
         return self
 
+    def add_signal_external_workflow_initiated(
+        self, name, workflow_id, run_id=None, input=None, decision_id=0
+    ):
+        attributes = {
+            "decisionTaskCompletedEventId": decision_id,
+            "input": json_dumps(input) if input is not None else "{}",
+            "signalName": name,
+            "workflowId": workflow_id,
+        }
+        if run_id is not None:
+            attributes["runId"] = run_id
+        self.events.append(
+            EventFactory(
+                {
+                    "eventId": self.next_id,
+                    "eventTimestamp": new_timestamp_string(),
+                    "eventType": "SignalExternalWorkflowExecutionInitiated",
+                    "signalExternalWorkflowExecutionInitiatedEventAttributes": attributes,
+                }
+            )
+        )
+
+        return self
+
+    def add_external_workflow_signaled(self, initiated_id, workflow_id, run_id):
+        self.events.append(
+            EventFactory(
+                {
+                    "eventId": self.next_id,
+                    "eventTimestamp": new_timestamp_string(),
+                    "eventType": "ExternalWorkflowExecutionSignaled",
+                    "externalWorkflowExecutionSignaledEventAttributes": {
+                        "initiatedEventId": initiated_id,
+                        "workflowExecution": {
+                            "workflowId": workflow_id,
+                            "runId": run_id,
+                        },
+                    },
+                }
+            )
+        )
+
+        return self
+
     def add_marker(self, name, details=None):
         self.events.append(
             EventFactory(
@@ -1,14 +1,23 @@
 from __future__ import absolute_import
 
 import json
+import threading
+import time
 import unittest
 
 import boto
+import mock
 
+from simpleflow import futures as futures_module
 from simpleflow import metrology, settings, storage
 from simpleflow.activity import with_attributes
 from simpleflow.constants import HOUR, MINUTE
 from simpleflow.local.executor import Executor
+from simpleflow.swf.executor import Executor as SwfExecutor
+from swf.models.history import builder
+from swf.models.workflow import WorkflowExecution, WorkflowType
+from swf.responses import Response
+from tests.data import DOMAIN
 from tests.moto_compat import mock_s3
 
 
@@ -67,5 +76,219 @@ class MetrologyTestCase(unittest.TestCase):
         self.assertEqual(res[0][1]["metrology"]["steps"][0]["metadata"]["num"], 1)
 
 
+@with_attributes(task_list="test_task_list")
+class MyBackgroundMetrologyTask(metrology.MetrologyTask):
+    background_upload = True
+
+    def __init__(self, num):
+        self.num = num
+
+    def execute(self):
+        with self.step("Step1") as step:
+            step.metadata["num"] = self.num
+            with step.batch():
+                step.read.records += 1
+
+
+class MyBackgroundWorkflow(MyWorkflow):
+    def run(self, num):
+        futures = [self.submit(MyBackgroundMetrologyTask, i) for i in range(num)]
+        futures_module.wait(*futures)
+
+
+class BackgroundMetrologyTestCase(unittest.TestCase):
+    @mock_s3
+    def test_background_upload_and_merge(self):
+        boto.connect_s3().create_bucket(settings.METROLOGY_BUCKET)
+        ex = Executor(MyBackgroundWorkflow)
+        ex.run(input={"args": [5], "kwargs": {}})
+
+        res = json.loads(
+            storage.pull_content(
+                settings.METROLOGY_BUCKET, "local/local/metrology.json"
+            )
+        )
+        self.assertEqual(5, len(res))
+        for _, event in res:
+            num = event["input"]["args"][0]
+            step = event["metrology"]["steps"][0]
+            self.assertEqual(step["metadata"]["num"], num)
+            self.assertEqual(step["latency"]["count"], 1)
+            self.assertGreater(step["resources"]["rss_max"], 0)
+
+    def replay(self, history):
+        executor = SwfExecutor(DOMAIN, MyBackgroundWorkflow)
+        execution = WorkflowExecution(
+            DOMAIN,
+            "wf",
+            "run",
+            workflow_type=WorkflowType(DOMAIN, MyBackgroundWorkflow.name, "v1"),
+        )
+        with mock.patch.object(MyBackgroundWorkflow, "push_metrology"):
+            response = executor.replay(Response(history=history, execution=execution))
+        return [decision["decisionType"] for decision in response.decisions]
+
+    def test_closing_waits_for_background_uploads(self):
+        history = builder.History(
+            MyBackgroundWorkflow, input={"args": [1], "kwargs": {}}
+        )
+        history.add_activity_task(
+            MyBackgroundMetrologyTask,
+            decision_id=0,
+            activity_id="activity-tests.test_metrology.MyBackgroundMetrologyTask-1",
+            input={"args": [0], "kwargs": {}},
+        )
+        timer_id = metrology.UPLOAD_TIMER_PREFIX + "0"
+
+        # Not uploaded yet: checked again later
+        with mock.patch("simpleflow.storage.exists", return_value=False) as exists:
+            self.assertEqual(["StartTimer"], self.replay(history))
+        exists.assert_called_once_with(
+            settings.METROLOGY_BUCKET,
+            "wf/run/activity.activity-tests.test_metrology."
+            "MyBackgroundMetrologyTask-1.json",
+        )
+
+        # Not checked before the timer fires
+        history.add_timer_started(timer_id, metrology.UPLOAD_CHECK_INTERVAL)
+        with mock.patch("simpleflow.storage.exists") as exists:
+            self.assertEqual([], self.replay(history))
+        exists.assert_not_called()
+
+        history.add_timer_fired(timer_id)
+        with mock.patch("simpleflow.storage.exists", return_value=True):
+            self.assertEqual(["CompleteWorkflowExecution"], self.replay(history))
+
+    def test_closing_waits_for_background_uploads_up_to_a_timeout(self):
+        history = builder.History(
+            MyBackgroundWorkflow, input={"args": [1], "kwargs": {}}
+        )
+        history.add_activity_task(
+            MyBackgroundMetrologyTask,
+            decision_id=0,
+            activity_id="activity-tests.test_metrology.MyBackgroundMetrologyTask-1",
+            input={"args": [0], "kwargs": {}},
+        )
+        nb_timers = metrology.UPLOAD_WAIT_TIMEOUT // metrology.UPLOAD_CHECK_INTERVAL
+        for i in range(nb_timers):
+            timer_id = "{}{}".format(metrology.UPLOAD_TIMER_PREFIX, i)
+            history.add_timer_started(timer_id, metrology.UPLOAD_CHECK_INTERVAL)
+            history.add_timer_fired(timer_id)
+        with mock.patch("simpleflow.storage.exists", return_value=False):
+            self.assertEqual(["CompleteWorkflowExecution"], self.replay(history))
+
+    def test_uploads_are_batched_in_the_background(self):
+        pushed = []
+
+        def slow_push(bucket, path, content):
+            time.sleep(0.2)
+            pushed.append(path)
+
+        uploader = metrology.BackgroundUploader()
+        with mock.patch("simpleflow.metrology._push_json", side_effect=slow_push):
+            start = time.time()
+            for i in range(8):
+                uploader.push("bucket", "path{}".format(i), {})
+            self.assertLess(time.time() - start, 0.2)
+            self.assertTrue(uploader.wait(timeout=10))
+        self.assertEqual(sorted(pushed), ["path{}".format(i) for i in range(8)])
+        # At most two batches: the first document, then the others in parallel
+        self.assertLess(time.time() - start, 1)
+        # Nothing left
+        self.assertTrue(uploader.wait(timeout=0))
+
+
+class LatencyHistogramTestCase(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = metrology.LatencyHistogram()
+        # 1ms to 10s
+        for ms in range(1, 10001):
+            histogram.record(ms / 1000.0)
+        self.assertEqual(histogram.count, 10000)
+        self.assertEqual(histogram.min, 0.001)
+        self.assertEqual(histogram.max, 10.0)
+        for percentile, expected in ((50, 5.0), (90, 9.0), (99, 9.9), (99.9, 9.99)):
+            self.assertAlmostEqual(
+                histogram.percentile(percentile), expected, delta=expected / 100
+            )
+        self.assertEqual(histogram.percentile(100), 10.0)
+
+    def test_small_values_are_exact(self):
+        histogram = metrology.LatencyHistogram()
+        histogram.record(0.000042, count=3)
+        self.assertAlmostEqual(histogram.percentile(50), 0.000042)
+
+    def test_stats(self):
+        histogram = metrology.LatencyHistogram()
+        histogram.record(1.0)
+        histogram.record(3.0, count=3)
+        stats = histogram.get_stats()
+        self.assertEqual(stats["count"], 4)
+        self.assertEqual(stats["min"], 1.0)
+        self.assertEqual(stats["mean"], 2.5)
+        self.assertAlmostEqual(stats["p50"], 3.0, delta=0.03)
+        self.assertEqual(sum(count for _, count in stats["buckets"]), 4)
+
+    def test_empty(self):
+        histogram = metrology.LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.get_stats())
+
+
+class StepResourcesTestCase(unittest.TestCase):
+    def test_sampling(self):
+        rss_max = metrology.rss_high_water_mark()
+        with metrology.Step("step", None, sample_interval=0.05) as step:
+            deadline = time.time() + 0.3
+            while time.time() < deadline:
+                step.read.bytes += 1024 * 1024
+                step.read.records += 10
+                sum(range(10000))
+        resources = step.get_stats()["resources"]
+
+        self.assertGreater(resources["cpu"], 0)
+        # The peak, not the highest sample
+        self.assertGreaterEqual(resources["rss_max"], step.resources.rss_max)
+        self.assertGreaterEqual(resources["rss_max"], rss_max)
+        self.assertGreater(resources["throughput_max"]["read_mb_s"], 0)
+        self.assertGreater(resources["throughput_max"]["read_rec_s"], 0)
+        self.assertEqual(resources["throughput_max"]["write_mb_s"], 0)
+        timeline = resources["timeline"]
+        self.assertGreater(len(timeline["samples"]), 1)
+        last = dict(zip(timeline["columns"], timeline["samples"][-1]))
+        self.assertEqual(last["read_bytes"], step.read.bytes)
+
+    def test_samples_are_bounded(self):
+        with metrology.Step("step", None, sample_interval=3600) as step:
+            for _ in range(metrology.STEP_MAX_SAMPLES + 1):
+                step.resources.sample()
+        self.assertLessEqual(len(step.resources.samples), metrology.STEP_MAX_SAMPLES)
+        self.assertEqual(step.resources.interval, 7200)
+
+    def test_sampling_stops_when_the_step_fails(self):
+        threads = threading.active_count()
+        step = metrology.Step("step", None, sample_interval=0.05)
+        # Not sampled before being entered
+        self.assertIsNone(step.resources)
+        self.assertEqual(threads, threading.active_count())
+        with self.assertRaises(ValueError):
+            with step:
+                self.assertEqual(threads + 1, threading.active_count())
+                raise ValueError("step failed")
+        self.assertEqual(threads, threading.active_count())
+        self.assertIsNotNone(step.get_stats()["resources"])
+
+    def test_batch_latency(self):
+        step = metrology.Step("step", None)
+        for _ in range(3):
+            with step.batch():
+                time.sleep(0.01)
+        step.done()
+        self.assertIsNone(step.get_stats()["resources"])
+        latency = step.get_stats()["latency"]
+        self.assertEqual(latency["count"], 3)
+        self.assertGreaterEqual(latency["min"], 0.01)
+
+
 if __name__ == "__main__":
     unittest.main()
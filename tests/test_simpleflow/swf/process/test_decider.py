@@ -0,0 +1,121 @@
+import unittest
+
+import mock
+
+import swf.exceptions
+from simpleflow.swf.executor import Executor
+from simpleflow.swf.process.decider import DeciderPoller, DeciderWorker, helpers
+from swf.models.history import builder
+from tests.data import DOMAIN, BaseTestWorkflow
+from tests.test_simpleflow.swf.test_executor import build_response
+
+
+class TestStickyDeciderPoller(unittest.TestCase):
+    def build_poller(self, **kwargs):
+        executor = Executor(DOMAIN, BaseTestWorkflow)
+        return DeciderPoller([executor], DOMAIN, "test-task-list", False, **kwargs)
+
+    @mock.patch("simpleflow.swf.process.decider.base.spawn")
+    @mock.patch("simpleflow.swf.process.decider.base.process_decision")
+    def test_default_mode_forks(self, process_decision, spawn):
+        poller = self.build_poller()
+        poller.process(mock.sentinel.response)
+        spawn.assert_called_once_with(poller, mock.sentinel.response)
+        process_decision.assert_not_called()
+
+    @mock.patch("simpleflow.swf.process.decider.base.spawn")
+    @mock.patch("simpleflow.swf.process.decider.base.process_decision")
+    def test_sticky_mode_recycles_after_max_decisions(self, process_decision, spawn):
+        poller = self.build_poller(sticky=True, sticky_max_decisions=3)
+        poller.is_alive = True
+        for _ in range(2):
+            poller.process(mock.sentinel.response)
+            self.assertTrue(poller.is_alive)
+        poller.process(mock.sentinel.response)
+        self.assertFalse(poller.is_alive)
+        self.assertEqual(3, process_decision.call_count)
+        spawn.assert_not_called()
+
+    @mock.patch("simpleflow.swf.process.decider.base.process_decision")
+    def test_sticky_mode_recycles_above_max_rss(self, process_decision):
+        poller = self.build_poller(sticky=True, sticky_max_decisions=0)
+        poller.is_alive = True
+        poller.process(mock.sentinel.response)
+        self.assertTrue(poller.is_alive)
+
+        poller.sticky_max_rss = 1  # MB
+        poller.process(mock.sentinel.response)
+        self.assertFalse(poller.is_alive)
+
+    def test_only_sticky_mode_prefetches_jumbo_fields(self):
+        executor = self.build_poller()._workflow_executors[BaseTestWorkflow.name]
+        self.assertFalse(executor.prefetch_jumbo_fields)
+        poller = self.build_poller(sticky=True)
+        executor = poller._workflow_executors[BaseTestWorkflow.name]
+        self.assertTrue(executor.prefetch_jumbo_fields)
+
+    @mock.patch("simpleflow.swf.process.decider.base.process_decision")
+    def test_sticky_mode_survives_errors(self, process_decision):
+        process_decision.side_effect = ValueError("boom")
+        poller = self.build_poller(sticky=True)
+        poller.is_alive = True
+        poller.process(mock.sentinel.response)
+        self.assertTrue(poller.is_alive)
+
+
+class TestDeciderWorker(unittest.TestCase):
+    def build_worker(self):
+        executor = Executor(DOMAIN, BaseTestWorkflow)
+        worker = DeciderWorker(DOMAIN, {BaseTestWorkflow.name: executor})
+        return worker, executor
+
+    def test_replay_error_fails_the_workflow(self):
+        worker, executor = self.build_worker()
+        response = build_response(builder.History(BaseTestWorkflow))
+        with mock.patch.object(executor, "replay", side_effect=ValueError("boom")):
+            decisions = worker.decide(response, "test-task-list")
+        self.assertEqual(1, len(decisions))
+        self.assertEqual(
+            "FailWorkflowExecution", decisions[0]["decisionType"],
+        )
+
+    def test_history_fetch_error_is_propagated(self):
+        worker, executor = self.build_worker()
+        response = build_response(builder.History(BaseTestWorkflow))
+        error = swf.exceptions.ResponseError("cannot fetch next page")
+        with mock.patch.object(executor, "replay", side_effect=error):
+            with self.assertRaises(swf.exceptions.ResponseError):
+                worker.decide(response, "test-task-list")
+
+
+class PreloadedChildWorkflow(BaseTestWorkflow):
+    name = "tests.test_simpleflow.swf.process.test_decider.PreloadedChildWorkflow"
+
+
+class TestPreloadedExecutors(unittest.TestCase):
+    def build_poller(self):
+        return helpers.make_decider_poller(
+            ["tests.data.BaseTestWorkflow"],
+            DOMAIN.name,
+            None,
+            preload_workflows=[PreloadedChildWorkflow.name],
+        )
+
+    def test_preloaded_executors(self):
+        poller = self.build_poller()
+        self.assertEqual("test_workflow", poller.workflow_name)
+        executor = poller._workflow_executors[PreloadedChildWorkflow.name]
+        self.assertIs(PreloadedChildWorkflow, executor.workflow_class)
+        self.assertIn(PreloadedChildWorkflow.name, helpers.EXECUTOR_LOAD_TIMES)
+
+    def test_preloaded_executor_is_used(self):
+        poller = self.build_poller()
+        executor = poller._workflow_executors[PreloadedChildWorkflow.name]
+        worker = DeciderWorker(DOMAIN, poller._workflow_executors)
+        response = build_response(builder.History(PreloadedChildWorkflow))
+        with mock.patch.object(executor, "replay") as replay, mock.patch.object(
+            helpers, "load_workflow_executor"
+        ) as load_workflow_executor:
+            worker.decide(response, None)
+        replay.assert_called_once_with(response)
+        load_workflow_executor.assert_not_called()
@@ -1,11 +1,31 @@
 from __future__ import absolute_import
 
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
 import unittest
 from collections import namedtuple
 
-from mock import patch
+from mock import Mock, patch
 
-from simpleflow.swf.process.worker.base import ActivityPoller, ActivityWorker
+from simpleflow import activity
+from simpleflow.dispatch.dynamic_dispatcher import (
+    MODULE_LOAD_TIMES,
+    Dispatcher,
+    preload_modules,
+)
+from simpleflow.swf.process.worker.base import (
+    ActivityPoller,
+    ActivitySlots,
+    ActivityTaskPrefetcher,
+    ActivityWorker,
+    spawn,
+)
+from simpleflow.swf.process.worker.heartbeat import CANCEL_REQUESTED
 from swf.models import ActivityTask, Domain
 from tests.moto_compat import mock_swf
 
@@ -33,5 +53,450 @@ class TestActivityWorker(unittest.TestCase):
         self.assertIn("unable to import ", mock.call_args[1]["reason"])
 
 
+def make_raw_activity_task(activity_id):
+    return {
+        "taskToken": "token-{}".format(activity_id),
+        "activityId": activity_id,
+        "activityType": {"name": "activity", "version": "1"},
+        "startedEventId": 1,
+        "workflowExecution": {"workflowId": "workflow", "runId": "run"},
+    }
+
+
+def sleep_task(poller, token, task):
+    time.sleep(1)
+
+
+def long_task(poller, token, task):
+    time.sleep(30)
+
+
+def crashing_task(poller, token, task):
+    os._exit(3)
+
+
+def path_changing_task(poller, token, task):
+    with open(os.environ["PATH_CHECK_FILE"], "a") as f:
+        f.write("{} {}\n".format(os.getpid(), os.environ["PATH"]))
+    os.environ["PATH"] = "/binaries:" + os.environ["PATH"]
+
+
+@mock_swf
+class TestActivitySlots(unittest.TestCase):
+    def setUp(self):
+        self.domain = Domain("test-domain")
+        self.poller = ActivityPoller(
+            self.domain, "task-list", process_mode="concurrent", nb_slots=2
+        )
+
+    def submit(self, slots, activity_id):
+        raw_response = make_raw_activity_task(activity_id)
+        task = ActivityTask.from_poll(self.domain, "task-list", raw_response)
+        slots.submit(raw_response["taskToken"], task, raw_response)
+
+    def pids(self, slots):
+        # None for the slots left to restart
+        return [slot.process and slot.process.pid for slot in slots._slots]
+
+    def test_tasks_run_concurrently_in_long_lived_processes(self):
+        slots = ActivitySlots(self.poller, 2)
+        with patch(
+            "simpleflow.swf.process.worker.base.process_task", sleep_task
+        ), patch.object(self.poller, "fail_with_retry") as fail:
+            slots.start()
+            pids = self.pids(slots)
+            start = time.time()
+            self.submit(slots, "1")
+            self.submit(slots, "2")
+            slots.wait_for_free_slot()
+            self.submit(slots, "3")
+            slots.stop()
+            elapsed = time.time() - start
+
+        # 2 rounds of 1s, not 3
+        self.assertLess(elapsed, 3)
+        self.assertEqual(pids, self.pids(slots))
+        self.assertEqual(0, fail.call_count)
+
+    def test_cancelled_task_is_reaped(self):
+        slots = ActivitySlots(self.poller, 2, heartbeat=0.2)
+        with patch(
+            "simpleflow.swf.process.worker.base.process_task", long_task
+        ), patch.object(
+            self.poller, "heartbeat", return_value={"cancelRequested": True}
+        ) as heartbeat:
+            slots.start()
+            pids = self.pids(slots)
+            start = time.time()
+            self.submit(slots, "1")
+            slots.stop()
+
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(1, heartbeat.call_count)
+        self.assertEqual("token-1", heartbeat.call_args[0][0])
+        new_pids = self.pids(slots)
+        self.assertNotEqual(pids[0], new_pids[0])
+        self.assertEqual(pids[1], new_pids[1])
+
+    def test_crashed_task_fails_and_its_slot_is_replaced(self):
+        slots = ActivitySlots(self.poller, 1)
+        with patch(
+            "simpleflow.swf.process.worker.base.process_task", crashing_task
+        ), patch.object(self.poller, "fail_with_retry") as fail:
+            slots.start()
+            pids = self.pids(slots)
+            self.submit(slots, "1")
+            slots.wait_for_free_slot()
+            new_pids = self.pids(slots)
+            slots.stop()
+
+        self.assertEqual(1, fail.call_count)
+        self.assertEqual("token-1", fail.call_args[0][0])
+        self.assertIn("exit code 3", fail.call_args[1]["reason"])
+        self.assertNotIn(None, new_pids)
+        self.assertNotEqual(pids, new_pids)
+
+    def test_dead_process_fails_task_and_is_replaced(self):
+        slots = ActivitySlots(self.poller, 1)
+        with patch(
+            "simpleflow.swf.process.worker.base.process_task", long_task
+        ), patch.object(self.poller, "fail_with_retry") as fail:
+            slots.start()
+            pids = self.pids(slots)
+            self.submit(slots, "1")
+            os.kill(pids[0], signal.SIGKILL)
+            # Restarted by the poller thread
+            slots.wait_for_free_slot()
+            new_pids = self.pids(slots)
+            slots.stop()
+
+        self.assertEqual(1, fail.call_count)
+        self.assertEqual("token-1", fail.call_args[0][0])
+        self.assertIn("exit code -9", fail.call_args[1]["reason"])
+        self.assertNotIn(None, new_pids)
+        self.assertNotEqual(pids, new_pids)
+
+    def test_tasks_dont_share_state(self):
+        slots = ActivitySlots(self.poller, 1)
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        filename = os.path.join(tmpdir, "paths")
+        with patch(
+            "simpleflow.swf.process.worker.base.process_task", path_changing_task
+        ), patch.dict(os.environ, {"PATH_CHECK_FILE": filename}):
+            slots.start()
+            pids = self.pids(slots)
+            self.submit(slots, "1")
+            slots.wait_for_free_slot()
+            self.submit(slots, "2")
+            slots.stop()
+
+        # Run in the same process, without a fork
+        with open(filename) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(["{} {}".format(pids[0], os.environ["PATH"])] * 2, lines)
+
+
+@mock_swf
+class TestHeartbeater(unittest.TestCase):
+    def setUp(self):
+        self.domain = Domain("test-domain")
+        self.heartbeater = Mock()
+        self.heartbeater.status.return_value = CANCEL_REQUESTED
+        self.raw_response = make_raw_activity_task("1")
+        self.task = ActivityTask.from_poll(self.domain, "task-list", self.raw_response)
+
+    def check_heartbeater(self, poller):
+        self.heartbeater.register.assert_called_once_with("token-1", 1)
+        self.heartbeater.status.assert_called_with("token-1")
+        self.heartbeater.unregister.assert_called_once_with("token-1")
+        self.assertEqual(0, poller.heartbeat.call_count)
+
+    def test_spawn_delegates_heartbeats(self):
+        poller = ActivityPoller(self.domain, "task-list", heartbeater=self.heartbeater)
+        with patch(
+            "simpleflow.swf.process.worker.base.process_task", long_task
+        ), patch.object(poller, "heartbeat"):
+            start = time.time()
+            spawn(poller, "token-1", self.task, heartbeat=1)
+
+            self.assertLess(time.time() - start, 10)
+            self.check_heartbeater(poller)
+
+    def test_slots_delegate_heartbeats(self):
+        poller = ActivityPoller(
+            self.domain,
+            "task-list",
+            process_mode="concurrent",
+            heartbeater=self.heartbeater,
+        )
+        slots = ActivitySlots(poller, 1, heartbeat=1)
+        with patch(
+            "simpleflow.swf.process.worker.base.process_task", long_task
+        ), patch.object(poller, "heartbeat"):
+            slots.start()
+            start = time.time()
+            slots.submit("token-1", self.task, self.raw_response)
+            slots.stop()
+
+            self.assertLess(time.time() - start, 10)
+            self.check_heartbeater(poller)
+
+    def test_slots_survive_heartbeater_errors(self):
+        self.heartbeater.status.side_effect = [IOError("broken pipe"), CANCEL_REQUESTED]
+        poller = ActivityPoller(
+            self.domain,
+            "task-list",
+            process_mode="concurrent",
+            heartbeater=self.heartbeater,
+        )
+        slots = ActivitySlots(poller, 1, heartbeat=1)
+        with patch(
+            "simpleflow.swf.process.worker.base.process_task", long_task
+        ), patch.object(poller, "heartbeat"):
+            slots.start()
+            start = time.time()
+            slots.submit("token-1", self.task, self.raw_response)
+            slots.stop()
+
+            self.assertLess(time.time() - start, 10)
+            self.assertEqual(2, self.heartbeater.status.call_count)
+            self.check_heartbeater(poller)
+
+
+class InMemorySWF(object):
+    """
+    Stub of an SWF connection handing out a fixed number of activity tasks.
+    Its counter is shared with the processes it's forked to.
+    """
+
+    def __init__(self, nb_tasks):
+        self.nb_tasks = nb_tasks
+        self.polled = multiprocessing.Value("i", 0)
+        self.all_polled = multiprocessing.Event()
+
+    def poll_for_activity_task(self, domain, task_list, identity=None):
+        with self.polled.get_lock():
+            if self.polled.value == self.nb_tasks:
+                # Long poll
+                time.sleep(0.01)
+                return {}
+            self.polled.value += 1
+            if self.polled.value == self.nb_tasks:
+                self.all_polled.set()
+            return make_raw_activity_task(str(self.polled.value))
+
+    def record_activity_task_heartbeat(self, task_token, details=None):
+        return {}
+
+
+def task_overlapping_next_poll(poller, token, task):
+    # Fails unless the next task is polled while this one runs
+    polled = poller.connection.polled
+    if int(task.activity_id) == poller.connection.nb_tasks:
+        return
+    deadline = time.time() + 10
+    while polled.value <= int(task.activity_id):
+        if time.time() > deadline:
+            sys.exit(1)
+        time.sleep(0.01)
+
+
+@activity.with_attributes(start_to_close_timeout=600)
+def ten_minutes_activity():
+    pass
+
+
+@mock_swf
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.domain = Domain("test-domain")
+        self.poller = ActivityPoller(self.domain, "task-list", prefetch=True)
+
+    def test_next_task_is_polled_while_the_current_one_runs(self):
+        nb_tasks = 3
+        self.poller.connection = InMemorySWF(nb_tasks)
+
+        def spawn_and_stop(poller, token, task, heartbeat):
+            spawn(poller, token, task, heartbeat)
+            if task.activity_id == str(nb_tasks):
+                poller.is_alive = False
+
+        with patch(
+            "simpleflow.swf.process.worker.base.process_task",
+            task_overlapping_next_poll,
+        ), patch.object(self.poller, "bind_signal_handlers"), patch(
+            "simpleflow.swf.process.worker.base.spawn", side_effect=spawn_and_stop
+        ) as mock_spawn, patch.object(
+            self.poller, "fail_with_retry"
+        ) as fail:
+            self.poller.start()
+        self.assertEqual(nb_tasks, mock_spawn.call_count)
+        fail.assert_not_called()
+
+    def test_stop_returns_the_held_task(self):
+        self.poller.connection = InMemorySWF(2)
+        prefetcher = ActivityTaskPrefetcher(
+            self.poller, self.poller.poll_with_retry, timeout=300
+        )
+        prefetcher.start()
+        self.assertEqual("token-1", prefetcher.get(timeout=10).task_token)
+        self.assertTrue(self.poller.connection.all_polled.wait(10))
+        self.assertEqual("token-2", prefetcher.stop().task_token)
+
+    def hold(self, prefetcher, on_receive=None):
+        """
+        Hold a task with a fake clock, advanced by the waits for messages.
+
+        :return: end time, from the start of the hold
+        """
+        clock = [0.0]
+
+        def receive(timeout):
+            clock[0] += timeout
+            if on_receive:
+                on_receive()
+
+        response = self.poller.make_response(make_raw_activity_task("1"))
+        with patch("time.time", lambda: clock[0]), patch.object(
+            prefetcher, "_receive", side_effect=receive
+        ):
+            prefetcher._hold(response)
+        return clock[0]
+
+    def test_held_task_is_heartbeated_then_failed(self):
+        prefetcher = ActivityTaskPrefetcher(self.poller, None, timeout=10, heartbeat=3)
+        with patch.object(
+            self.poller, "heartbeat", return_value={}
+        ) as heartbeat, patch.object(self.poller, "fail_with_retry") as fail:
+            self.assertEqual(10, self.hold(prefetcher))
+        # After 3, 6 and 9s
+        self.assertEqual(3, heartbeat.call_count)
+        # Rescheduled without waiting for its timeout
+        self.assertEqual(1, fail.call_count)
+        self.assertEqual("token-1", fail.call_args[0][0])
+        self.assertIn("not started within 10s", fail.call_args[1]["reason"])
+
+    def test_held_task_is_sent_when_taken(self):
+        connection, prefetcher_connection = multiprocessing.Pipe()
+        prefetcher = ActivityTaskPrefetcher(self.poller, None, timeout=10, heartbeat=3)
+        prefetcher._connection = prefetcher_connection
+
+        def take():
+            prefetcher._requested = True
+
+        with patch.object(self.poller, "heartbeat") as heartbeat:
+            self.assertEqual(3, self.hold(prefetcher, on_receive=take))
+        heartbeat.assert_not_called()
+        self.assertTrue(connection.poll(0))
+        self.assertEqual(make_raw_activity_task("1"), connection.recv())
+
+    def test_cancelled_held_task_is_canceled(self):
+        prefetcher = ActivityTaskPrefetcher(self.poller, None, timeout=10, heartbeat=3)
+        with patch.object(
+            self.poller, "heartbeat", return_value={"cancelRequested": True}
+        ) as heartbeat, patch.object(self.poller, "cancel") as cancel, patch.object(
+            self.poller, "fail_with_retry"
+        ) as fail:
+            self.assertEqual(3, self.hold(prefetcher))
+        self.assertEqual(1, heartbeat.call_count)
+        cancel.assert_called_once_with("token-1")
+        fail.assert_not_called()
+
+    def test_prefetch_requires_the_local_process_mode(self):
+        with self.assertRaises(ValueError):
+            ActivityPoller(
+                self.domain, "task-list", process_mode="concurrent", prefetch=True
+            )
+
+    def test_budget_is_derived_from_start_to_close_timeout(self):
+        prefetcher = ActivityTaskPrefetcher(self.poller, None, timeout=300)
+        raw_response = make_raw_activity_task("1")
+        self.assertEqual(
+            300, prefetcher.budget(self.poller.make_response(raw_response))
+        )
+        raw_response["activityType"]["name"] = "{}.{}".format(
+            __name__, "ten_minutes_activity"
+        )
+        response = self.poller.make_response(raw_response)
+        self.assertEqual(60, prefetcher.budget(response))
+        prefetcher = ActivityTaskPrefetcher(self.poller, None, timeout=30)
+        self.assertEqual(30, prefetcher.budget(response))
+
+
+HEAVY_MODULE = """
+import time
+
+from simpleflow import activity
+
+time.sleep(0.3)
+
+
+@activity.with_attributes(task_list="test")
+def heavy(x):
+    return x
+
+
+def not_decorated(x):
+    return x
+"""
+
+
+def dispatch_in_new_process(name):
+    """
+    Time a task process up to the dispatch of its activity.
+    """
+    process = multiprocessing.Process(target=Dispatcher.dispatch_activity, args=(name,))
+    start = time.time()
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    return time.time() - start
+
+
+class TestPreloadModules(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.module = "heavy_activities_{}".format(os.getpid())
+        with open(os.path.join(self.path, self.module + ".py"), "w") as f:
+            f.write(HEAVY_MODULE)
+        sys.path.insert(0, self.path)
+
+    def tearDown(self):
+        sys.path.remove(self.path)
+        shutil.rmtree(self.path)
+        sys.modules.pop(self.module, None)
+        for name in list(Dispatcher._activities):
+            if name.startswith(self.module):
+                del Dispatcher._activities[name]
+        MODULE_LOAD_TIMES.pop(self.module, None)
+
+    def test_activities_are_registered(self):
+        preload_modules([self.module])
+
+        self.assertGreaterEqual(MODULE_LOAD_TIMES[self.module], 0.3)
+        heavy = sys.modules[self.module].heavy
+        with patch(
+            "simpleflow.dispatch.dynamic_dispatcher.import_object_from_module"
+        ) as import_object:
+            self.assertIs(heavy, Dispatcher.dispatch_activity(self.module + ".heavy"))
+        self.assertEqual(0, import_object.call_count)
+
+        # Other callables are wrapped once
+        name = self.module + ".not_decorated"
+        activity = Dispatcher.dispatch_activity(name)
+        self.assertIs(activity, Dispatcher.dispatch_activity(name))
+
+    def test_startup_benchmark(self):
+        name = self.module + ".heavy"
+        cold = dispatch_in_new_process(name)
+        self.assertNotIn(self.module, sys.modules)
+
+        preload_modules([self.module])
+        warm = dispatch_in_new_process(name)
+        print("task startup: {:.3f}s cold, {:.3f}s warm".format(cold, warm))
+        self.assertLess(warm, cold - 0.2)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,18 @@
+import datetime
+import hashlib
+import timeit
 import unittest
 
+import lazy_object_proxy
 import mock
 from sure import expect
 
+import swf.models.workflow
 from simpleflow import activity, format, futures
-from simpleflow.swf.executor import Executor
+from simpleflow.canvas import Group
+from simpleflow.swf.executor import Executor, hash_arguments
+from simpleflow.utils import json_dumps
+from simpleflow.utils.json_tools import TransparentProxy
 from swf.models.history import builder
 from swf.responses import Response
 from tests.data import DOMAIN, BaseTestWorkflow, increment
@@ -176,6 +184,27 @@ class TestSimpleflowSwfExecutorWithJumboFields(MockSWFTestCase):
 
         expect(result).to.match(r"^simpleflow\+s3://jumbo-bucket/[a-z0-9-]+ 90002$")
 
+    @mock.patch.dict("os.environ", {"SIMPLEFLOW_JUMBO_FIELDS_BUCKET": "jumbo-bucket"})
+    def test_jumbo_fields_are_prefetched(self):
+        self.register_activity_type(
+            "tests.test_simpleflow.swf.test_executor.print_me_n_times", "default"
+        )
+        self.start_workflow_execution(input='{"args": ["012345679", 10000]}')
+        result = self.build_decisions(ExampleJumboWorkflow)
+        self.take_decisions(result.decisions, result.execution_context)
+        self.process_activity_task()
+        events = self.get_workflow_execution_history()["events"]
+        signature = events[-2]["activityTaskCompletedEventAttributes"]["result"]
+        format.JUMBO_FIELDS_MEMORY_CACHE.clear()
+
+        with mock.patch(
+            "simpleflow.format.prefetch_jumbo_fields",
+            wraps=format.prefetch_jumbo_fields,
+        ) as prefetch, mock.patch.object(Executor, "prefetch_jumbo_fields", True):
+            result = self.build_decisions(ExampleJumboWorkflow)
+        prefetch.assert_called_once_with([signature])
+        assert result.decisions[0]["decisionType"] == "CompleteWorkflowExecution"
+
     @mock.patch.dict("os.environ", {"SIMPLEFLOW_JUMBO_FIELDS_BUCKET": "jumbo-bucket"})
     def test_jumbo_fields_in_task_failed_is_decoded(self):
         # prepare execution
@@ -234,3 +263,267 @@ class TestSimpleflowSwfExecutorWithJumboFields(MockSWFTestCase):
             r"^Workflow execution error in activity-tests.test_simpleflow.swf."
             r'test_executor.print_me_n_times: "ValueError: Number: 012345679\d+"$'
         )
+
+
+def build_response(history):
+    return Response(
+        history=history,
+        execution=swf.models.workflow.WorkflowExecution(
+            domain=DOMAIN,
+            workflow_id="a_workflow_id",
+            run_id="a_run_id",
+            workflow_type=swf.models.workflow.WorkflowType(
+                domain=DOMAIN, name=ExampleWorkflow.name, version="v1"
+            ),
+        ),
+    )
+
+
+class TestDeciderCache(unittest.TestCase):
+    def test_jumbo_fields_are_prefetched_only_if_enabled(self):
+        history = builder.History(ExampleWorkflow, input={})
+        executor = Executor(DOMAIN, ExampleWorkflow)
+        with mock.patch("simpleflow.format.prefetch_jumbo_fields") as prefetch:
+            executor.replay(build_response(history))
+            prefetch.assert_not_called()
+
+            executor.prefetch_jumbo_fields = True
+            executor.replay(build_response(history))
+            prefetch.assert_called_once_with(executor.history.new_jumbo_fields)
+
+    def test_history_is_parsed_incrementally(self):
+        history = builder.History(ExampleWorkflow, input={})
+        executor = Executor(DOMAIN, ExampleWorkflow)
+        executor.replay(build_response(history))
+        parsed_history = executor.history
+
+        history.add_decision_task()
+        history.add_signal("a_signal", {})
+        executor.replay(build_response(history))
+        expect(executor.history).to.be(parsed_history)
+        expect(executor.history.signals).to.have.key("a_signal")
+
+        # Another history for the same execution: full parse
+        executor.replay(build_response(builder.History(ExampleWorkflow)))
+        expect(executor.history).to_not.be(parsed_history)
+        expect(executor.history.signals).to.be.empty
+
+
+class ManyTasksWorkflow(BaseTestWorkflow):
+    def run(self, n):
+        results = [self.submit(increment, i) for i in range(n)]
+        futures.wait(*results)
+        last = self.submit(increment, n)
+        futures.wait(last)
+
+
+class TestReplayCache(unittest.TestCase):
+    def build_history(self, n):
+        history = builder.History(ManyTasksWorkflow, input={"args": [n]})
+        history.add_decision_task_completed()
+        decision_id = history.last_id
+        for i in range(n + 1):
+            history.add_activity_task(
+                increment,
+                decision_id=decision_id,
+                last_state="completed" if i < n else "started",
+                activity_id="activity-tests.data.activities.increment-{}".format(i + 1),
+                input={"args": [i]},
+                result=i + 1,
+            )
+        history.add_decision_task()
+        return history
+
+    def test_completed_futures_are_reused(self):
+        history = self.build_history(10)
+        executor = Executor(DOMAIN, ManyTasksWorkflow)
+        executor.replay(build_response(history))
+
+        with mock.patch.object(
+            Executor, "find_event", autospec=True, side_effect=Executor.find_event
+        ) as find_event:
+            decisions = executor.replay(build_response(history)).decisions
+        expect(decisions).to.be.empty
+        # Only the running task was looked up in the history
+        expect(find_event.call_count).to.equal(1)
+
+    def test_warm_replay_cost_doesnt_depend_on_history_length(self):
+        """
+        Warm replays only look up the running task, however many tasks are
+        completed.
+        """
+        for n in (10, 100):
+            history = self.build_history(n)
+            executor = Executor(DOMAIN, ManyTasksWorkflow)
+            with mock.patch.object(
+                Executor, "find_event", autospec=True, side_effect=Executor.find_event
+            ) as find_event:
+                executor.replay(build_response(history))
+                expect(find_event.call_count).to.equal(n + 1)
+                find_event.reset_mock()
+                executor.replay(build_response(history))
+                expect(find_event.call_count).to.equal(1)
+            expect(executor._run_cache.futures).to.have.length_of(n)
+
+
+class GroupWorkflow(BaseTestWorkflow):
+    def run(self, n):
+        future = self.submit(Group(*[(increment, i) for i in range(n)]))
+        futures.wait(future)
+
+
+class TestFindEventDispatch(unittest.TestCase):
+    def build_history(self, n):
+        history = builder.History(GroupWorkflow, input={"args": [n]})
+        history.add_decision_task_completed()
+        decision_id = history.last_id
+        for i in range(n):
+            history.add_activity_task(
+                increment,
+                decision_id=decision_id,
+                last_state="completed",
+                activity_id="activity-tests.data.activities.increment-{}".format(i + 1),
+                input={"args": [i]},
+                result=i + 1,
+            )
+        history.add_decision_task()
+        return history
+
+    def test_find_event_dispatch_is_cached(self):
+        executor = Executor(DOMAIN, GroupWorkflow)
+        with mock.patch.object(
+            Executor.TASK_TYPE_TO_EVENT_FINDER,
+            "get",
+            side_effect=Executor.TASK_TYPE_TO_EVENT_FINDER.get,
+        ) as get:
+            Executor.TASK_TYPE_TO_EVENT_FINDER._dispatch_cache.clear()
+            executor.replay(build_response(self.build_history(10)))
+        # Resolved once for ActivityTask, then taken from the cache
+        expect(get.call_count).to.equal(1)
+
+    def test_group_replay_is_linear(self):
+        """
+        The state of each future of a group is checked a bounded number of
+        times, not once per submitted task.
+        """
+        pending = futures.Future.pending
+        checks = []
+
+        def counted_pending(future):
+            checks.append(future)
+            return pending.fget(future)
+
+        counts = []
+        for n in (100, 1000):
+            history = self.build_history(n)
+            executor = Executor(DOMAIN, GroupWorkflow)
+            del checks[:]
+            with mock.patch.object(
+                futures.Future, "pending", property(counted_pending)
+            ):
+                decisions = executor.replay(build_response(history)).decisions
+            expect(decisions[0]["decisionType"]).to.equal("CompleteWorkflowExecution")
+            counts.append(len(checks))
+        expect(counts[1]).to.be.lower_than_or_equal_to(10 * counts[0])
+
+
+class TestHashArguments(unittest.TestCase):
+    def test_same_hash_as_canonical_encoding(self):
+        cases = [
+            ((), {}),
+            ((1, "two", None, True, 3.5), {}),
+            ((), {"b": [1, 2], "a": {"z": 1, "y": u"\xe9t\xe9"}}),
+            (([{"nested": ["x" * 10000]}],), {"when": datetime.datetime(2020, 1, 2)}),
+            ((set([3]), (1, 2)), {"c": None, "a": 1}),
+        ]
+        for args, kwargs in cases:
+            expected = hashlib.md5(
+                json_dumps({"args": args, "kwargs": kwargs}).encode("utf-8")
+            ).hexdigest()
+            self.assertEqual(expected, hash_arguments(args, kwargs))
+
+    def test_hash_is_stable(self):
+        # Task IDs of the executions in flight depend on it
+        self.assertEqual(
+            "0511696c32875b71edc5a8ee9f1fb2bc",
+            hash_arguments((1, "two"), {"a": {"b": [1, 2]}}),
+        )
+
+    def test_hash_of_proxies_is_stable(self):
+        # Jumbo fields are serialized as their str()...
+        self.assertEqual(
+            "d2e2f9ebf129da75bc7d5a0b2640f5b2",
+            hash_arguments(
+                (lazy_object_proxy.Proxy(lambda: {"a": [1, 2]}),),
+                {"b": lazy_object_proxy.Proxy(lambda: "x")},
+            ),
+        )
+        # ... while lazy history payloads are serialized like their value
+        self.assertEqual(
+            hash_arguments(({"a": [1, 2]},), {}),
+            hash_arguments((TransparentProxy(lambda: {"a": [1, 2]}),), {}),
+        )
+
+    def test_hash_isnt_slower_than_json_dumps(self):
+        executor = Executor(DOMAIN, ExampleWorkflow)
+        cases = [
+            (({"key-{}".format(i): i for i in range(200)},), {}),
+            (([{"a": 1, "b": [1, 2]}] * 20,), {}),
+            (("x" * 10000, 1), {}),
+        ]
+
+        def json_dumps_hash(args, kwargs):
+            arguments = json_dumps({"args": args, "kwargs": kwargs})
+            return hashlib.md5(arguments.encode("utf-8")).hexdigest()
+
+        for args, kwargs in cases:
+            # Interleaved, so that both are measured under the same load
+            hash_times, json_dumps_times = [], []
+            for _ in range(10):
+                hash_times.append(
+                    timeit.timeit(
+                        lambda: executor._hash_arguments(args, kwargs), number=50
+                    )
+                )
+                json_dumps_times.append(
+                    timeit.timeit(lambda: json_dumps_hash(args, kwargs), number=50)
+                )
+            self.assertLess(min(hash_times), min(json_dumps_times) * 1.5)
+
+    def test_hash_memo(self):
+        executor = Executor(DOMAIN, ExampleWorkflow)
+        big = "x" * 10000
+        items = (big, "y")
+        with mock.patch(
+            "simpleflow.swf.executor.hash_arguments", side_effect=hash_arguments
+        ) as mock_hash:
+            first = executor._hash_arguments((big, 1), {"a": items})
+            second = executor._hash_arguments((big, 1), {"a": items})
+            self.assertEqual(first, second)
+            self.assertEqual(1, mock_hash.call_count)
+
+            # Mutable arguments are hashed each time
+            params = {"a": 1}
+            first = executor._hash_arguments((params,), {})
+            params["a"] = 2
+            second = executor._hash_arguments((params,), {})
+            self.assertNotEqual(first, second)
+            self.assertEqual(3, mock_hash.call_count)
+
+    def test_hash_memo_is_bounded(self):
+        executor = Executor(DOMAIN, ExampleWorkflow)
+        arguments = [("x" * 100, i) for i in range(3)]
+        with mock.patch(
+            "simpleflow.swf.constants.ARGUMENT_HASHES_CACHE_SIZE", 2
+        ), mock.patch(
+            "simpleflow.swf.executor.hash_arguments", side_effect=hash_arguments
+        ) as mock_hash:
+            for args in arguments:
+                executor._hash_arguments(args, {})
+            self.assertEqual(2, len(executor._run_cache.argument_hashes))
+            # Least recently used first
+            executor._hash_arguments(arguments[1], {})
+            executor._hash_arguments(arguments[0], {})
+            self.assertEqual(4, mock_hash.call_count)
+            executor._hash_arguments(arguments[1], {})
+            self.assertEqual(4, mock_hash.call_count)
@@ -0,0 +1,57 @@
+import copy
+import json
+import unittest
+
+import swf.models.decision
+from simpleflow.swf.utils import DecisionsAndContext
+
+
+def make_decisions(n):
+    decisions = []
+    for i in range(n):
+        decision = swf.models.decision.MarkerDecision()
+        decision.record("marker-{}".format(i), {"index": i, "none": None})
+        decisions.append(decision)
+    return decisions
+
+
+class TestDecisionsAndContext(unittest.TestCase):
+    def test_request_size(self):
+        dac = DecisionsAndContext()
+        self.assertEqual(len(json.dumps([])), dac.request_size())
+
+        decisions = make_decisions(3)
+        dac.append_decision(decisions[0])
+        dac.extend_decision(decisions[1:])
+        self.assertEqual(len(json.dumps(decisions)), dac.request_size())
+
+        more = make_decisions(2)
+        encoded = [DecisionsAndContext.encode_decision(d) for d in more]
+        self.assertEqual(
+            len(json.dumps(decisions + more)), dac.request_size(encoded),
+        )
+
+    def test_encoded_decisions(self):
+        decisions = make_decisions(2)
+        dac = DecisionsAndContext(decisions[:1])
+        dac.extend_decision(decisions[1:])
+        self.assertEqual(
+            decisions, [json.loads(d) for d in dac.encoded_decisions],
+        )
+
+    def test_decisions_modified_directly(self):
+        dac = DecisionsAndContext(make_decisions(1))
+        dac.decisions = make_decisions(3)
+        self.assertEqual(3, len(dac.encoded_decisions))
+        self.assertEqual(len(json.dumps(dac.decisions)), dac.request_size())
+
+    def test_encode_decision_leaves_decision_untouched(self):
+        decision = swf.models.decision.MarkerDecision()
+        decision.record("marker")
+        decision["recordMarkerDecisionAttributes"]["details"] = None
+        original = copy.deepcopy(decision)
+
+        encoded = DecisionsAndContext.encode_decision(decision)
+
+        self.assertEqual(original, json.loads(encoded))
+        self.assertEqual(original, decision)
@@ -1,11 +1,27 @@
+import hashlib
+import multiprocessing
 import os
 import shutil
+import tempfile
+import time
 import unittest
 
+import boto
+from boto.s3.key import Key
+from future.utils import PY2
+from lockfile import FileLock
 from mock import patch
 from sure import expect
 
-from simpleflow.download import RemoteBinary, with_binaries
+from simpleflow.download import (
+    BinaryCache,
+    BinaryVerificationError,
+    RemoteBinary,
+    download_binaries,
+    use_binaries,
+    with_binaries,
+)
+from tests.moto_compat import mock_s3
 
 # example binary remote/local location
 remote_location = "s3://a.bucket/v1.2.3/custom-bin"
@@ -20,6 +36,7 @@ def fake_download_binary(binary):
     with open(binary.local_location, "a"):
         os.utime(binary.local_location, None)  # aka "touch"
         os.chmod(binary.local_location, 0o755)
+    binary._write_metadata({"size": 0})
 
 
 class TestRemoteBinary(unittest.TestCase):
@@ -66,3 +83,197 @@ class TestWithBinariesDecorator(unittest.TestCase):
         expect(res).to.equal("foo!")
 
         method_mock.assert_called_once_with()
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.remote = os.path.join(self.root, "remote")
+        os.makedirs(self.remote)
+        patcher = patch(
+            "simpleflow.settings.SIMPLEFLOW_BINARIES_DIRECTORY",
+            os.path.join(self.root, "binaries"),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def make_remote_binary(self, name, content=b"#!/bin/sh\necho hello\n"):
+        with open(os.path.join(self.remote, name), "wb") as f:
+            f.write(content)
+        return "file://{}/{}".format(self.remote, name)
+
+    def test_download(self):
+        content = b"#!/bin/sh\necho hello\n"
+        location = self.make_remote_binary("hello", content)
+        binary = RemoteBinary(
+            "hello",
+            "{}#sha256={}".format(location, hashlib.sha256(content).hexdigest()),
+        )
+        expect(binary.download()).to.be.true
+        with open(binary.local_location, "rb") as f:
+            expect(f.read()).to.equal(content)
+        expect(os.access(binary.local_location, os.X_OK)).to.be.true
+        # Already there
+        expect(binary.download()).to.be.false
+
+    def test_checksum_mismatch(self):
+        location = self.make_remote_binary("hello")
+        binary = RemoteBinary("hello", location + "#sha256=" + "0" * 64)
+        with self.assertRaises(BinaryVerificationError):
+            binary.download()
+        expect(os.listdir(binary.local_directory)).to.equal([])
+
+    def test_truncated_download(self):
+        location = self.make_remote_binary("hello")
+
+        def truncated_pull(bucket, path, dest_file):
+            with open(dest_file, "wb") as f:
+                f.write(b"#!/bin")
+
+        binary = RemoteBinary("hello", location)
+        with patch("simpleflow.download.pull", side_effect=truncated_pull):
+            with self.assertRaises(BinaryVerificationError):
+                binary.download()
+        expect(os.path.exists(binary.local_location)).to.be.false
+
+    def test_incomplete_binary_is_downloaded_again(self):
+        content = b"#!/bin/sh\necho hello\n"
+        binary = RemoteBinary("hello", self.make_remote_binary("hello", content))
+        binary.download()
+        # e.g. downloaded by an older version
+        os.remove(binary.metadata_location)
+        expect(binary.download()).to.be.true
+        with open(binary.local_location, "rb") as f:
+            expect(f.read()).to.equal(content)
+
+    def test_concurrent_downloads(self):
+        binaries_map = {
+            "bin{}".format(i): self.make_remote_binary("bin{}".format(i))
+            for i in range(4)
+        }
+
+        def slow_pull(bucket, path, dest_file):
+            time.sleep(0.5)
+            shutil.copyfile(
+                os.path.join(bucket.replace("file://", ""), path), dest_file
+            )
+
+        start = time.time()
+        with patch("simpleflow.download.pull", side_effect=slow_pull), patch(
+            "os.environ", {"PATH": "/bin"}
+        ):
+            download_binaries(binaries_map)
+            path = os.environ["PATH"]
+        # Sequential downloads take 2s
+        expect(time.time() - start).to.be.lower_than(1.5)
+        for name, location in binaries_map.items():
+            expect(path).to.contain(RemoteBinary(name, location).local_directory)
+
+    def test_leased_binaries_are_not_evicted(self):
+        binaries_map = {"hello": self.make_remote_binary("hello")}
+        binary = RemoteBinary("hello", binaries_map["hello"])
+        leased, done = multiprocessing.Event(), multiprocessing.Event()
+
+        def run_task():
+            with use_binaries(binaries_map):
+                leased.set()
+                done.wait(10)
+
+        process = multiprocessing.Process(target=run_task)
+        process.start()
+        cache = BinaryCache(max_size=1)
+        try:
+            expect(leased.wait(10)).to.be.true
+            expect(cache.evict()).to.equal([])
+            expect(os.path.exists(binary.local_location)).to.be.true
+        finally:
+            done.set()
+            process.join()
+        expect(process.exitcode).to.equal(0)
+        expect(cache.evict()).to.equal([binary.local_directory])
+
+    def test_lease_survives_eviction_race(self):
+        binary = RemoteBinary("hello", self.make_remote_binary("hello"))
+        binary.download()
+        BinaryCache(max_size=1).evict()
+        with binary.lease():
+            expect(binary.download()).to.be.true
+            expect(BinaryCache(max_size=1).evict()).to.equal([])
+
+
+class TestBinaryCache(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def make_entry(self, name, size, last_used):
+        path = os.path.join(self.root, "{}-{}".format(name, "0" * 32))
+        os.makedirs(path)
+        filename = os.path.join(path, name)
+        with open(filename, "wb") as f:
+            f.write(b"x" * size)
+        os.utime(filename, (last_used, last_used))
+        os.utime(path, (last_used, last_used))
+        return path
+
+    def test_evicts_least_recently_used(self):
+        now = time.time()
+        oldest = self.make_entry("oldest", 100, now - 300)
+        old = self.make_entry("old", 100, now - 200)
+        kept = self.make_entry("kept", 100, now - 250)
+        recent = self.make_entry("recent", 100, now - 100)
+        cache = BinaryCache(self.root, max_size=250)
+
+        expect(cache.evict(keep=[kept])).to.equal([oldest, old])
+        expect(sorted(os.listdir(self.root))).to.equal(
+            sorted(os.path.basename(path) for path in (kept, recent))
+        )
+
+    def test_skips_locked_entries(self):
+        now = time.time()
+        locked = self.make_entry("locked", 100, now - 300)
+        other = self.make_entry("other", 100, now - 200)
+        lock = FileLock(os.path.join(locked, ".locked.lock"))
+        lock.acquire()
+        try:
+            expect(BinaryCache(self.root, max_size=150).evict()).to.equal([other])
+        finally:
+            lock.release()
+
+    def test_no_limit(self):
+        self.make_entry("bin", 100, time.time())
+        expect(BinaryCache(self.root, max_size=0).evict()).to.equal([])
+
+
+class TestS3Download(unittest.TestCase):
+    if PY2:
+        assertRaisesRegex = unittest.TestCase.assertRaisesRegexp
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        patcher = patch("simpleflow.settings.SIMPLEFLOW_BINARIES_DIRECTORY", self.root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    @mock_s3
+    def test_md5_mismatch(self):
+        bucket = boto.connect_s3().create_bucket("bucket")
+        Key(bucket, "hello").set_contents_from_string(b"#!/bin/sh\necho hello\n")
+
+        def corrupted_pull(bucket, path, dest_file):
+            with open(dest_file, "wb") as f:
+                f.write(b"#!/bin/sh\necho HELLO\n")
+
+        binary = RemoteBinary("hello", "s3://bucket/hello")
+        with patch("simpleflow.download.pull", side_effect=corrupted_pull):
+            with self.assertRaisesRegex(BinaryVerificationError, "MD5"):
+                binary.download()
+        expect(binary.download()).to.be.true
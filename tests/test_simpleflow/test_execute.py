@@ -13,7 +13,7 @@ import time
 import psutil
 import pytest
 
-from simpleflow import execute
+from simpleflow import execute, format
 from simpleflow.exceptions import ExecutionError, ExecutionTimeoutError
 
 
@@ -336,3 +336,133 @@ def test_large_command_line_utf8():
     """
     x = u"ä" * 1024 * 1024
     assert length(x.encode("utf-8")) == len(x)
+
+
+@execute.python(pool=True)
+def pooled_getpid():
+    return os.getpid()
+
+
+@execute.python(pool=True)
+def pooled_add(a, b=1):
+    return a + b
+
+
+@execute.python(pool=True)
+def pooled_raise():
+    raise ValueError("pooled error")
+
+
+def test_pool_reuses_interpreter():
+    pid = pooled_getpid()
+    assert pid != os.getpid()
+    assert pooled_add(1, b=2) == 3
+    assert pooled_getpid() == pid
+
+
+def test_pool_propagates_errors():
+    pid = pooled_getpid()
+    with pytest.raises(ExecutionError) as excinfo:
+        pooled_raise()
+    assert json.loads(excinfo.value.args[0])["error"] == "ValueError"
+    assert pooled_getpid() == pid
+
+
+def test_pool_timeout_replaces_interpreter():
+    func = execute.python(pool=True, timeout=3)(sleep_and_return)
+    with pytest.raises(ExecutionTimeoutError):
+        func(10)
+    # Same pool, without the timeout to leave time for the new interpreter
+    assert execute.python(pool=True)(sleep_and_return)(0) == 0
+
+
+def test_pool_max_calls():
+    pool = execute.InterpreterPool(sys.executable, __name__, max_calls=2)
+    funcname = "{}.{}".format(__name__, "pooled_getpid")
+    try:
+        pids = [
+            json.loads(pool.call(funcname, execute.format_arguments_json(), {}))
+            for _ in range(3)
+        ]
+    finally:
+        pool.stop()
+    assert pids[0] == pids[1]
+    assert pids[2] != pids[0]
+
+
+def test_pools_are_not_shared_across_limits():
+    pool = execute.get_interpreter_pool(sys.executable, __name__)
+    assert execute.get_interpreter_pool(sys.executable, __name__) is pool
+    limited = execute.get_interpreter_pool(sys.executable, __name__, max_calls=1)
+    assert limited is not pool
+    assert limited.max_calls == 1
+    limited = execute.get_interpreter_pool(sys.executable, __name__, max_rss=100)
+    assert limited is not pool
+    assert limited.max_rss == 100
+
+
+def test_pool_kill_children():
+    pid = execute.python(pool=True, kill_children=True)(create_sleeper_subprocess)()
+    with pytest.raises(psutil.NoSuchProcess):
+        psutil.Process(pid)
+
+
+def test_pool_is_faster():
+    # Warm up both modes, so that only the interpreter startup is measured
+    execute.python()(length)("a")
+    execute.python(pool=True)(length)("a")
+    start = time.time()
+    for _ in range(5):
+        execute.python()(length)("a")
+    one_shot = time.time() - start
+    start = time.time()
+    for _ in range(5):
+        execute.python(pool=True)(length)("a")
+    pooled = time.time() - start
+    assert pooled < one_shot
+
+
+def test_anonymous_file_is_in_memory():
+    with execute.anonymous_file() as f:
+        path = os.readlink("/proc/self/fd/{}".format(f.fileno()))
+        assert path.startswith(("/memfd:", execute.SHM_DIR))
+
+
+@execute.python()
+def large_result(size):
+    return "A" * size
+
+
+@execute.python(jumbo_result=True)
+def large_jumbo_result(size, char="A"):
+    return char * size
+
+
+def test_large_result_is_pushed_as_jumbo_field(monkeypatch):
+    # Not imported globally: the executed functions import this module
+    import boto
+    import lazy_object_proxy
+
+    from tests.moto_compat import mock_s3
+
+    monkeypatch.setenv("SIMPLEFLOW_JUMBO_FIELDS_BUCKET", "jumbo-bucket")
+    with mock_s3():
+        boto.connect_s3().create_bucket("jumbo-bucket")
+
+        result = large_jumbo_result(64000)
+        assert isinstance(result, lazy_object_proxy.Proxy)
+        signature = format.result(result)
+        assert signature.startswith("simpleflow+s3://jumbo-bucket/")
+        assert signature.split()[1] == "64002"
+        assert result == "A" * 64000
+        assert large_jumbo_result(10) == "A" * 10
+
+        # Measured once encoded: 6 bytes per escaped character
+        result = large_jumbo_result(6000, char=u"\u00e9")
+        assert isinstance(result, lazy_object_proxy.Proxy)
+        assert format.result(result).split()[1] == "36002"
+
+        # Not opted in
+        result = large_result(64000)
+        assert not isinstance(result, lazy_object_proxy.Proxy)
+        assert result == "A" * 64000
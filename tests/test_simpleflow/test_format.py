@@ -1,9 +1,14 @@
+import binascii
 import json
 import os
 import random
+import shutil
+import tempfile
+import time
 import unittest
 
 import boto
+import mock
 from future.utils import PY2
 
 from simpleflow import constants, format
@@ -137,3 +142,316 @@ class TestFormat(unittest.TestCase):
 
         for case in cases:
             self.assertEqual(case[1], format.decode(case[0], parse_json=False))
+
+    @mock_s3
+    def test_result_passes_jumbo_fields_through(self):
+        self.setup_jumbo_fields("jumbo-bucket")
+        push_content("jumbo-bucket", "passthrough", '{"a": 1}')
+        signature = "simpleflow+s3://jumbo-bucket/passthrough 8"
+
+        value = format.decode(signature)
+        self.assertEqual(signature, format.result(value))
+        self.assertEqual(1, value["a"])
+        # Still not pushed again once loaded
+        self.assertEqual(signature, format.result(value))
+        self.assertEqual(1, len(list(self.conn.get_bucket("jumbo-bucket").list())))
+
+    @mock_s3
+    def test_push_jumbo_field_file(self):
+        self.setup_jumbo_fields("jumbo-bucket/subdir")
+        content = json.dumps("A" * 64000).encode("utf-8")
+        with tempfile.TemporaryFile() as f:
+            f.write(content)
+            f.seek(0)
+            signature = format.push_jumbo_field_file(f, len(content))
+
+        assert signature.startswith("simpleflow+s3://jumbo-bucket/subdir/")
+        self.assertEqual(signature.split()[1], "64002")
+        self.assertEqual("A" * 64000, format.decode(signature))
+
+    @mock_s3
+    def test_push_jumbo_field_file_too_large(self):
+        self.setup_jumbo_fields("jumbo-bucket")
+        with tempfile.TemporaryFile() as f:
+            with self.assertRaisesRegex(ValueError, "even for a jumbo field"):
+                format.push_jumbo_field_file(f, constants.JUMBO_FIELDS_MAX_SIZE + 1)
+
+
+class TestSizedLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = format.SizedLRUCache(10)
+        cache.set("a", "aaaa")
+        cache.set("b", "bbbb")
+        self.assertEqual("aaaa", cache.get("a"))
+        cache.set("c", "cccc")
+
+        self.assertEqual(8, cache.size)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(1, cache.evictions)
+
+    def test_counts_hits_and_misses(self):
+        cache = format.SizedLRUCache(10)
+        cache.set("a", "aaaa")
+        cache.get("a")
+        cache.get("b")
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_skips_values_larger_than_the_cache(self):
+        cache = format.SizedLRUCache(10)
+        cache.set("a", "aaaa")
+        cache.set("b", "b" * 11)
+        self.assertEqual(["a"], [k for k in ("a", "b") if k in cache])
+        self.assertEqual(4, cache.size)
+
+    def test_replaces_values(self):
+        cache = format.SizedLRUCache(10)
+        cache.set("a", "aaaa")
+        cache.set("a", "aa")
+        self.assertEqual(2, cache.size)
+        self.assertEqual(1, len(cache))
+
+
+class TestJumboFieldsDiskCache(unittest.TestCase):
+    def setUp(self):
+        format.JUMBO_FIELDS_MEMORY_CACHE.clear()
+
+    def test_disk_cache_handle_is_reused(self):
+        self.assertIs(format._get_disk_cache(), format._get_disk_cache())
+
+    def test_disk_cache_handle_is_reopened_after_fork(self):
+        cache = format._get_disk_cache()
+        with mock.patch("os.getpid", return_value=os.getpid() + 1):
+            self.assertIsNot(cache, format._get_disk_cache())
+
+    @mock.patch("simpleflow.format.SIMPLEFLOW_ENABLE_DISK_CACHE", True)
+    def test_disk_cache_hits_fill_the_memory_cache(self):
+        format._set_cached("jumbo/disk-cached", "content")
+        format.JUMBO_FIELDS_MEMORY_CACHE.clear()
+        stats = format.jumbo_fields_cache_stats()
+
+        self.assertEqual("content", format._get_cached("jumbo/disk-cached"))
+        self.assertIn("jumbo/disk-cached", format.JUMBO_FIELDS_MEMORY_CACHE)
+        self.assertEqual(
+            stats["disk_hits"] + 1, format.jumbo_fields_cache_stats()["disk_hits"]
+        )
+
+
+class TestPrefetchJumboFields(unittest.TestCase):
+    def setUp(self):
+        format.JUMBO_FIELDS_MEMORY_CACHE.clear()
+
+    def push_fields(self, nb_fields):
+        self.conn = boto.connect_s3()
+        self.conn.create_bucket("jumbo-bucket")
+        signatures = []
+        for i in range(nb_fields):
+            path = "prefetch/{}".format(i)
+            push_content("jumbo-bucket", path, json.dumps(i))
+            signatures.append("simpleflow+s3://jumbo-bucket/{} 1".format(path))
+        return signatures
+
+    @mock_s3
+    def test_prefetch(self):
+        signatures = self.push_fields(10)
+        self.assertEqual(10, format.prefetch_jumbo_fields(signatures + signatures))
+        with mock.patch("simpleflow.storage.pull_content") as pull_content:
+            self.assertEqual(
+                list(range(10)), [format.decode(s) for s in signatures],
+            )
+            self.assertEqual(0, format.prefetch_jumbo_fields(signatures))
+        self.assertEqual(0, pull_content.call_count)
+
+    @mock_s3
+    def test_prefetch_disabled(self):
+        signatures = self.push_fields(2)
+        self.assertEqual(0, format.prefetch_jumbo_fields(signatures, concurrency=0))
+        self.assertEqual(0, len(format.JUMBO_FIELDS_MEMORY_CACHE))
+
+    @mock_s3
+    def test_prefetch_errors_are_raised_on_decode(self):
+        signatures = self.push_fields(1)
+        missing = "simpleflow+s3://jumbo-bucket/prefetch/missing 1"
+        self.assertEqual(1, format.prefetch_jumbo_fields(signatures + [missing]))
+        with self.assertRaises(Exception):
+            format.decode(missing, use_proxy=False)
+
+    def test_prefetch_time_budget(self):
+        def pull_content(bucket, path):
+            time.sleep(0.5 if path == "slow" else 0)
+            return "1"
+
+        signatures = [
+            "simpleflow+s3://jumbo-bucket/fast 1",
+            "simpleflow+s3://jumbo-bucket/slow 1",
+        ]
+        with mock.patch("simpleflow.storage.get_bucket"), mock.patch(
+            "simpleflow.storage.pull_content", pull_content
+        ):
+            start = time.time()
+            nb_pulled = format.prefetch_jumbo_fields(signatures, timeout=0.2)
+            elapsed = time.time() - start
+        self.assertEqual(1, nb_pulled)
+        self.assertIn("fast", format.JUMBO_FIELDS_MEMORY_CACHE)
+        self.assertLess(elapsed, 0.45)
+
+    def test_prefetch_benchmark(self):
+        """
+        100 jumbo fields with a 20ms latency each.
+        """
+
+        def pull_content(bucket, path):
+            time.sleep(0.02)
+            return "1"
+
+        signatures = ["simpleflow+s3://jumbo-bucket/{} 1".format(i) for i in range(100)]
+        with mock.patch("simpleflow.storage.get_bucket"), mock.patch(
+            "simpleflow.storage.pull_content", pull_content
+        ):
+            start = time.time()
+            for signature in signatures:
+                format.decode(signature, use_proxy=False)
+            sequential = time.time() - start
+
+            format.JUMBO_FIELDS_MEMORY_CACHE.clear()
+            start = time.time()
+            format.prefetch_jumbo_fields(signatures, concurrency=16)
+            for signature in signatures:
+                format.decode(signature, use_proxy=False)
+            prefetched = time.time() - start
+        print(
+            "100 jumbo fields: {:.2f}s sequential, {:.2f}s with prefetch".format(
+                sequential, prefetched
+            )
+        )
+        self.assertLess(prefetched, sequential / 2)
+
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+@mock_s3
+class TestContentAddressedJumboFields(unittest.TestCase):
+    if PY2:
+        assertRaisesRegex = unittest.TestCase.assertRaisesRegexp
+        assertRegex = unittest.TestCase.assertRegexpMatches
+
+    def setUp(self):
+        format.JUMBO_FIELDS_MEMORY_CACHE.clear()
+        self.conn = boto.connect_s3()
+        self.bucket = self.conn.create_bucket("jumbo-bucket")
+
+    def encode(self, message, codec):
+        with mock.patch.dict(
+            "os.environ",
+            {
+                "SIMPLEFLOW_JUMBO_FIELDS_BUCKET": "jumbo-bucket/dir",
+                "SIMPLEFLOW_JUMBO_FIELDS_CODEC": codec,
+            },
+        ):
+            return format.result(message)
+
+    def assert_round_trip(self, codec, suffix):
+        message = {"values": list(range(10000))}
+        signature = self.encode(message, codec)
+        location, size = signature.split()
+        self.assertRegex(
+            location, r"^simpleflow\+s3://jumbo-bucket/dir/[0-9a-f]{32}" + suffix + "$"
+        )
+        self.assertEqual(int(size), self.bucket.get_key(location.split("/", 3)[3]).size)
+
+        format.JUMBO_FIELDS_MEMORY_CACHE.clear()
+        self.assertEqual(message, format.decode(signature, use_proxy=False))
+        return int(size)
+
+    def test_codecs(self):
+        uncompressed = self.assert_round_trip("none", "")
+        self.assertLess(self.assert_round_trip("gzip", r"\.gz"), uncompressed / 2)
+        self.assertLess(self.assert_round_trip("zlib", r"\.zz"), uncompressed / 2)
+
+    @unittest.skipIf(zstandard is None, "zstandard isn't installed")
+    def test_zstd(self):
+        self.assert_round_trip("zstd", r"\.zst")
+
+    def test_unknown_codec(self):
+        with self.assertRaisesRegex(ValueError, "unknown jumbo fields codec"):
+            self.encode("A" * 64000, "lzma")
+
+    def test_identical_fields_are_pushed_once(self):
+        message = "A" * 64000
+        with mock.patch("simpleflow.storage.push_content", wraps=push_content) as push:
+            signature = self.encode(message, "gzip")
+            self.assertEqual(signature, self.encode(message, "gzip"))
+            # Not cached anymore, but already stored
+            format.JUMBO_FIELDS_MEMORY_CACHE.clear()
+            self.assertEqual(signature, self.encode(message, "gzip"))
+        self.assertEqual(1, push.call_count)
+
+    def test_cached_field_missing_from_the_bucket_is_pushed(self):
+        message = "B" * 64000
+        signature = self.encode(message, "gzip")
+        path = signature.split()[0].split("/", 3)[3]
+        # e.g. expired by a lifecycle rule, or pushed to another bucket
+        self.bucket.delete_key(path)
+        self.assertIsNotNone(format.JUMBO_FIELDS_MEMORY_CACHE.get(path))
+
+        self.assertEqual(signature, self.encode(message, "gzip"))
+        self.assertIsNotNone(self.bucket.get_key(path))
+
+    def test_max_size_applies_to_compressed_fields(self):
+        message = "A" * (constants.JUMBO_FIELDS_MAX_SIZE + 1)
+        signature = self.encode(message, "gzip")
+        format.JUMBO_FIELDS_MEMORY_CACHE.clear()
+        self.assertEqual(message, format.decode(signature, use_proxy=False))
+
+        message = binascii.hexlify(os.urandom(20000)).decode("ascii")
+        with mock.patch.object(constants, "JUMBO_FIELDS_MAX_SIZE", 10000):
+            with self.assertRaisesRegex(ValueError, "even for a jumbo field"):
+                self.encode(message, "gzip")
+
+    def test_push_file(self):
+        content = json.dumps("A" * 64000).encode("utf-8")
+        with tempfile.TemporaryFile() as f:
+            f.write(content)
+            f.seek(0)
+            with mock.patch.dict(
+                "os.environ",
+                {
+                    "SIMPLEFLOW_JUMBO_FIELDS_BUCKET": "jumbo-bucket",
+                    "SIMPLEFLOW_JUMBO_FIELDS_CODEC": "zlib",
+                },
+            ):
+                signature = format.push_jumbo_field_file(f, len(content))
+
+        self.assertEqual(
+            signature, self.encode("A" * 64000, "zlib").replace("/dir", "")
+        )
+        self.assertEqual("A" * 64000, format.decode(signature, use_proxy=False))
+
+
+class TestFileSystemJumboFields(unittest.TestCase):
+    def setUp(self):
+        format.JUMBO_FIELDS_MEMORY_CACHE.clear()
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_round_trip(self):
+        message = {"values": list(range(10000))}
+        with mock.patch.dict(
+            "os.environ", {"SIMPLEFLOW_JUMBO_FIELDS_BUCKET": "file://" + self.root},
+        ):
+            signature = format.result(message)
+        location, size = signature.split()
+        self.assertTrue(location.startswith("simpleflow+file://" + self.root + "/"))
+        self.assertEqual(
+            int(size), os.path.getsize(location[len("simpleflow+file://") :])
+        )
+
+        format.JUMBO_FIELDS_MEMORY_CACHE.clear()
+        self.assertEqual(message, format.decode(signature, use_proxy=False))
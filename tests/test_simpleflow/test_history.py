@@ -0,0 +1,203 @@
+import unittest
+
+import mock
+
+import swf.models
+from simpleflow import format
+from simpleflow.history import History
+from simpleflow.utils import json_dumps
+from swf.models.history import builder
+from tests.data import BaseTestWorkflow, increment
+
+
+class TestHistoryIncrementalParsing(unittest.TestCase):
+    def build_history(self):
+        history = builder.History(BaseTestWorkflow, input={})
+        history.add_decision_task_completed()
+        history.add_activity_task(
+            increment,
+            decision_id=history.last_id,
+            last_state="started",
+            activity_id="activity-tests.data.activities.increment-1",
+            input={"args": [1]},
+        )
+        return history
+
+    def test_parse_only_new_events(self):
+        swf_history = self.build_history()
+        history = History(swf_history)
+        history.parse()
+        activity_id = "activity-tests.data.activities.increment-1"
+        self.assertEqual("started", history.activities[activity_id]["state"])
+
+        # Same execution, a few events later
+        swf_history.add_activity_task_completed(
+            scheduled=swf_history.last_id - 1, started=swf_history.last_id, result=2,
+        )
+        swf_history.add_decision_task()
+        new_swf_history = swf.models.History(events=list(swf_history.events))
+        self.assertTrue(history.update(new_swf_history))
+        history.parse()
+
+        full_history = History(new_swf_history)
+        full_history.parse()
+        self.assertEqual(full_history.activities, history.activities)
+        self.assertEqual(full_history.tasks, history.tasks)
+        self.assertEqual(
+            full_history.completed_decision_id, history.completed_decision_id
+        )
+        self.assertEqual(1, len(history.tasks))
+
+    def test_parse_twice_is_idempotent(self):
+        history = History(self.build_history())
+        history.parse()
+        history.parse()
+        self.assertEqual(1, len(history.tasks))
+
+    def test_update_rejects_other_history(self):
+        history = History(self.build_history())
+        history.parse()
+
+        other_history = self.build_history()  # new timestamps
+        self.assertFalse(history.update(other_history))
+        self.assertFalse(history.update(swf.models.History(events=[])))
+        self.assertTrue(history.update(history.swf_history))
+
+
+class TestHistoryIndexes(unittest.TestCase):
+    def signal(self, history, name, workflow_id, run_id):
+        history.add_signal_external_workflow_initiated(name, workflow_id)
+        history.add_external_workflow_signaled(history.last_id, workflow_id, run_id)
+
+    def test_find_signaled_workflow(self):
+        swf_history = builder.History(BaseTestWorkflow, input={})
+        self.signal(swf_history, "a_signal", "wf-1", "run-1")
+        self.signal(swf_history, "a_signal", "wf-1", "run-2")
+        self.signal(swf_history, "other_signal", "wf-2", "run-3")
+        history = History(swf_history)
+        history.parse()
+
+        found = history.find_signaled_workflow("a_signal", "wf-1", "run-2")
+        self.assertEqual("run-2", found["run_id"])
+        self.assertIsNone(history.find_signaled_workflow("a_signal", "wf-1", None))
+        self.assertIsNone(history.find_signaled_workflow("a_signal", "wf-1", "run-3"))
+        found = history.find_signaled_workflow("a_signal", "wf-1", None, any_run=True)
+        self.assertEqual("run-1", found["run_id"])
+        self.assertIsNone(
+            history.find_signaled_workflow("a_signal", "wf-2", None, any_run=True)
+        )
+        self.assertIsNone(
+            history.find_signaled_workflow("other_signal", "wf-1", None, any_run=True)
+        )
+
+    def test_find_recorded_marker(self):
+        swf_history = builder.History(BaseTestWorkflow, input={})
+        swf_history.add_marker("a_marker", {"foo": 1})
+        swf_history.add_marker("a_marker", {"foo": 2})
+        second_id = swf_history.last_id
+        swf_history.add_marker("a_marker", {"foo": 1})
+        third_id = swf_history.last_id
+        history = History(swf_history)
+        history.parse()
+
+        found = history.find_recorded_marker("a_marker", json_dumps({"foo": 1}))
+        self.assertEqual(third_id, found["event_id"])
+        found = history.find_recorded_marker("a_marker", json_dumps({"foo": 2}))
+        self.assertEqual(second_id, found["event_id"])
+        self.assertIsNone(history.find_recorded_marker("a_marker", None))
+        self.assertIsNone(history.find_recorded_marker("other", json_dumps({"foo": 1})))
+
+
+class TestLazyPayloads(unittest.TestCase):
+    def build_history(self, nb_activities, input_size):
+        history = builder.History(BaseTestWorkflow, input={})
+        history.add_decision_task_completed()
+        decision_id = history.last_id
+        for i in range(nb_activities):
+            history.add_activity_task(
+                increment,
+                decision_id=decision_id,
+                last_state="completed",
+                activity_id="activity-tests.data.activities.increment-{}".format(i + 1),
+                input={"args": ["x" * input_size]},
+                result=i + 1,
+            )
+        return history
+
+    def test_payloads_are_decoded_on_access(self):
+        history = History(self.build_history(3, 10))
+        with mock.patch("simpleflow.format.decode", wraps=format.decode) as decode:
+            history.parse()
+            self.assertEqual(0, decode.call_count)
+
+            activity = history.activities["activity-tests.data.activities.increment-2"]
+            self.assertEqual({"args": ["x" * 10]}, activity["input"])
+            self.assertEqual(1, decode.call_count)
+
+    def test_inputs_are_decoded_once(self):
+        swf_history = self.build_history(300, 10 * 1024)
+        history = History(swf_history)
+        with mock.patch("simpleflow.format.decode", wraps=format.decode) as decode:
+            history.parse()
+            self.assertEqual(0, decode.call_count)
+
+            for _ in range(2):
+                for activity in history.activities.values():
+                    self.assertEqual(10 * 1024, len(activity["input"]["args"][0]))
+            # Memoized by the events
+            self.assertEqual(300, decode.call_count)
+
+
+class TestJumboFields(unittest.TestCase):
+    def test_jumbo_fields_are_collected(self):
+        swf_history = builder.History(BaseTestWorkflow, input={})
+        swf_history.add_decision_task_completed()
+        swf_history.add_activity_task(
+            increment,
+            decision_id=swf_history.last_id,
+            last_state="completed",
+            activity_id="activity-tests.data.activities.increment-1",
+            input={"args": [1]},
+            result=2,
+        )
+        input_signature = "simpleflow+s3://jumbo-bucket/input 10"
+        result_signature = "simpleflow+s3://jumbo-bucket/result 20"
+        swf_history.events[-3].attributes["input"] = input_signature
+        swf_history.events[-1].attributes["result"] = result_signature
+
+        history = History(swf_history)
+        history.parse()
+        # Inputs are only decoded when used
+        self.assertEqual([result_signature], history.jumbo_fields)
+
+    def test_only_new_jumbo_fields_are_listed_after_an_update(self):
+        swf_history = builder.History(BaseTestWorkflow, input={})
+        swf_history.add_decision_task_completed()
+
+        def add_completed_activity(i):
+            swf_history.add_activity_task(
+                increment,
+                decision_id=swf_history.last_id,
+                last_state="completed",
+                activity_id="activity-tests.data.activities.increment-{}".format(i),
+                input={"args": [i]},
+                result=i + 1,
+            )
+            signature = "simpleflow+s3://jumbo-bucket/result-{} 20".format(i)
+            swf_history.events[-1].attributes["result"] = signature
+            return swf.models.History(events=list(swf_history.events)), signature
+
+        first_swf_history, first_signature = add_completed_activity(0)
+        history = History(first_swf_history)
+        history.parse()
+        self.assertEqual([first_signature], history.new_jumbo_fields)
+
+        # Same execution, kept between decisions
+        second_swf_history, second_signature = add_completed_activity(1)
+        self.assertTrue(history.update(second_swf_history))
+        history.parse()
+        self.assertEqual([second_signature], history.new_jumbo_fields)
+        self.assertEqual(2, len(history.jumbo_fields))
+        # Nothing new
+        history.parse()
+        self.assertEqual([], history.new_jumbo_fields)
@@ -1,8 +1,12 @@
+import io
 import os
+import shutil
 import tempfile
+import threading
 import unittest
 
 import boto
+from boto.s3.key import Key
 from mock import patch
 
 from simpleflow import storage
@@ -113,3 +117,221 @@ class TestGroup(unittest.TestCase):
             storage.sanitize_bucket_and_host(
                 "s3-eu-west-1.amazonaws.com/mybucket/subpath"
             )
+
+
+class TestFileSystemBackend(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.bucket = "file://" + self.root
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_push_and_pull_content(self):
+        storage.push_content(self.bucket, "dir/mykey.txt", "Hey Jude")
+        self.assertTrue(storage.exists(self.bucket, "dir/mykey.txt"))
+        self.assertFalse(storage.exists(self.bucket, "dir/other.txt"))
+        self.assertEqual(storage.pull_content(self.bucket, "dir/mykey.txt"), "Hey Jude")
+        self.assertEqual(
+            storage.pull_content(self.bucket, "dir/mykey.txt", None), b"Hey Jude"
+        )
+
+    def test_pull_empty_file(self):
+        storage.push_content(self.bucket, "empty", "")
+        self.assertEqual(storage.pull_content(self.bucket, "empty"), "")
+
+    def test_push_and_pull_file(self):
+        src = os.path.join(self.root, "src")
+        with open(src, "w") as f:
+            f.write("42")
+        storage.push(self.bucket, "mykey.txt", src)
+        dest = os.path.join(self.root, "dest")
+        storage.pull(self.bucket, "mykey.txt", dest)
+        with open(dest) as f:
+            self.assertEqual(f.read(), "42")
+
+    @patch("simpleflow.storage.CHUNK_SIZE", 4)
+    def test_pull_large_file_is_streamed(self):
+        content = os.urandom(10)
+        storage.push_content(self.bucket, "large.bin", content)
+        dest = os.path.join(self.root, "dest")
+        with patch("simpleflow.storage.read_file") as read_file:
+            storage.pull(self.bucket, "large.bin", dest)
+        self.assertFalse(read_file.called)
+        with open(dest, "rb") as f:
+            self.assertEqual(f.read(), content)
+
+    def test_push_stream(self):
+        storage.push_stream(self.bucket, "mykey.bin", io.BytesIO(b"\x00\x01"))
+        self.assertEqual(
+            storage.pull_content(self.bucket, "mykey.bin", None), b"\x00\x01"
+        )
+
+    def test_failed_write_keeps_previous_content(self):
+        storage.push_content(self.bucket, "mykey.txt", "old")
+
+        class BrokenStream(object):
+            def read(self, size=-1):
+                raise IOError("broken")
+
+        with self.assertRaises(IOError):
+            storage.push_stream(self.bucket, "mykey.txt", BrokenStream())
+        self.assertEqual(storage.pull_content(self.bucket, "mykey.txt"), "old")
+        self.assertEqual(os.listdir(self.root), ["mykey.txt"])
+
+    def test_list(self):
+        for path in ("a/1", "a/2", "ab/3", "b/4"):
+            storage.push_content(self.bucket, path, path)
+        keys = storage.list_keys(self.bucket, "a")
+        self.assertEqual([k.key for k in keys], ["a/1", "a/2", "ab/3"])
+        self.assertEqual(keys[0].name, "a/1")
+        self.assertEqual(keys[0].get_contents_as_string(encoding="utf-8"), "a/1")
+        keys = storage.list_keys(self.bucket, "a/")
+        self.assertEqual([k.key for k in keys], ["a/1", "a/2"])
+        self.assertEqual(len(storage.list_keys(self.bucket)), 4)
+
+
+class TestBackendSelection(unittest.TestCase):
+    def test_get_backend(self):
+        backend, bucket = storage.get_backend("mybucket")
+        self.assertIsInstance(backend, storage.S3Backend)
+        self.assertEqual(bucket, "mybucket")
+        backend, bucket = storage.get_backend("s3://mybucket")
+        self.assertIsInstance(backend, storage.S3Backend)
+        self.assertEqual(bucket, "mybucket")
+        backend, bucket = storage.get_backend("file:///tmp/root")
+        self.assertIsInstance(backend, storage.FileSystemBackend)
+        self.assertEqual(bucket, "/tmp/root")
+        with self.assertRaises(ValueError):
+            storage.get_backend("ftp://mybucket")
+
+    def test_urls(self):
+        self.assertEqual(
+            storage.split_url("s3://mybucket/path/to/key"), ("mybucket", "path/to/key")
+        )
+        self.assertEqual(
+            storage.split_url("file:///path/to/file"), ("file:///", "path/to/file")
+        )
+        self.assertEqual(
+            storage.get_url("mybucket", "path/to/key"), "s3://mybucket/path/to/key"
+        )
+        self.assertEqual(
+            storage.get_url("file:///", "path/to/file"), "file:///path/to/file"
+        )
+        with self.assertRaises(ValueError):
+            storage.split_url("mybucket/path")
+
+
+@mock_s3
+class TestS3Transfers(unittest.TestCase):
+    # Smallest part size allowed by S3
+    part_size = 5 * 1024 ** 2
+
+    def setUp(self):
+        self.bucket = "bucket"
+        boto.connect_s3().create_bucket(self.bucket)
+        self.root = tempfile.mkdtemp()
+        # Two full parts and a partial one
+        self.content = os.urandom(1024) * (2 * self.part_size // 1024 + 3)
+        patcher = patch.multiple(
+            "simpleflow.settings",
+            SIMPLEFLOW_S3_PART_SIZE=self.part_size,
+            SIMPLEFLOW_S3_CONCURRENCY=4,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def get_key(self, path):
+        return boto.connect_s3().get_bucket(self.bucket).get_key(path)
+
+    def test_connections_are_reused(self):
+        self.assertIs(
+            storage.get_connection("us-east-1"), storage.get_connection("us-east-1")
+        )
+
+    def test_threads_dont_share_connections(self):
+        connections = []
+
+        def connect():
+            connections.append(storage.get_bucket(self.bucket).connection)
+
+        threads = [threading.Thread(target=connect) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        connections.append(storage.get_bucket(self.bucket).connection)
+        self.assertEqual(3, len(set(map(id, connections))))
+
+    def test_multipart_push_and_ranged_pull(self):
+        src = os.path.join(self.root, "src.bin")
+        with open(src, "wb") as f:
+            f.write(self.content)
+        with patch(
+            "boto.s3.key.Key.get_contents_to_file",
+            autospec=True,
+            side_effect=Key.get_contents_to_file,
+        ) as get:
+            storage.push(self.bucket, "big.bin", src)
+            dest = os.path.join(self.root, "dest.bin")
+            storage.pull(self.bucket, "big.bin", dest)
+        self.assertEqual(3, get.call_count)
+        # ETag of multipart uploads: "<md5 of md5s>-<number of parts>"
+        self.assertTrue(self.get_key("big.bin").etag.endswith('-3"'))
+        with open(dest, "rb") as f:
+            self.assertEqual(self.content, f.read())
+
+    def test_open_write_and_read(self):
+        with storage.open_write(self.bucket, "big.bin") as f:
+            for i in range(0, len(self.content), 100000):
+                f.write(self.content[i : i + 100000])
+        self.assertTrue(self.get_key("big.bin").etag.endswith('-3"'))
+        with storage.open_read(self.bucket, "big.bin") as f:
+            self.assertEqual(self.content[:10], f.read(10))
+            self.assertEqual(self.content[10:], f.read())
+            self.assertEqual(b"", f.read())
+
+    def test_open_write_small_object(self):
+        with storage.open_write(self.bucket, "small.json", "application/json") as f:
+            f.write(b"{}")
+        key = self.get_key("small.json")
+        self.assertEqual("application/json", key.content_type)
+        self.assertEqual(storage.pull_content(self.bucket, "small.json"), "{}")
+
+    def test_open_write_aborts_on_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            with storage.open_write(self.bucket, "aborted.bin") as f:
+                f.write(self.content)
+                1 / 0
+        self.assertIsNone(self.get_key("aborted.bin"))
+        self.assertEqual(
+            [], list(boto.connect_s3().get_bucket(self.bucket).list_multipart_uploads())
+        )
+
+
+class TestFileSystemStreams(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.bucket = "file://" + self.root
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_open_write_and_read(self):
+        with storage.open_write(self.bucket, "dir/mykey.txt") as f:
+            f.write(b"Hey ")
+            # Not visible until closed
+            self.assertFalse(storage.exists(self.bucket, "dir/mykey.txt"))
+            f.write(b"Jude")
+        with storage.open_read(self.bucket, "dir/mykey.txt") as f:
+            self.assertEqual(b"Hey Jude", f.read())
+
+    def test_open_write_aborts_on_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            with storage.open_write(self.bucket, "mykey.txt") as f:
+                f.write(b"Hey")
+                1 / 0
+        self.assertEqual([], os.listdir(self.root))
@@ -2,7 +2,7 @@ import unittest
 
 from sure import expect
 
-from simpleflow.utils import format_exc, to_k8s_identifier
+from simpleflow.utils import DispatchTable, format_exc, to_k8s_identifier
 
 
 class MyTestCase(unittest.TestCase):
@@ -26,3 +26,28 @@ class MyTestCase(unittest.TestCase):
 
 if __name__ == "__main__":
     unittest.main()
+
+
+class TestDispatchTable(unittest.TestCase):
+    def test_dispatch(self):
+        class Base(object):
+            pass
+
+        class Child(Base):
+            pass
+
+        class GrandChild(Child):
+            pass
+
+        table = DispatchTable({Base: "base", "a_key": "a_value"})
+        self.assertEqual("base", table.dispatch(GrandChild))
+        self.assertEqual("a_value", table.dispatch("a_key"))
+        self.assertIsNone(table.dispatch(int))
+        self.assertIsNone(table.dispatch("other_key"))
+
+        table[Child] = "child"
+        self.assertEqual("child", table.dispatch(GrandChild))
+        del table[Child]
+        self.assertEqual("base", table.dispatch(GrandChild))
+        table.update({GrandChild: "grandchild"})
+        self.assertEqual("grandchild", table.dispatch(GrandChild))
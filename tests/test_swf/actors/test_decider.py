@@ -1,9 +1,11 @@
+import json
 import unittest
 
 import boto
+from mock import patch
 
 from swf.actors import Decider
-from swf.exceptions import PollTimeout
+from swf.exceptions import PollTimeout, ResponseError
 from swf.models import Domain
 from tests.moto_compat import mock_swf
 
@@ -50,3 +52,114 @@ class TestActor(unittest.TestCase):
         )
         self.assertEqual(response.execution.workflow_id, "wfe-1234")
         self.assertIsNotNone(response.execution.run_id)
+
+
+def make_page(first_event_id, count, next_page_token=None):
+    page = {
+        "taskToken": "a-token",
+        "startedEventId": first_event_id + count - 1,
+        "workflowType": {"name": "test-workflow", "version": "v1.2"},
+        "workflowExecution": {"workflowId": "wfe-1234", "runId": "run-1234"},
+        "events": [
+            {
+                "eventId": event_id,
+                "eventType": "DecisionTaskScheduled",
+                "eventTimestamp": 1500000000,
+                "decisionTaskScheduledEventAttributes": {},
+            }
+            for event_id in range(first_event_id, first_event_id + count)
+        ],
+    }
+    if next_page_token:
+        page["nextPageToken"] = next_page_token
+    return page
+
+
+class TestPaginatedPoll(unittest.TestCase):
+    def setUp(self):
+        self.domain = Domain("TestDomain")
+        self.actor = Decider(self.domain, "test-task-list")
+
+    def test_next_pages_are_fetched_on_demand(self):
+        pages = [make_page(1, 3, "page-2"), make_page(4, 3, "page-3"), make_page(7, 2)]
+        with patch.object(
+            self.actor.connection, "poll_for_decision_task", side_effect=pages
+        ) as poll:
+            response = self.actor.poll()
+            self.assertEqual(poll.call_count, 1)
+            self.assertEqual(response.execution.workflow_id, "wfe-1234")
+
+            self.assertEqual(response.history[2].id, 3)
+            self.assertEqual(poll.call_count, 1)
+
+            self.assertEqual(response.history[3].id, 4)
+            self.assertEqual(poll.call_count, 2)
+            self.assertEqual(poll.call_args[1]["next_page_token"], "page-2")
+
+            self.assertEqual([e.id for e in response.history], list(range(1, 9)))
+            self.assertEqual(poll.call_count, 3)
+
+    def test_next_page_error(self):
+        error = boto.exception.SWFResponseError(
+            400,
+            "Bad Request",
+            {
+                "__type": "com.amazonaws.swf.base.model#OperationNotPermittedFault",
+                "message": "Not permitted",
+            },
+        )
+        with patch.object(
+            self.actor.connection,
+            "poll_for_decision_task",
+            side_effect=[make_page(1, 3, "page-2"), error],
+        ):
+            response = self.actor.poll()
+            with self.assertRaises(ResponseError):
+                list(response.history)
+
+
+class TestComplete(unittest.TestCase):
+    def setUp(self):
+        self.domain = Domain("TestDomain")
+        self.actor = Decider(self.domain, "test-task-list")
+
+    def test_complete_with_encoded_decisions(self):
+        decisions = [
+            {
+                "decisionType": "RecordMarker",
+                "recordMarkerDecisionAttributes": {"markerName": "a_marker"},
+            }
+        ]
+        with patch.object(self.actor.connection, "make_request") as make_request:
+            self.actor.complete(
+                "a-token",
+                decisions,
+                execution_context={"foo": "bar"},
+                encoded_decisions=[json.dumps(d) for d in decisions],
+            )
+        action, body = make_request.call_args[0]
+        self.assertEqual("RespondDecisionTaskCompleted", action)
+        self.assertEqual(
+            {
+                "taskToken": "a-token",
+                "decisions": decisions,
+                "executionContext": '{"foo":"bar"}',
+            },
+            json.loads(body),
+        )
+
+    def test_empty_execution_context_is_sent(self):
+        with patch.object(self.actor.connection, "make_request") as make_request:
+            self.actor.complete(
+                "a-token", [], execution_context="", encoded_decisions=[],
+            )
+        _, body = make_request.call_args[0]
+        self.assertEqual(
+            {"taskToken": "a-token", "decisions": [], "executionContext": ""},
+            json.loads(body),
+        )
+
+        with patch.object(self.actor.connection, "make_request") as make_request:
+            self.actor.complete("a-token", [], encoded_decisions=[])
+        _, body = make_request.call_args[0]
+        self.assertEqual({"taskToken": "a-token", "decisions": []}, json.loads(body))
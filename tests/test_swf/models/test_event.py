@@ -1,16 +1,26 @@
 # -*- coding:utf-8 -*-
 
+import json
+import pickle
 import unittest
 from datetime import datetime
 
+import mock
 import pytz
 
 import swf.constants
-from swf.models.event import Event
-from swf.models.history import History
+from simpleflow import format
+from swf.models.event import Event, EventFactory
+from swf.models.history import History, LazyPagedHistory
+from swf.utils import camel_to_underscore
 
 from ..mocks.event import mock_get_workflow_execution_history
 
+try:
+    import tracemalloc
+except ImportError:  # python 2
+    tracemalloc = None
+
 
 class TestEvent(unittest.TestCase):
     def setUp(self):
@@ -34,6 +44,115 @@ class TestEvent(unittest.TestCase):
         self.assertEqual(datetime(1970, 1, 1, 0, 0, tzinfo=pytz.UTC), ev.timestamp)
 
 
+def make_raw_event(event_id, input_size=100):
+    return {
+        "eventId": event_id,
+        "eventType": "ActivityTaskScheduled",
+        "eventTimestamp": 1500000000.0 + event_id,
+        "activityTaskScheduledEventAttributes": {
+            "activityId": "activity-{}".format(event_id),
+            "activityType": {"name": "a_task", "version": "1.0"},
+            "decisionTaskCompletedEventId": event_id - 1,
+            "input": '{"args": ["%s"], "kwargs": {}}' % ("x" * input_size),
+            "control": '{"index": %d}' % event_id,
+            "taskList": {"name": "a_task_list"},
+            "scheduleToCloseTimeout": "300",
+        },
+    }
+
+
+class EagerEvent(object):
+    """The former representation: every attribute set on a __dict__ and
+    the payloads decoded when the event is built."""
+
+    def __init__(self, raw_event):
+        self.raw = raw_event
+        self._id = raw_event["eventId"]
+        self._state = "scheduled"
+        self._timestamp = raw_event["eventTimestamp"]
+        self._input = {}
+        self._control = None
+        for key, value in raw_event["activityTaskScheduledEventAttributes"].items():
+            if key in ("input", "control"):
+                value = json.loads(value)
+            setattr(self, camel_to_underscore(key), value)
+
+
+class TestCompactEvent(unittest.TestCase):
+    def test_no_instance_dict(self):
+        event = EventFactory(make_raw_event(2))
+        self.assertFalse(hasattr(event, "__dict__"))
+
+    def test_factory_does_not_mutate_classes(self):
+        scheduled = EventFactory(make_raw_event(2))
+        raw_event = make_raw_event(3)
+        raw_event["eventType"] = "ActivityTaskStarted"
+        raw_event["activityTaskStartedEventAttributes"] = {"scheduledEventId": 2}
+        started = EventFactory(raw_event)
+
+        self.assertIs(type(scheduled), type(started))
+        self.assertEqual(scheduled.name, "ActivityTaskScheduled")
+        self.assertEqual(scheduled.state, "scheduled")
+        self.assertEqual(started.name, "ActivityTaskStarted")
+        self.assertEqual(started.scheduled_event_id, 2)
+
+    def test_interned_strings(self):
+        first, second = EventFactory(make_raw_event(2)), EventFactory(make_raw_event(3))
+        self.assertIs(first.state, second.state)
+        self.assertIs(first.name, second.name)
+
+    def test_attributes(self):
+        event = EventFactory(make_raw_event(2))
+        self.assertEqual(event.activity_id, "activity-2")
+        self.assertEqual(event.activity_type, {"name": "a_task", "version": "1.0"})
+        self.assertEqual(event.decision_task_completed_event_id, 1)
+        self.assertEqual(event.timestamp, datetime.fromtimestamp(1500000002, pytz.UTC))
+        self.assertIsNone(getattr(event, "result", None))
+        with self.assertRaises(AttributeError):
+            event.activityId
+
+    def test_payloads_are_decoded_once_on_access(self):
+        event = EventFactory(make_raw_event(2))
+        with mock.patch("simpleflow.format.decode", wraps=format.decode) as decode:
+            self.assertEqual(decode.call_count, 0)
+            self.assertEqual(event.control, {"index": 2})
+            self.assertEqual(event.control, {"index": 2})
+            self.assertEqual(decode.call_count, 1)
+
+    def test_default_payloads(self):
+        raw_event = make_raw_event(2)
+        del raw_event["activityTaskScheduledEventAttributes"]["input"]
+        del raw_event["activityTaskScheduledEventAttributes"]["control"]
+        event = EventFactory(raw_event)
+        self.assertEqual(event.input, {})
+        self.assertIsNone(event.control)
+
+    def test_pickle(self):
+        event = EventFactory(make_raw_event(2))
+        copy = pickle.loads(pickle.dumps(event, 2))
+        self.assertEqual(copy.id, event.id)
+        self.assertEqual(copy.name, event.name)
+        self.assertEqual(copy.input, event.input)
+
+    @unittest.skipIf(tracemalloc is None, "tracemalloc isn't available")
+    def test_compact_events_use_less_memory(self):
+        raw_events = [make_raw_event(i) for i in range(1, 1001)]
+
+        def allocated(build):
+            tracemalloc.start()
+            try:
+                events = [build(raw_event) for raw_event in raw_events]
+                size, _ = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            del events
+            return size
+
+        eager = allocated(EagerEvent)
+        compact = allocated(EventFactory)
+        self.assertLess(compact * 4, eager)
+
+
 class TestHistory(unittest.TestCase):
     def setUp(self):
         self.event_list = mock_get_workflow_execution_history()
@@ -66,3 +185,47 @@ class TestHistory(unittest.TestCase):
     def test_get_by_invalid_index_type(self):
         with self.assertRaises(TypeError):
             dummy = self.history["invalid, bitch"]
+
+
+class TestLazyPagedHistory(unittest.TestCase):
+    def setUp(self):
+        events = mock_get_workflow_execution_history()["events"]
+        self.pages = [events[:1], [], events[1:]]
+        self.fetched = []
+
+    def iter_pages(self):
+        for page in self.pages:
+            self.fetched.append(page)
+            yield page
+
+    def test_from_event_pages(self):
+        history = History.from_event_pages(self.iter_pages())
+        self.assertIsInstance(history, LazyPagedHistory)
+
+    def test_pages_are_fetched_on_demand(self):
+        history = History.from_event_pages(self.iter_pages())
+        self.assertEqual(len(self.fetched), 0)
+
+        self.assertEqual(history[0].id, 1)
+        self.assertEqual(len(self.fetched), 1)
+
+        self.assertEqual(history[1].id, 2)
+        self.assertEqual(len(self.fetched), 3)
+
+    def test_iter_events(self):
+        history = History.from_event_pages(self.iter_pages())
+        events = history.iter_events()
+        self.assertEqual(next(events).id, 1)
+        self.assertEqual(len(self.fetched), 1)
+        self.assertEqual([event.id for event in events], [2])
+        self.assertEqual([event.id for event in history.iter_events(1)], [2])
+
+    def test_behaves_like_history(self):
+        history = History.from_event_pages(self.iter_pages())
+        expected = History.from_event_list(sum(self.pages, []))
+        self.assertEqual(len(history), len(expected))
+        self.assertEqual(len(self.fetched), 3)
+        self.assertEqual(history.raw, expected.raw)
+        self.assertEqual(history[-1].id, expected[-1].id)
+        with self.assertRaises(IndexError):
+            history[42]
@@ -5,8 +5,20 @@ import time
 import unittest
 from uuid import uuid4
 
+import boto.exception
+
+import swf.actors
 import swf.exceptions
-from simpleflow.swf.process.worker.heartbeat import Heartbeater, HeartbeatProcess
+import swf.models
+from simpleflow.swf.process.worker.heartbeat import (
+    CANCEL_REQUESTED,
+    DOES_NOT_EXIST,
+    Heartbeater,
+    HeartbeatMultiplexer,
+    HeartbeatProcess,
+    TokenBucket,
+    start_heartbeater,
+)
 
 
 class FakeHeartbeat(object):
@@ -183,3 +195,213 @@ class TestHeartbeater(unittest.TestCase):
         heartbeater.stop()
         heartbeater._heartbeater.join()
         self.assertTrue(toggler.value)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSWFConnection(object):
+    """
+    Records heartbeats; unknown tokens don't exist anymore.
+    """
+
+    def __init__(self, clock, tokens=(), cancelled=(), throttled=()):
+        self.clock = clock
+        self.tokens = set(tokens)
+        self.cancelled = set(cancelled)
+        self.throttled = set(throttled)
+        self.heartbeats = []
+
+    @staticmethod
+    def error(fault):
+        return boto.exception.SWFResponseError(
+            400,
+            "Bad Request",
+            {"__type": "com.amazonaws.swf.base.model#" + fault, "message": fault},
+        )
+
+    def record_activity_task_heartbeat(self, task_token, details=None):
+        self.heartbeats.append((self.clock(), task_token, details))
+        if task_token in self.throttled:
+            raise self.error("ThrottlingException")
+        if task_token not in self.tokens:
+            raise self.error("UnknownResourceFault")
+        return {"cancelRequested": task_token in self.cancelled}
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate_and_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+        self.assertEqual(
+            [True, True, True, False], [bucket.consume() for _ in range(4)]
+        )
+        self.assertEqual(0.5, bucket.delay())
+
+        clock.now += 0.5
+        self.assertTrue(bucket.consume())
+        self.assertFalse(bucket.consume())
+
+        clock.now += 100
+        self.assertEqual(3, sum(bucket.consume() for _ in range(10)))
+
+
+class TestHeartbeatMultiplexer(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.connection = FakeSWFConnection(self.clock)
+        self.actor = swf.actors.ActivityWorker(
+            swf.models.Domain("test-domain"), "task-list"
+        )
+        self.actor.connection = self.connection
+
+    def multiplexer(self, rate=100, burst=None, jitter=0.0):
+        return HeartbeatMultiplexer(
+            self.actor, rate=rate, burst=burst, jitter=jitter, clock=self.clock
+        )
+
+    def register(self, multiplexer, count, interval=10, **kwargs):
+        tokens = ["token-{}".format(i) for i in range(count)]
+        self.connection.tokens.update(tokens)
+        for token in tokens:
+            multiplexer.register(token, interval, **kwargs)
+        return tokens
+
+    def test_heartbeats_are_sent_every_interval(self):
+        multiplexer = self.multiplexer()
+        self.register(multiplexer, 2)
+
+        self.assertEqual(1.0, multiplexer.heartbeat_due_tasks())
+        self.assertEqual([], self.connection.heartbeats)
+
+        self.clock.now += 10
+        multiplexer.heartbeat_due_tasks()
+        self.assertEqual(2, len(self.connection.heartbeats))
+        multiplexer.heartbeat_due_tasks()
+        self.assertEqual(2, len(self.connection.heartbeats))
+
+        self.clock.now += 10
+        multiplexer.heartbeat_due_tasks()
+        self.assertEqual(4, len(self.connection.heartbeats))
+
+    def test_heartbeats_are_rate_limited(self):
+        multiplexer = self.multiplexer(rate=2, burst=4)
+        self.register(multiplexer, 10)
+
+        self.clock.now += 10
+        self.assertEqual(0.5, multiplexer.heartbeat_due_tasks())
+        self.assertEqual(4, len(self.connection.heartbeats))
+
+        self.clock.now += 0.5
+        multiplexer.heartbeat_due_tasks()
+        self.assertEqual(5, len(self.connection.heartbeats))
+
+        # No more than the burst at once
+        self.clock.now += 2.5
+        multiplexer.heartbeat_due_tasks()
+        self.assertEqual(9, len(self.connection.heartbeats))
+
+        self.clock.now += 0.5
+        multiplexer.heartbeat_due_tasks()
+        self.assertEqual(10, len(self.connection.heartbeats))
+        # Each task was heartbeated once
+        self.assertEqual(
+            10, len(set(token for _, token, _ in self.connection.heartbeats))
+        )
+
+    def test_heartbeats_are_jittered(self):
+        multiplexer = self.multiplexer(jitter=0.1)
+        self.register(multiplexer, 100)
+
+        next_heartbeats = [task.next_heartbeat for task in multiplexer._tasks.values()]
+        self.assertGreater(len(set(next_heartbeats)), 1)
+        for next_heartbeat in next_heartbeats:
+            self.assertTrue(self.clock.now + 9 <= next_heartbeat <= self.clock.now + 10)
+
+    def test_details_are_sent(self):
+        multiplexer = self.multiplexer()
+        (token,) = self.register(multiplexer, 1, details="10%")
+
+        self.clock.now += 10
+        multiplexer.heartbeat_due_tasks()
+        self.assertEqual([(self.clock.now, token, "10%")], self.connection.heartbeats)
+
+    def test_status_is_fanned_out_to_each_task(self):
+        multiplexer = self.multiplexer()
+        running, cancelled, gone = self.register(multiplexer, 3)
+        self.connection.cancelled.add(cancelled)
+        self.connection.tokens.remove(gone)
+
+        self.clock.now += 10
+        multiplexer.heartbeat_due_tasks()
+        self.assertIsNone(multiplexer.status(running))
+        self.assertEqual(CANCEL_REQUESTED, multiplexer.status(cancelled))
+        self.assertEqual(DOES_NOT_EXIST, multiplexer.status(gone))
+
+        # Cancelled or missing tasks aren't heartbeated anymore
+        self.clock.now += 10
+        multiplexer.heartbeat_due_tasks()
+        self.assertEqual(
+            [running], [token for _, token, _ in self.connection.heartbeats[3:]]
+        )
+
+        self.assertEqual(CANCEL_REQUESTED, multiplexer.unregister(cancelled))
+        self.assertIsNone(multiplexer.status(cancelled))
+
+    def test_throttled_heartbeats_are_retried(self):
+        multiplexer = self.multiplexer()
+        (token,) = self.register(multiplexer, 1)
+        self.connection.throttled.add(token)
+
+        self.clock.now += 10
+        multiplexer.heartbeat_due_tasks()
+        self.assertIsNone(multiplexer.status(token))
+
+        self.connection.throttled.remove(token)
+        self.clock.now += 1
+        multiplexer.heartbeat_due_tasks()
+        self.assertEqual(2, len(self.connection.heartbeats))
+
+
+class TestStartHeartbeater(unittest.TestCase):
+    def test_multiplexer_is_shared_through_a_manager(self):
+        manager, heartbeater = start_heartbeater("test-domain", "task-list", rate=10)
+        try:
+            heartbeater.register("token", 60)
+            self.assertIsNone(heartbeater.status("token"))
+            self.assertIsNone(heartbeater.unregister("token"))
+            self.assertNotEqual(os.getpid(), manager._process.pid)
+        finally:
+            manager.shutdown()
+
+    def test_manager_exits_with_its_parent(self):
+        reader, writer = mp.Pipe(duplex=False)
+        parent = mp.Process(target=start_and_exit, args=(writer,))
+        parent.start()
+        pid = reader.recv()
+        parent.join()
+
+        deadline = time.time() + 10
+        while time.time() < deadline and is_alive(pid):
+            time.sleep(0.1)
+        self.assertFalse(is_alive(pid))
+
+
+def start_and_exit(connection):
+    manager, _ = start_heartbeater("test-domain", "task-list", rate=10)
+    connection.send(manager._process.pid)
+    # Killed parent: no shutdown
+    os._exit(0)
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True